@@ -1,129 +1,300 @@
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
 import pandas as pd
 import networkx as nx
-from db import Database
+from customers import RFM_LEVELS, CustomerAnalytics
+from basket import MarketBasket
+from layout import LayoutCache
+
+
+def draw_top_clients(top_clients):
+    """Рисует топ клиентов по количеству заказов."""
+    if not top_clients:
+        return None
+
+    # Создаем DataFrame
+    df = pd.DataFrame(top_clients, columns=['ID', 'Имя', 'Количество заказов'])
+
+    # Создаем график
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.bar(df['Имя'], df['Количество заказов'])
+    ax.set_title('Топ клиентов по количеству заказов')
+    ax.set_ylabel('Количество заказов')
+    ax.tick_params(axis='x', rotation=45)
+
+    return fig
+
+
+def draw_orders_dynamics(dynamics):
+    """Рисует динамику количества и суммы заказов."""
+    if not dynamics:
+        return None
+
+    # Создаем DataFrame
+    df = pd.DataFrame(dynamics, columns=['Дата', 'Количество заказов', 'Общая сумма'])
+    # Даты как даты, а не строки: иначе каждая дата — отдельная категория с подписью,
+    # и за год отрисовка 365 подписей занимает десятки секунд
+    df['Дата'] = pd.to_datetime(df['Дата'])
+
+    # Создаем график
+    fig = Figure(figsize=(10, 8))
+    ax1, ax2 = fig.subplots(2, 1)
+
+    # График количества заказов
+    ax1.plot(df['Дата'], df['Количество заказов'], marker='o')
+    ax1.set_title('Динамика количества заказов')
+    ax1.set_ylabel('Количество заказов')
+    ax1.tick_params(axis='x', rotation=45)
+
+    # График общей суммы
+    ax2.plot(df['Дата'], df['Общая сумма'], marker='o', color='orange')
+    ax2.set_title('Динамика суммы заказов')
+    ax2.set_ylabel('Сумма заказов')
+    ax2.tick_params(axis='x', rotation=45)
+
+    fig.tight_layout()
+
+    return fig
+
+
+def client_graph(clients):
+    """Строит граф связей клиентов по списку ``(id, name, city)``."""
+    # Создаем граф
+    G = nx.Graph()
+
+    # Добавляем узлы (клиентов)
+    for client_id, name, city in clients:
+        G.add_node(client_id, label=name, city=city)
+
+    # Добавляем связи (общие заказы)
+    # В этом примере просто связываем клиентов из одного города
+    city_groups = {}
+    for client_id, name, city in clients:
+        if city not in city_groups:
+            city_groups[city] = []
+        city_groups[city].append(client_id)
+
+    for city, client_ids in city_groups.items():
+        if len(client_ids) > 1:
+            for i in range(len(client_ids)):
+                for j in range(i + 1, len(client_ids)):
+                    if G.has_edge(client_ids[i], client_ids[j]):
+                        G[client_ids[i]][client_ids[j]]['weight'] += 1
+                    else:
+                        G.add_edge(client_ids[i], client_ids[j], weight=1)
+
+    return G
+
+
+def draw_client_connections(connections):
+    """Рисует граф связей клиентов ``(clients, positions)``: список ``(id, name, city)`` и координаты узлов."""
+    clients, pos = connections
+    if not clients:
+        return None
+
+    G = client_graph(clients)
+
+    # Рисуем граф
+    fig = Figure(figsize=(10, 8))
+    ax = fig.subplots()
+
+    nx.draw_networkx_nodes(G, pos, ax=ax, node_color='lightblue', node_size=500)
+    nx.draw_networkx_edges(G, pos, ax=ax, edge_color='gray')
+    nx.draw_networkx_labels(G, pos, ax=ax, labels={node: data['label'] for node, data in G.nodes(data=True)})
+
+    ax.set_title('Граф связей клиентов (по городам)')
+    ax.axis('off')
+
+    return fig
+
+
+def draw_rfm(rfm):
+    """Рисует тепловую карту клиентов по оценкам давности и частоты."""
+    if not rfm:
+        return None
+
+    df = pd.DataFrame(rfm, columns=['ID', 'Давность', 'Частота', 'Сумма', 'R', 'F', 'M'])
+    levels = range(1, RFM_LEVELS + 1)
+    counts = pd.crosstab(df['R'], df['F']).reindex(index=levels, columns=levels, fill_value=0)
+    monetary = df.groupby(['R', 'F'])['Сумма'].mean().unstack().reindex(index=levels, columns=levels)
+
+    fig = Figure(figsize=(10, 8))
+    ax = fig.subplots()
+    image = ax.imshow(counts.values, origin='lower', cmap='Blues')
+    for r in range(RFM_LEVELS):
+        for f in range(RFM_LEVELS):
+            if counts.values[r, f]:
+                ax.text(f, r, f"{counts.values[r, f]}\n{monetary.values[r, f]:.0f}", ha='center', va='center',
+                        fontsize=8)
+    ax.set_xticks(range(RFM_LEVELS), labels=list(levels))
+    ax.set_yticks(range(RFM_LEVELS), labels=list(levels))
+    ax.set_xlabel('F — частота заказов')
+    ax.set_ylabel('R — давность последнего заказа')
+    ax.set_title('RFM-сегменты: количество клиентов и средняя сумма')
+    fig.colorbar(image, ax=ax, label='Клиентов')
+
+    return fig
+
+
+def draw_cohort_retention(retention):
+    """Рисует матрицу месячного удержания когорт ``(cohorts, sizes, matrix)``."""
+    cohorts, sizes, matrix = retention
+    if not cohorts:
+        return None
+
+    fig = Figure(figsize=(12, 8))
+    ax = fig.subplots()
+    image = ax.imshow(matrix * 100, aspect='auto', cmap='YlGn', vmin=0, vmax=100)
+    ax.set_yticks(range(len(cohorts)), labels=[f"{cohort} ({size})" for cohort, size in zip(cohorts, sizes)])
+    ax.set_xlabel('Месяцев с первого заказа')
+    ax.set_ylabel('Когорта (размер)')
+    ax.set_title('Удержание клиентов по когортам, %')
+    fig.colorbar(image, ax=ax, label='%')
+    fig.tight_layout()
+
+    return fig
+
+
+# Графики: имя -> функция отрисовки. Данные для нее готовит Analysis.<имя>_data,
+# поэтому график можно нарисовать в другом процессе (см. модуль reports)
+CHARTS = {
+    'top_clients': draw_top_clients,
+    'orders_dynamics': draw_orders_dynamics,
+    'client_connections': draw_client_connections,
+    'rfm': draw_rfm,
+    'cohort_retention': draw_cohort_retention,
+}
 
 
 class Analysis:
-    """Класс для анализа и визуализации данных."""
+    """Класс для анализа и визуализации данных.
+
+    Для каждого графика из ``CHARTS`` метод ``<имя>_data`` готовит данные
+    из базы, а функция ``draw_<имя>`` рисует по ним ``Figure`` без Tk, поэтому
+    графики можно строить без дисплея (например, из ``cli.py`` и ``reports.py``).
+    Методы ``show_*`` встраивают эти графики в интерфейс.
+    """
 
     def __init__(self, db):
         self.db = db
+        self.customers = CustomerAnalytics(db)
+        self.basket = MarketBasket(db)
+        self.layouts = LayoutCache(db)
 
-    def show_top_clients(self, parent_frame):
-        """Показывает топ-5 клиентов по количеству заказов."""
-        # Очищаем предыдущий график
-        for widget in parent_frame.winfo_children():
-            widget.destroy()
+    def top_clients_data(self):
+        """Данные графика топ клиентов: ``[(id, name, order_count), ...]``."""
+        return self.db.get_top_clients()
 
-        # Получаем данные
-        top_clients = self.db.get_top_clients()
+    def orders_dynamics_data(self):
+        """Данные графика динамики заказов: ``[(order_date, count, total), ...]``."""
+        return self.db.get_orders_dynamics()
 
-        if not top_clients:
-            return
+    def client_connections_data(self):
+        """
+        Данные графа связей: ``(clients, positions)``.
 
-        # Создаем DataFrame
-        df = pd.DataFrame(top_clients, columns=['ID', 'Имя', 'Количество заказов'])
+        ``clients`` — ``[(id, name, city), ...]``, пусто, если заказов нет;
+        ``positions`` — координаты узлов из кеша раскладок.
+        """
+        if not self.db.find_orders(limit=1):
+            return [], {}
+        clients = [(client.id, client.name, client.city) for client in self.db.get_clients()]
+        return clients, self.layouts.layout('client_connections', client_graph(clients), group='city')
 
-        # Создаем график
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.bar(df['Имя'], df['Количество заказов'])
-        ax.set_title('Топ клиентов по количеству заказов')
-        ax.set_ylabel('Количество заказов')
-        ax.tick_params(axis='x', rotation=45)
+    def rfm_data(self):
+        """Данные RFM-карты (см. ``CustomerAnalytics.rfm``)."""
+        return self.customers.rfm()
 
-        # Встраиваем график в интерфейс
-        canvas = FigureCanvasTkAgg(fig, parent_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill='both', expand=True)
+    def cohort_retention_data(self):
+        """Данные матрицы удержания (см. ``CustomerAnalytics.cohort_retention``)."""
+        return self.customers.cohort_retention()
 
-    def show_orders_dynamics(self, parent_frame):
-        """Показывает динамику заказов по датам."""
-        # Очищаем предыдущий график
-        for widget in parent_frame.winfo_children():
-            widget.destroy()
+    def chart_data(self, name):
+        """Готовит данные графика из ``CHARTS`` по имени."""
+        if name not in CHARTS:
+            raise ValueError(f"Неизвестный график {name}, ожидается один из {', '.join(CHARTS)}")
+        return getattr(self, f"{name}_data")()
 
-        # Получаем данные
-        dynamics = self.db.get_orders_dynamics()
+    def figure(self, name):
+        """Строит график из ``CHARTS`` по имени. Возвращает None, если данных нет."""
+        return CHARTS[name](self.chart_data(name))
 
-        if not dynamics:
-            return
+    def top_clients_figure(self):
+        """Строит график топ-5 клиентов. Возвращает None, если данных нет."""
+        return self.figure('top_clients')
 
-        # Создаем DataFrame
-        df = pd.DataFrame(dynamics, columns=['Дата', 'Количество заказов', 'Общая сумма'])
+    def orders_dynamics_figure(self):
+        """Строит график динамики заказов. Возвращает None, если данных нет."""
+        return self.figure('orders_dynamics')
 
-        # Создаем график
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8))
+    def client_connections_figure(self):
+        """Строит граф связей клиентов. Возвращает None, если данных нет."""
+        return self.figure('client_connections')
 
-        # График количества заказов
-        ax1.plot(df['Дата'], df['Количество заказов'], marker='o')
-        ax1.set_title('Динамика количества заказов')
-        ax1.set_ylabel('Количество заказов')
-        ax1.tick_params(axis='x', rotation=45)
+    def rfm_figure(self):
+        """Строит тепловую карту клиентов по оценкам давности и частоты. Возвращает None, если данных нет."""
+        return self.figure('rfm')
 
-        # График общей суммы
-        ax2.plot(df['Дата'], df['Общая сумма'], marker='o', color='orange')
-        ax2.set_title('Динамика суммы заказов')
-        ax2.set_ylabel('Сумма заказов')
-        ax2.tick_params(axis='x', rotation=45)
+    def cohort_retention_figure(self):
+        """Строит матрицу месячного удержания когорт. Возвращает None, если данных нет."""
+        return self.figure('cohort_retention')
 
-        plt.tight_layout()
+    def show_top_clients(self, parent_frame):
+        """Показывает топ-5 клиентов по количеству заказов."""
+        self.embed_figure(parent_frame, self.top_clients_figure())
 
-        # Встраиваем график в интерфейс
-        canvas = FigureCanvasTkAgg(fig, parent_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill='both', expand=True)
+    def show_orders_dynamics(self, parent_frame):
+        """Показывает динамику заказов по датам."""
+        self.embed_figure(parent_frame, self.orders_dynamics_figure())
 
     def show_client_connections(self, parent_frame):
         """Показывает граф связей клиентов."""
+        self.embed_figure(parent_frame, self.client_connections_figure())
+
+    def show_rfm(self, parent_frame):
+        """Показывает RFM-сегменты клиентов."""
+        self.embed_figure(parent_frame, self.rfm_figure())
+
+    def show_cohort_retention(self, parent_frame):
+        """Показывает удержание клиентов по когортам."""
+        self.embed_figure(parent_frame, self.cohort_retention_figure())
+
+    def show_product_associations(self, parent_frame, limit=20, min_support=0.01):
+        """Показывает таблицу товаров, которые чаще всего покупают вместе."""
         # Очищаем предыдущий график
         for widget in parent_frame.winfo_children():
             widget.destroy()
 
-        # Получаем данные
-        clients = self.db.get_clients()
-        orders = self.db.get_orders()
+        from tkinter import ttk
+
+        columns = ('Товар A', 'Товар B', 'Заказов', 'Поддержка', 'Достоверность', 'Lift')
+        tree = ttk.Treeview(parent_frame, columns=columns, show='headings')
+        for column in columns:
+            tree.heading(column, text=column)
+            tree.column(column, width=200 if column.startswith('Товар') else 110)
+
+        for name_a, name_b, count, support, confidence, lift in self.basket.top_associations(limit, min_support):
+            tree.insert('', 'end', values=(name_a, name_b, count, f"{support:.2%}", f"{confidence:.2%}",
+                                           f"{lift:.2f}"))
 
-        if not clients or not orders:
+        ttk.Label(parent_frame, text=f"Пары товаров с поддержкой от {min_support:.0%}, по убыванию lift").pack(
+            anchor='w')
+        tree.pack(fill='both', expand=True)
+
+    @staticmethod
+    def embed_figure(parent_frame, fig):
+        """Очищает фрейм и встраивает в него график, если он есть."""
+        # Очищаем предыдущий график
+        for widget in parent_frame.winfo_children():
+            widget.destroy()
+
+        if fig is None:
             return
 
-        # Создаем граф
-        G = nx.Graph()
-
-        # Добавляем узлы (клиентов)
-        for client in clients:
-            G.add_node(client.id, label=client.name, city=client.city)
-
-        # Добавляем связи (общие заказы)
-        # В этом примере просто связываем клиентов из одного города
-        city_groups = {}
-        for client in clients:
-            if client.city not in city_groups:
-                city_groups[client.city] = []
-            city_groups[client.city].append(client.id)
-
-        for city, client_ids in city_groups.items():
-            if len(client_ids) > 1:
-                for i in range(len(client_ids)):
-                    for j in range(i + 1, len(client_ids)):
-                        if G.has_edge(client_ids[i], client_ids[j]):
-                            G[client_ids[i]][client_ids[j]]['weight'] += 1
-                        else:
-                            G.add_edge(client_ids[i], client_ids[j], weight=1)
-
-        # Рисуем граф
-        fig, ax = plt.subplots(figsize=(10, 8))
-
-        pos = nx.spring_layout(G)
-        nx.draw_networkx_nodes(G, pos, node_color='lightblue', node_size=500)
-        nx.draw_networkx_edges(G, pos, edge_color='gray')
-        nx.draw_networkx_labels(G, pos, labels={node: data['label'] for node, data in G.nodes(data=True)})
-
-        ax.set_title('Граф связей клиентов (по городам)')
-        ax.axis('off')
+        # Tk-бэкенд импортируется только при встраивании в интерфейс
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
         # Встраиваем график в интерфейс
         canvas = FigureCanvasTkAgg(fig, parent_frame)
         canvas.draw()
-        canvas.get_tk_widget().pack(fill='both', expand=True)
\ No newline at end of file
+        canvas.get_tk_widget().pack(fill='both', expand=True)
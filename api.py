@@ -0,0 +1,462 @@
+"""HTTP/JSON API поверх Database на asyncio.
+
+Запуск::
+
+    python -m api --port 8080 --readers 4
+
+Основные ресурсы:
+
+- ``GET /clients``, ``/products``, ``/orders`` — списки с keyset-пагинацией
+  (параметры ``after`` и ``limit``, в ответе ``next_after``) и поиском ``q``;
+- ``GET|DELETE /clients/{id}`` (и аналогично для товаров и заказов),
+  ``POST /clients``, ``/products``, ``/orders`` — JSON в теле запроса;
+- ``GET /analytics/top-clients?limit=5``, ``GET /analytics/orders-dynamics``.
+
+Ответы на GET получают ETag по версиям таблиц (``Database.get_table_versions``),
+поэтому повторный запрос с ``If-None-Match`` возвращает 304 без выполнения
+выборки. Ответы сжимаются gzip, если клиент это поддерживает. Чтение идет
+через общий пул соединений только для чтения, запись — через методы Database.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import gzip
+import hashlib
+import json
+import queue
+import re
+import sqlite3
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from db import STATEMENT_CACHE_SIZE, STATEMENTS, Database, order_items_at_order_date
+from models import Client, Product, Order
+
+# Ограничения пагинации
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Ответы короче этого размера не сжимаются
+GZIP_MIN_SIZE = 512
+
+# Максимальный размер тела запроса
+MAX_BODY = 1024 * 1024
+
+# Выборки для списков: столбцы поиска и таблицы, от версий которых зависит ответ
+RESOURCES = {
+    'clients': {
+        'search': ('name', 'email', 'phone', 'city', 'address'),
+        'depends': ('clients',),
+    },
+    'products': {
+        'search': ('name', 'id'),
+        'depends': ('products',),
+    },
+    'orders': {
+        'search': ('id', 'client_id', 'order_date'),
+        # Названия и цены товаров в заказе берутся из products
+        'depends': ('orders', 'order_items', 'products'),
+    },
+}
+
+
+def _page_queries(table):
+    """Запросы страницы списка без поиска и с поиском; собираются один раз."""
+    search = " OR ".join(f"{column} LIKE ?" for column in RESOURCES[table]['search'])
+    select = f"{STATEMENTS[f'{table}.all']} WHERE id > ?"
+    return select + " ORDER BY id LIMIT ?", f"{select} AND ({search}) ORDER BY id LIMIT ?"
+
+
+# Запросы страниц списков: таблица -> (без поиска, с поиском)
+PAGE_QUERIES = {table: _page_queries(table) for table in RESOURCES}
+
+
+class ApiError(Exception):
+    """Ошибка запроса, которая возвращается клиенту с указанным статусом."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ReaderPool:
+    """Пул переиспользуемых соединений SQLite только для чтения."""
+
+    def __init__(self, db_name, size=4):
+        self.size = size
+        self.connections = queue.Queue()
+        uri = f"file:{urllib.parse.quote(db_name)}?mode=ro"
+        for _ in range(size):
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+            conn.row_factory = sqlite3.Row
+            self.connections.put(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Выдает соединение из пула и возвращает его после использования."""
+        conn = self.connections.get()
+        try:
+            yield conn
+        finally:
+            self.connections.put(conn)
+
+    def close(self):
+        """Закрывает все соединения пула."""
+        for _ in range(self.size):
+            self.connections.get().close()
+
+
+def parse_limit(params):
+    """Читает параметр ``limit`` с учетом ограничений."""
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "limit должен быть числом")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def fetch_page(conn, table, after='', limit=DEFAULT_LIMIT, search_term=''):
+    """
+    Возвращает страницу строк таблицы по ключу (keyset-пагинация).
+
+    Выборка ``WHERE id > ? ORDER BY id LIMIT ?`` идет по первичному ключу
+    и не зависит от номера страницы, в отличие от ``OFFSET``.
+    """
+    plain, search = PAGE_QUERIES[table]
+    args = [after]
+    if search_term:
+        args.extend(f"%{search_term}%" for _ in RESOURCES[table]['search'])
+    args.append(limit)
+    query = search if search_term else plain
+
+    items = [dict(row) for row in conn.execute(query, args)]
+    return {
+        'items': items,
+        'next_after': items[-1]['id'] if len(items) == limit else None,
+    }
+
+
+def fetch_order_items(conn, order_ids):
+    """Возвращает товары для нескольких заказов одним запросом."""
+    if not order_ids:
+        return {}
+    result = {order_id: [] for order_id in order_ids}
+    rows = conn.execute(STATEMENTS['order_items.for_orders'], (json.dumps(list(result)),))
+    for order_id, product_id, name, price, quantity in order_items_at_order_date(conn, rows):
+        result[order_id].append({'product_id': product_id, 'name': name, 'price': price, 'quantity': quantity})
+    return result
+
+
+class ApiServer:
+    """HTTP-сервер API: маршрутизация, ETag, gzip и пул читателей."""
+
+    def __init__(self, db, host='127.0.0.1', port=8080, readers=4):
+        self.db = db
+        self.host = host
+        self.port = port
+        self.readers = ReaderPool(db.db_name, readers)
+        # Отдельный поток для записи: SQLite допускает одного писателя
+        self.read_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='api-read')
+        self.write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='api-write')
+        self.server = None
+        self.routes = [
+            ('GET', re.compile(r'^/health$'), self.health),
+            ('GET', re.compile(r'^/analytics/top-clients$'), self.top_clients),
+            ('GET', re.compile(r'^/analytics/orders-dynamics$'), self.orders_dynamics),
+            ('GET', re.compile(r'^/(clients|products|orders)$'), self.list_rows),
+            ('GET', re.compile(r'^/(clients|products|orders)/([^/]+)$'), self.get_row),
+            ('POST', re.compile(r'^/(clients|products|orders)$'), self.create_row),
+            ('DELETE', re.compile(r'^/(clients|products|orders)/([^/]+)$'), self.delete_row),
+        ]
+
+    async def start(self):
+        """Запускает сервер и возвращает фактический порт."""
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def serve_forever(self):
+        """Запускает сервер и обслуживает запросы до остановки."""
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        """Останавливает сервер и освобождает ресурсы."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.read_executor.shutdown()
+        self.write_executor.shutdown()
+        self.readers.close()
+
+    async def read(self, func, *args):
+        """Выполняет функцию чтения с соединением из пула в отдельном потоке."""
+        def run():
+            with self.readers.connection() as conn:
+                return func(conn, *args)
+        return await asyncio.get_running_loop().run_in_executor(self.read_executor, run)
+
+    async def write(self, func, *args):
+        """Выполняет метод Database, изменяющий данные, в потоке записи."""
+        return await asyncio.get_running_loop().run_in_executor(self.write_executor, func, *args)
+
+    # Обработка HTTP
+    async def handle_connection(self, reader, writer):
+        """Обслуживает одно соединение, поддерживая keep-alive."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                body = b''
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.send(writer, HTTPStatus.BAD_REQUEST, {'error': "Некорректный Content-Length"},
+                                    headers, keep_alive=False)
+                    break
+                if length > MAX_BODY:
+                    await self.send(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "Слишком большой запрос"},
+                                    headers, keep_alive=False)
+                    break
+                if length:
+                    body = await reader.readexactly(length)
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                await self.dispatch(writer, method, target, headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def dispatch(self, writer, method, target, headers, body, keep_alive):
+        """Находит обработчик по маршруту и отправляет ответ."""
+        url = urllib.parse.urlsplit(target)
+        path = urllib.parse.unquote(url.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+
+        try:
+            allowed = False
+            for route_method, pattern, handler in self.routes:
+                match = pattern.match(path)
+                if not match:
+                    continue
+                allowed = True
+                if route_method != method:
+                    continue
+
+                if method == 'GET':
+                    # ETag зависит от адреса запроса и версий таблиц, из которых строится ответ
+                    versions = await self.read(lambda conn: dict(
+                        conn.execute(STATEMENTS['table_versions.all']).fetchall()))
+                    resource = match.group(1) if pattern.groups else None
+                    etag = self.make_etag(target, versions, resource)
+                    if headers.get('if-none-match') == etag:
+                        await self.send(writer, HTTPStatus.NOT_MODIFIED, None, headers, keep_alive, etag=etag)
+                        return
+                    status, payload = await handler(params, *match.groups())
+                    await self.send(writer, status, payload, headers, keep_alive, etag=etag)
+                else:
+                    data = json.loads(body or b'{}') if method == 'POST' else None
+                    status, payload = await handler(data, *match.groups())
+                    await self.send(writer, status, payload, headers, keep_alive)
+                return
+
+            if allowed:
+                raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "Метод не поддерживается")
+            raise ApiError(HTTPStatus.NOT_FOUND, "Ресурс не найден")
+
+        except ApiError as e:
+            await self.send(writer, e.status, {'error': str(e)}, headers, keep_alive)
+        except (ValueError, KeyError, TypeError) as e:
+            await self.send(writer, HTTPStatus.BAD_REQUEST, {'error': str(e)}, headers, keep_alive)
+        except sqlite3.IntegrityError as e:
+            await self.send(writer, HTTPStatus.CONFLICT, {'error': str(e)}, headers, keep_alive)
+        except sqlite3.OperationalError as e:
+            # Обычно "database is locked": запрос можно повторить позже
+            await self.send(writer, HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)}, headers, keep_alive)
+        except sqlite3.Error as e:
+            await self.send(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}, headers, keep_alive)
+
+    @staticmethod
+    def make_etag(target, versions, resource=None):
+        """
+        Строит ETag по адресу запроса и версиям таблиц.
+
+        Для ресурсов из ``RESOURCES`` учитываются только таблицы из ``depends``,
+        поэтому изменения в других таблицах не сбрасывают кеш клиента.
+        Для остальных маршрутов (аналитика) учитываются все таблицы.
+        """
+        tables = RESOURCES[resource]['depends'] if resource in RESOURCES else sorted(versions)
+        key = target + '|' + ','.join(f"{name}:{versions[name]}" for name in tables)
+        return '"' + hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest() + '"'
+
+    @staticmethod
+    async def send(writer, status, payload, request_headers, keep_alive, etag=None):
+        """Отправляет JSON-ответ, при возможности сжимая его gzip."""
+        status = HTTPStatus(status)
+        body = b''
+        headers = []
+        if payload is not None and status not in (HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            headers.append('Content-Type: application/json; charset=utf-8')
+            if len(body) >= GZIP_MIN_SIZE and 'gzip' in request_headers.get('accept-encoding', ''):
+                body = gzip.compress(body, compresslevel=5)
+                headers.append('Content-Encoding: gzip')
+            headers.append('Vary: Accept-Encoding')
+        if etag:
+            headers.append(f'ETag: {etag}')
+        headers.append(f'Content-Length: {len(body)}')
+        headers.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+
+        head = f"HTTP/1.1 {status.value} {status.phrase}\r\n" + '\r\n'.join(headers) + '\r\n\r\n'
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    # Обработчики ресурсов
+    async def health(self, params):
+        return HTTPStatus.OK, {'status': 'ok'}
+
+    async def list_rows(self, params, table):
+        limit = parse_limit(params)
+        after = params.get('after', '')
+        search_term = params.get('q', '')
+
+        def query(conn):
+            page = fetch_page(conn, table, after, limit, search_term)
+            if table == 'orders':
+                items = fetch_order_items(conn, [order['id'] for order in page['items']])
+                for order in page['items']:
+                    order['items'] = items[order['id']]
+            return page
+
+        return HTTPStatus.OK, await self.read(query)
+
+    async def get_row(self, params, table, row_id):
+        def query(conn):
+            row = conn.execute(STATEMENTS[f'{table}.by_id'], (row_id,)).fetchone()
+            if row is None:
+                return None
+            row = dict(row)
+            if table == 'orders':
+                row['items'] = fetch_order_items(conn, [row_id])[row_id]
+            return row
+
+        row = await self.read(query)
+        if row is None:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"Запись {row_id} не найдена")
+        return HTTPStatus.OK, row
+
+    async def create_row(self, data, table):
+        if not isinstance(data, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Ожидается JSON-объект")
+
+        if table == 'clients':
+            def build(new_id):
+                return Client(new_id, data['name'], data['email'], data['phone'], data['city'], data['address'])
+            item = await self.write(self.insert_new, table, data.get('id'), build, self.db.add_client)
+            return HTTPStatus.CREATED, {'id': item.id}
+
+        if table == 'products':
+            item = await self.write(self.insert_new, table, data.get('id'),
+                                    lambda new_id: Product(new_id, data['name'], data['price']), self.db.add_product)
+            return HTTPStatus.CREATED, {'id': item.id}
+
+        # Сумма заказа считается по текущим ценам товаров
+        items = [(product_id, int(quantity)) for product_id, quantity in data['items']]
+        if not items:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Заказ должен содержать товары")
+
+        def prices(conn):
+            rows = conn.execute(STATEMENTS['products.by_ids'], (json.dumps([product_id for product_id, _ in items]),))
+            return {row['id']: row['price'] for row in rows}
+
+        known = await self.read(prices)
+        missing = [product_id for product_id, _ in items if product_id not in known]
+        if missing:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"Неизвестные товары: {', '.join(missing)}")
+        total = sum(known[product_id] * quantity for product_id, quantity in items)
+        order_date = data.get('order_date') or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        order = await self.write(self.insert_new, table, data.get('id'),
+                                 lambda new_id: Order(new_id, data['client_id'], total, order_date, items),
+                                 self.db.add_order)
+        return HTTPStatus.CREATED, {'id': order.id, 'total_amount': order.total_amount}
+
+    def insert_new(self, table, new_id, build, add):
+        """
+        Создает запись и добавляет ее в базу; выполняется в потоке записи.
+
+        ID генерируется в том же вызове, что и вставка: поток записи один,
+        поэтому одновременные запросы без ``id`` не получат одинаковый ID.
+        """
+        item = build(new_id or self.db.get_next_id(table))
+        item.validate_all()
+        add(item)
+        return item
+
+    async def delete_row(self, data, table, row_id):
+        delete = {
+            'clients': self.db.delete_client,
+            'products': self.db.delete_product,
+            'orders': self.db.delete_order,
+        }[table]
+        await self.write(delete, row_id)
+        return HTTPStatus.NO_CONTENT, None
+
+    async def top_clients(self, params):
+        limit = parse_limit({'limit': params.get('limit', 5)})
+        rows = await self.read(lambda conn: conn.execute(STATEMENTS['analytics.top_clients'], (limit,)).fetchall())
+        return HTTPStatus.OK, {'items': [dict(row) for row in rows]}
+
+    async def orders_dynamics(self, params):
+        rows = await self.read(lambda conn: conn.execute(STATEMENTS['analytics.orders_dynamics']).fetchall())
+        return HTTPStatus.OK, {'items': [dict(row) for row in rows]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP API ManagerApp")
+    parser.add_argument('--db', default='database.db', help="путь к файлу базы данных")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--readers', type=int, default=4, help="размер пула соединений для чтения")
+    args = parser.parse_args(argv)
+
+    server = ApiServer(Database(args.db), args.host, args.port, args.readers)
+
+    async def run():
+        port = await server.start()
+        print(f"API запущен на http://{args.host}:{port}")
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,661 @@
+"""Журнал изменений базы для аудита и восстановления.
+
+Журнал — каталог файлов-сегментов ``audit-000001.log``, ``audit-000002.log``
+и т.д., в которые только дописываются кадры. Каждый кадр — пакет изменений,
+зафиксированных в базе с прошлого кадра: время записи, автор изменений
+и строки с их новыми значениями или ключи удаленных строк.
+
+``AuditLog`` подписывается на уведомления ``Database`` и пишет кадр раз в
+``batch_size`` уведомлений, а фоновый поток — раз в ``flush_interval``
+секунд, если изменения были; раз в ``fsync_interval`` секунд записанное
+сбрасывается на диск. Сами строки берутся
+не из уведомлений, а из базы по ``rowversion`` и ``tombstones`` (как в
+``Database.export_changes``): так в журнал попадают и массовые изменения
+(импорт, объединение дублей), о которых база сообщает одним ``RELOADED``,
+а запись в базу не становится дороже — журнал только читает ее пакетами.
+Журнал помнит версию последнего записанного изменения, поэтому после сбоя
+недописанные изменения попадут в следующий кадр.
+
+Так как строки читаются по ``rowversion``, кадр хранит только последнее
+состояние строки: несколько изменений одной строки между кадрами
+схлопываются в одно, промежуточные значения в журнал не попадают.
+Автор изменений базой не хранится, поэтому в кадр пишется пользователь
+процесса журнала (``actor``), только если кадр записан по уведомлениям
+этого процесса. Кадры, которые догоняют изменения, сделанные без журнала
+(другими процессами — API, командной строкой — или пока журнал был закрыт),
+и кадры-снимки пишутся с неизвестным автором ``UNKNOWN_ACTOR``. Изменения
+другого процесса, сделанные, пока журнал открыт, попадают в ближайший кадр
+и получают его автора.
+
+После ``Database.restore`` счетчик изменений базы возвращается к значению
+на момент создания копии, и версии новых изменений могут совпасть с уже
+записанными. Журнал замечает это (счетчик меньше его версии) и пишет
+кадр-снимок: изменение ``RESET`` и затем все строки базы.
+
+Формат кадра: длина и CRC32 содержимого (``<II``), затем содержимое:
+время (``<d``), автор, номер версии первого изменения, число изменений и сами
+изменения — приращение версии, код таблицы и операции, значения столбцов
+(у ``RESET`` — только код ``RESET_CODE``).
+Целые числа записываются как varint, значения — с однобайтовым тегом
+типа (как в msgpack). Недописанный при сбое кадр в конце последнего сегмента
+отбрасывается по длине или CRC.
+
+``replay`` проигрывает журнал в новую базу и восстанавливает ее содержимое
+на момент последнего кадра; ``RESET`` очищает все таблицы.
+История цен ``product_prices`` в журнал не пишется: ее ведут триггеры
+базы, поэтому в восстановленной базе история начинается с момента ``replay``.
+"""
+import getpass
+import itertools
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+from db import DELETE, RELOADED, TABLE_COLUMNS, TABLE_KEYS, TABLES, UPSERT, Database
+
+# Заголовок файла сегмента: сигнатура и версия формата
+MAGIC = b'MAUDIT'
+FORMAT_VERSION = 1
+HEADER = MAGIC + bytes((FORMAT_VERSION,))
+
+# Имена сегментов: audit-<номер>.log
+SEGMENT_PREFIX = 'audit-'
+SEGMENT_SUFFIX = '.log'
+
+# Размер сегмента, после которого журнал переходит к следующему файлу
+SEGMENT_BYTES = 16 << 20
+
+# Кадр пишется после стольких уведомлений; фоновый поток пишет накопленное раз в FLUSH_INTERVAL секунд
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 1.0
+
+# Не чаще чем раз в столько секунд данные сбрасываются на диск (fsync)
+FSYNC_INTERVAL = 5.0
+
+# Заголовок кадра: длина содержимого и его CRC32
+FRAME_HEADER = struct.Struct('<II')
+TIMESTAMP = struct.Struct('<d')
+FLOAT = struct.Struct('<d')
+
+# Теги типов значений
+NONE, INT, FLOAT_TAG, STR, BYTES = range(5)
+
+OPERATIONS = (UPSERT, DELETE)
+
+# Изменение кадра-снимка: все таблицы очищаются, следом идут все строки базы
+RESET = 'reset'
+RESET_CODE = 0xff
+
+# Автор кадра, изменения которого сделаны неизвестно кем (см. AuditLog.flush)
+UNKNOWN_ACTOR = ''
+
+
+def _changes_query(table_name, with_deletes):
+    """Строки таблицы в диапазоне версий и, если нужно, ключи удаленных строк."""
+    columns = ', '.join(TABLE_COLUMNS[table_name])
+    query = f"SELECT rowversion, 0, {columns} FROM {table_name} WHERE rowversion > ? AND rowversion <= ?"
+    if with_deletes:
+        keys = ', '.join(('key1', 'key2')[:len(TABLE_KEYS[table_name])])
+        query += f'''
+            UNION ALL
+            SELECT rowversion, 1, {keys}{', NULL' * (len(TABLE_COLUMNS[table_name]) - len(TABLE_KEYS[table_name]))}
+            FROM tombstones WHERE table_name = '{table_name}' AND rowversion > ? AND rowversion <= ?
+        '''
+    return query
+
+
+CHANGES_QUERIES = {(table_name, with_deletes): _changes_query(table_name, with_deletes)
+                   for table_name in TABLES for with_deletes in (False, True)}
+
+
+def _replay_statements(table_name):
+    """Запросы проигрывания: вставка с заменой и удаление по ключу."""
+    columns = TABLE_COLUMNS[table_name]
+    keys = TABLE_KEYS[table_name]
+    where = ' AND '.join(f"{key} = ?" for key in keys)
+    insert = f"INSERT OR REPLACE INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    return insert, f"DELETE FROM {table_name} WHERE {where}"
+
+
+REPLAY_STATEMENTS = {table_name: _replay_statements(table_name) for table_name in TABLES}
+
+
+# Кодирование
+def _write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_str(out, value):
+    raw = value.encode('utf-8')
+    _write_varint(out, len(raw))
+    out += raw
+
+
+def _read_str(data, pos):
+    size, pos = _read_varint(data, pos)
+    return data[pos:pos + size].decode('utf-8'), pos + size
+
+
+def _write_value(out, value):
+    """Записывает значение столбца с тегом типа; целые — zigzag varint."""
+    if value is None:
+        out.append(NONE)
+    elif isinstance(value, int):
+        out.append(INT)
+        _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+    elif isinstance(value, float):
+        out.append(FLOAT_TAG)
+        out += FLOAT.pack(value)
+    elif isinstance(value, str):
+        out.append(STR)
+        _write_str(out, value)
+    else:
+        out.append(BYTES)
+        _write_varint(out, len(value))
+        out += value
+
+
+def _read_value(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag == STR:
+        return _read_str(data, pos)
+    if tag == INT:
+        value, pos = _read_varint(data, pos)
+        return (value >> 1) ^ -(value & 1), pos
+    if tag == FLOAT_TAG:
+        return FLOAT.unpack_from(data, pos)[0], pos + FLOAT.size
+    if tag == NONE:
+        return None, pos
+    if tag == BYTES:
+        size, pos = _read_varint(data, pos)
+        return data[pos:pos + size], pos + size
+    raise ValueError(f"Неизвестный тег значения {tag}")
+
+
+def encode_frame(timestamp, actor, changes):
+    """
+    Кодирует кадр журнала.
+
+    Parameters
+    ----------
+    timestamp : float
+        Время записи кадра (``time.time()``).
+    actor : str
+        Автор изменений или ``UNKNOWN_ACTOR``.
+    changes : list of tuple
+        ``(version, table_name, operation, values)`` по возрастанию версии;
+        ``values`` — все столбцы ``TABLE_COLUMNS`` для ``UPSERT``, ключи
+        ``TABLE_KEYS`` для ``DELETE`` или ``()`` для ``RESET`` (таблица None).
+
+    Returns
+    -------
+    bytes
+        Кадр вместе с заголовком длины и CRC32.
+    """
+    out = bytearray(TIMESTAMP.pack(timestamp))
+    _write_str(out, actor)
+    previous = changes[0][0] if changes else 0
+    _write_varint(out, previous)
+    _write_varint(out, len(changes))
+    for version, table_name, operation, values in changes:
+        _write_varint(out, version - previous)
+        previous = version
+        if operation == RESET:
+            out.append(RESET_CODE)
+            continue
+        out.append(TABLES.index(table_name) << 1 | OPERATIONS.index(operation))
+        for value in values:
+            _write_value(out, value)
+    return FRAME_HEADER.pack(len(out), zlib.crc32(out)) + out
+
+
+def decode_frame(payload):
+    """Разбирает содержимое кадра (без заголовка): ``(timestamp, actor, changes)``."""
+    data = payload
+    timestamp = TIMESTAMP.unpack_from(data, 0)[0]
+    actor, pos = _read_str(data, TIMESTAMP.size)
+    version, pos = _read_varint(data, pos)
+    count, pos = _read_varint(data, pos)
+    changes = []
+    for _ in range(count):
+        delta, pos = _read_varint(data, pos)
+        version += delta
+        code = data[pos]
+        pos += 1
+        if code == RESET_CODE:
+            changes.append((version, None, RESET, ()))
+            continue
+        table_name, operation = TABLES[code >> 1], OPERATIONS[code & 1]
+        values = []
+        for _ in (TABLE_COLUMNS if operation == UPSERT else TABLE_KEYS)[table_name]:
+            value, pos = _read_value(data, pos)
+            values.append(value)
+        changes.append((version, table_name, operation, tuple(values)))
+    return timestamp, actor, changes
+
+
+# Чтение журнала
+def segments(directory):
+    """Пути сегментов журнала по порядку."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in sorted(names)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)]
+
+
+def read_segment(path):
+    """
+    Читает кадры сегмента.
+
+    Returns
+    -------
+    tuple
+        ``(frames, valid_bytes)``: список ``(timestamp, actor, changes)`` и
+        длина целой части файла. Недописанный или поврежденный кадр и все
+        после него не читаются.
+
+    Raises
+    ------
+    ValueError
+        Если файл не является сегментом журнала.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < len(HEADER):
+        # Сегмент создан, но заголовок не успел записаться
+        return [], 0
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} не является сегментом журнала")
+    if data[len(MAGIC)] != FORMAT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия формата журнала {data[len(MAGIC)]} в {path}")
+
+    frames = []
+    pos = len(HEADER)
+    while pos + FRAME_HEADER.size <= len(data):
+        size, crc = FRAME_HEADER.unpack_from(data, pos)
+        start = pos + FRAME_HEADER.size
+        payload = data[start:start + size]
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            break
+        frames.append(decode_frame(payload))
+        pos = start + size
+    return frames, pos
+
+
+def iter_frames(directory):
+    """Перебирает кадры всех сегментов журнала по порядку."""
+    for path in segments(directory):
+        yield from read_segment(path)[0]
+
+
+def replay(directory, db_name, progress=None):
+    """
+    Восстанавливает базу по журналу.
+
+    База создается во временном файле рядом с ``db_name`` и получает свое
+    имя только после проигрывания всего журнала.
+
+    Parameters
+    ----------
+    directory : str
+        Каталог журнала.
+    db_name : str
+        Файл новой базы; не должен существовать.
+    progress : callable, optional
+        Вызывается с количеством проигранных изменений.
+
+    Returns
+    -------
+    dict
+        ``frames``, ``changes``, ``version`` (последняя проигранная версия)
+        и ``seconds``.
+
+    Raises
+    ------
+    ValueError
+        Если файл базы уже существует.
+    """
+    if os.path.exists(db_name):
+        raise ValueError(f"Файл {db_name} уже существует")
+    started = time.perf_counter()
+    temp_name = db_name + '.tmp'
+    if os.path.exists(temp_name):
+        os.remove(temp_name)
+
+    frames = count = version = 0
+    try:
+        Database(temp_name)
+        conn = sqlite3.connect(temp_name)
+        try:
+            with conn:
+                for _, _, changes in iter_frames(directory):
+                    frames += 1
+                    # Подряд идущие изменения одной таблицы одного вида пишутся одним executemany
+                    for (table_name, operation), group in itertools.groupby(changes, lambda c: (c[1], c[2])):
+                        rows = [values for _, _, _, values in group]
+                        if operation == RESET:
+                            for name in TABLES:
+                                conn.execute(f"DELETE FROM {name}")
+                            continue
+                        insert, delete = REPLAY_STATEMENTS[table_name]
+                        if operation == DELETE:
+                            conn.executemany(delete, rows)
+                        elif table_name == 'order_items':
+                            # У товаров заказа нет первичного ключа: строка заменяется по (order_id, product_id)
+                            keys = len(TABLE_KEYS[table_name])
+                            conn.executemany(delete, [row[:keys] for row in rows])
+                            conn.executemany(insert, rows)
+                        else:
+                            conn.executemany(insert, rows)
+                        count += len(rows)
+                    if changes:
+                        version = changes[-1][0]
+                    if progress:
+                        progress(count)
+        finally:
+            conn.close()
+        os.replace(temp_name, db_name)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+    return {'frames': frames, 'changes': count, 'version': version, 'seconds': time.perf_counter() - started}
+
+
+class AuditLog:
+    """
+    Журнал изменений базы, который пишется пакетами по уведомлениям.
+
+    Пишет в журнал только один процесс; потоки процесса могут изменять
+    базу одновременно.
+
+    Parameters
+    ----------
+    db : Database
+        База данных приложения.
+    directory : str
+        Каталог журнала; создается при необходимости.
+    actor : str, optional
+        Кто работает с базой; по умолчанию — имя пользователя ОС. Пишется
+        только в кадры с изменениями, о которых сообщила ``db`` (см. ``flush``).
+    batch_size : int
+        Через сколько уведомлений пишется кадр.
+    flush_interval : float
+        Как часто фоновый поток (``start``) пишет накопленные изменения.
+    fsync_interval : float
+        Не чаще чем раз в столько секунд записанное сбрасывается на диск;
+        ``close`` сбрасывает всегда.
+    segment_bytes : int
+        Размер сегмента, после которого начинается новый файл.
+
+    Attributes
+    ----------
+    version : int or None
+        Версия последнего изменения в журнале (None — журнал пуст, первый
+        кадр будет содержать все строки базы).
+    resync : bool
+        Следующий кадр — снимок всей базы (база восстановлена из копии).
+    last_error : Exception or None
+        Ошибка последней неудачной записи из фонового потока.
+    """
+
+    def __init__(self, db, directory, actor=None, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 fsync_interval=FSYNC_INTERVAL, segment_bytes=SEGMENT_BYTES):
+        self.db = db
+        self.directory = directory
+        self.actor = actor or getpass.getuser()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        self.version = None
+        self.resync = False
+        self.last_error = None
+        self.pending = 0
+        # Изменения до этой версии сделаны без журнала (см. open)
+        self.catch_up = 0
+        self.unsynced = False
+        self.file = None
+        self.segment = 0
+        self.last_fsync = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return f"AuditLog({self.directory!r}, version={self.version})"
+
+    def open(self):
+        """
+        Открывает последний сегмент для дописывания.
+
+        Версия последнего изменения берется из журнала; недописанный при сбое
+        кадр в конце сегмента обрезается. Изменения базы, которых еще нет
+        в журнале, сделаны без него и пишутся с автором ``UNKNOWN_ACTOR``.
+        Повторный вызов ничего не делает.
+        """
+        with self._lock:
+            if self.file is not None:
+                return self
+            os.makedirs(self.directory, exist_ok=True)
+            paths = segments(self.directory)
+            for path in reversed(paths):
+                frames, valid_bytes = read_segment(path)
+                if path == paths[-1]:
+                    self.segment = int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                    self.file = open(path, 'r+b')
+                    self.file.truncate(valid_bytes)
+                    self.file.seek(valid_bytes)
+                    if valid_bytes == 0:
+                        self.file.write(HEADER)
+                versions = [changes[-1][0] for _, _, changes in frames if changes]
+                if versions:
+                    self.version = versions[-1]
+                    break
+            if self.file is None:
+                self._new_segment()
+            self.catch_up = self.db.get_sync_token()
+        return self
+
+    def attach(self):
+        """
+        Подписывается на изменения базы.
+
+        Кадры по уведомлениям пишутся, когда журнал открыт (``open``
+        или фоновый поток ``start``); до этого уведомления только копятся.
+        """
+        self.db.subscribe(self.on_change)
+        return self
+
+    def close(self):
+        """Останавливает фоновый поток, дописывает и сбрасывает на диск изменения, отписывается от базы."""
+        self.stop()
+        if self.on_change in self.db.listeners:
+            self.db.unsubscribe(self.on_change)
+        if self.file is None:
+            return
+        self.flush()
+        with self._lock:
+            self._fsync()
+            self.file.close()
+            self.file = None
+
+    def on_change(self, event):
+        """Обработчик уведомлений базы: пишет кадр, когда набран пакет."""
+        # Database.restore сообщает RELOADED сразу после восстановления, пока новые
+        # изменения не успели снова поднять счетчик выше версии журнала
+        if event.action == RELOADED and self.version is not None and self.db.get_sync_token() < self.version:
+            self.resync = True
+        self.pending += 1
+        if self.pending >= self.batch_size and self.file is not None:
+            # Если кадр уже пишет другой поток, изменения попадут в него или в следующий:
+            # строки берутся из базы, поэтому пропустить запись безопасно
+            self.flush(blocking=False)
+
+    def _run(self):
+        # Журнал открывается, а первый кадр догоняет изменения, сделанные без журнала
+        # (для пустого журнала — вся база), уже в фоновом потоке
+        first = True
+        while not self._stop.wait(0 if first else self.flush_interval):
+            try:
+                self.open()
+                if self.pending or first:
+                    first = False
+                    self.flush()
+                elif self.unsynced and time.monotonic() - self.last_fsync >= self.fsync_interval:
+                    with self._lock:
+                        if self.file is not None:
+                            self._fsync()
+            except (OSError, ValueError, sqlite3.Error) as e:
+                self.last_error = e
+            else:
+                self.last_error = None
+
+    def start(self):
+        """
+        Запускает фоновый поток: он открывает журнал, догоняет изменения базы
+        и дальше пишет накопленные изменения раз в ``flush_interval`` секунд.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='audit-log', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Останавливает фоновый поток, дожидаясь текущей записи."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def read_changes(self, full=False):
+        """
+        Читает из базы изменения после ``version``.
+
+        Parameters
+        ----------
+        full : bool
+            Прочитать снимок всей базы: изменение ``RESET`` и все строки.
+            Снимок читается и тогда, когда счетчик изменений базы меньше
+            ``version`` (база восстановлена из копии).
+
+        Returns
+        -------
+        tuple
+            ``(token, changes)``: текущая версия базы и изменения по возрастанию версии.
+        """
+        conn = self.db.get_connection()
+        try:
+            # Версия и строки читаются в одной транзакции, как в export_changes
+            conn.execute("BEGIN")
+            token = conn.execute("SELECT version FROM sync_clock").fetchone()[0]
+            reset = self.version is not None and (full or token < self.version)
+            since = -1 if self.version is None or reset else self.version
+            changes = []
+            with_deletes = since >= 0
+            for table_name in TABLES:
+                keys = len(TABLE_KEYS[table_name])
+                args = (since, token, since, token) if with_deletes else (since, token)
+                for row in conn.execute(CHANGES_QUERIES[table_name, with_deletes], args):
+                    operation = OPERATIONS[row[1]]
+                    changes.append((row[0], table_name, operation, row[2:] if operation == UPSERT else row[2:2 + keys]))
+            conn.rollback()
+        finally:
+            conn.close()
+        changes.sort(key=lambda change: change[0])
+        if reset:
+            changes.insert(0, (changes[0][0] if changes else token, None, RESET, ()))
+        return token, changes
+
+    def flush(self, blocking=True):
+        """
+        Записывает кадр с изменениями базы после последнего записанного.
+
+        Автор ``actor`` пишется, только если с прошлого кадра были уведомления
+        ``db``. Изменения без уведомлений (сделанные до ``open`` или другими
+        процессами) и снимок после восстановления базы пишутся отдельным
+        кадром с автором ``UNKNOWN_ACTOR``.
+
+        Parameters
+        ----------
+        blocking : bool
+            Ждать, если кадр сейчас пишет другой поток; иначе сразу вернуть None.
+
+        Returns
+        -------
+        int or None
+            Сколько изменений записано.
+
+        Raises
+        ------
+        ValueError
+            Если журнал не открыт.
+        """
+        if not self._lock.acquire(blocking):
+            return None
+        try:
+            if self.file is None:
+                raise ValueError("Журнал не открыт")
+            notified, self.pending = self.pending, 0
+            resync, self.resync = self.resync, False
+            try:
+                token, changes = self.read_changes(resync)
+                if not notified or (changes and changes[0][2] == RESET):
+                    split = len(changes)
+                else:
+                    split = next((i for i, change in enumerate(changes) if change[0] > self.catch_up), len(changes))
+                timestamp = time.time()
+                for actor, part in ((UNKNOWN_ACTOR, changes[:split]), (self.actor, changes[split:])):
+                    if part:
+                        self.file.write(encode_frame(timestamp, actor, part))
+                if changes:
+                    self.file.flush()
+                    self.unsynced = True
+            except BaseException:
+                self.resync = self.resync or resync
+                self.pending += notified
+                raise
+            # После снимка версия может уменьшиться
+            self.version = token
+            self.catch_up = 0
+            if self.unsynced and time.monotonic() - self.last_fsync >= self.fsync_interval:
+                self._fsync()
+            if self.file.tell() >= self.segment_bytes:
+                self._fsync()
+                self.file.close()
+                self._new_segment()
+            return len(changes)
+        finally:
+            self._lock.release()
+
+    def _fsync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_fsync = time.monotonic()
+        self.unsynced = False
+
+    def _new_segment(self):
+        self.segment += 1
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self.segment:06d}{SEGMENT_SUFFIX}")
+        self.file = open(path, 'wb')
+        self.file.write(HEADER)
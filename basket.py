@@ -0,0 +1,116 @@
+"""Анализ потребительской корзины: какие товары покупают вместе.
+
+Пары товаров считаются в SQLite самосоединением ``order_items`` по заказу.
+Перед соединением отбрасываются товары, которые сами по себе встречаются
+реже порога поддержки: пара не может встречаться чаще своих товаров
+(принцип Apriori), поэтому результат не меняется, а соединение становится
+меньше. Результаты кешируются до изменения ``order_items`` или ``products``
+(по ``Database.get_table_versions``).
+"""
+import math
+
+# Заказы с каждым товаром; повторные строки товара в одном заказе считаются один раз
+ITEM_COUNTS_QUERY = '''
+    SELECT product_id, COUNT(DISTINCT order_id) AS orders FROM order_items
+    GROUP BY product_id
+    HAVING orders >= ?
+'''
+
+PAIRS_QUERY = '''
+    WITH frequent AS (
+        SELECT product_id FROM order_items
+        GROUP BY product_id
+        HAVING COUNT(DISTINCT order_id) >= :min_count
+    ),
+    items AS MATERIALIZED (
+        SELECT DISTINCT order_id, product_id FROM order_items
+        WHERE product_id IN frequent
+    )
+    SELECT a.product_id, b.product_id, COUNT(*) AS pair_count
+    FROM items a
+    JOIN items b ON b.order_id = a.order_id AND b.product_id > a.product_id
+    GROUP BY a.product_id, b.product_id
+    HAVING pair_count >= :min_count
+'''
+
+
+class MarketBasket:
+    """
+    Ассоциации товаров по данным ``order_items``.
+
+    Для пары товаров A и B:
+
+    - поддержка — доля заказов, в которых есть оба товара;
+    - достоверность A → B — доля заказов с A, в которых есть и B;
+    - lift — во сколько раз пара встречается чаще, чем если бы товары
+      покупали независимо (больше 1 — товары связаны).
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._cache = {}
+
+    def _versions(self):
+        versions = self.db.get_table_versions()
+        return versions.get('order_items'), versions.get('products')
+
+    def pairs(self, min_support=0.01):
+        """
+        Пары товаров с поддержкой не ниже ``min_support``.
+
+        Parameters
+        ----------
+        min_support : float
+            Минимальная доля заказов с парой (от 0 до 1).
+
+        Returns
+        -------
+        list of tuple
+            ``(product_a, product_b, orders, support, confidence_ab, confidence_ba, lift)``,
+            отсортированные по убыванию lift.
+        """
+        versions = self._versions()
+        cached = self._cache.get(min_support)
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+
+        conn = self.db.get_connection()
+        try:
+            conn.execute("BEGIN")
+            baskets = conn.execute("SELECT COUNT(DISTINCT order_id) FROM order_items").fetchone()[0]
+            min_count = max(1, math.ceil(min_support * baskets))
+            item_counts = dict(conn.execute(ITEM_COUNTS_QUERY, (min_count,)).fetchall())
+            rows = conn.execute(PAIRS_QUERY, {'min_count': min_count}).fetchall()
+            conn.rollback()
+        finally:
+            conn.close()
+
+        result = []
+        for product_a, product_b, count in rows:
+            count_a, count_b = item_counts[product_a], item_counts[product_b]
+            result.append((product_a, product_b, count, count / baskets, count / count_a, count / count_b,
+                           count * baskets / (count_a * count_b)))
+        result.sort(key=lambda row: (-row[6], -row[2]))
+
+        self._cache[min_support] = (versions, result)
+        return result
+
+    def top_associations(self, limit=20, min_support=0.01):
+        """
+        Самые сильные связи товаров с названиями.
+
+        Returns
+        -------
+        list of tuple
+            ``(name_a, name_b, orders, support, confidence, lift)``, где
+            ``confidence`` — большая из достоверностей A → B и B → A.
+        """
+        top = self.pairs(min_support)[:limit]
+        if not top:
+            return []
+
+        ids = sorted({row[0] for row in top} | {row[1] for row in top})
+        names = {product_id: product.name for product_id, product in self.db.get_products_by_ids(ids).items()}
+
+        return [(names.get(a, a), names.get(b, b), count, support, max(conf_ab, conf_ba), lift)
+                for a, b, count, support, conf_ab, conf_ba, lift in top]
@@ -0,0 +1,6 @@
+"""Замеры производительности ManagerApp.
+
+Скрипты запускаются из корня проекта, например::
+
+    python -m benchmarks.pipeline_bench --rows 1000000 --files 24
+"""
@@ -0,0 +1,147 @@
+"""Нагрузочный тест HTTP API.
+
+Запускает ``api`` в отдельном процессе на сгенерированной базе и нагружает его
+локальным асинхронным клиентом с keep-alive соединениями. Выводит JSON
+с количеством запросов в секунду и перцентилями задержки.
+
+Пример::
+
+    python -m benchmarks.api_load --connections 32 --duration 10 --etag
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import SCALES, generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = [
+    '/clients?limit=100',
+    '/products?limit=100',
+    '/orders?limit=50',
+    '/clients/CLT001',
+    '/analytics/top-clients',
+]
+
+
+def free_port():
+    """Возвращает свободный TCP-порт."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_port(port, timeout=10.0):
+    """Ждет, пока сервер начнет принимать соединения."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError("Сервер API не запустился")
+
+
+async def client(port, paths, deadline, use_etag, latencies, statuses):
+    """Один клиент: последовательно отправляет запросы по keep-alive соединению."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    etags = {}
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            headers = f"GET {path} HTTP/1.1\r\nHost: localhost\r\nAccept-Encoding: gzip\r\n"
+            if use_etag and path in etags:
+                headers += f"If-None-Match: {etags[path]}\r\n"
+            started = time.perf_counter()
+            writer.write((headers + "\r\n").encode('latin-1'))
+            await writer.drain()
+
+            head = await reader.readuntil(b'\r\n\r\n')
+            lines = head.decode('latin-1').split('\r\n')
+            status = int(lines[0].split(' ')[1])
+            length = 0
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+                elif name.lower() == 'etag':
+                    etags[path] = value.strip()
+            if length:
+                await reader.readexactly(length)
+
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run_load(port, connections, duration, use_etag):
+    """Запускает клиентов и собирает задержки."""
+    await wait_for_port(port)
+    latencies = []
+    statuses = {}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(client(port, PATHS[i % len(PATHS):] + PATHS[:i % len(PATHS)], deadline, use_etag,
+                                  latencies, statuses)
+                           for i in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q / 100))] * 1000 if latencies else 0.0
+
+    return {
+        'connections': connections,
+        'etag': use_etag,
+        'requests': len(latencies),
+        'elapsed_seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(50), 3),
+        'p99_ms': round(percentile(99), 3),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3) if latencies else 0.0,
+        'statuses': statuses,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP API")
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--etag', action='store_true', help="отправлять If-None-Match")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'api.db')
+        generate(db_path, *SCALES[args.scale])
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'api', '--db', db_path, '--port', str(port), '--readers', str(args.readers)],
+            cwd=ROOT, stdout=subprocess.DEVNULL,
+        )
+        try:
+            result = asyncio.run(run_load(port, args.connections, args.duration, args.etag))
+        finally:
+            server.terminate()
+            server.wait()
+
+    json.dump(result, sys.stdout, ensure_ascii=False, indent=4)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Сравнение колоночных снимков с CSV: размер файлов и время загрузки.
+
+Пример::
+
+    python -m benchmarks.columnar_bench --scale medium
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import SCALES, generate
+from columnar import FORMATS, TABLE_SCHEMAS, Snapshot
+from db import TABLES
+
+
+def directory_size(path):
+    """Суммарный размер файлов в каталоге."""
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def load_csv(directory):
+    """Загружает CSV-выгрузку с приведением числовых столбцов, как нужно для аналитики."""
+    tables = {}
+    for table in TABLES:
+        with open(os.path.join(directory, f"{table}.csv"), encoding='utf-8', newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader)
+            kinds = dict(TABLE_SCHEMAS[table])
+            converters = [float if kinds[name] == 'f8' else int if kinds[name] == 'i8' else str for name in header]
+            tables[table] = [[convert(value) for convert, value in zip(converters, row)] for row in reader]
+    return tables
+
+
+def touch_snapshot(snapshot):
+    """Читает все столбцы снимка, чтобы учесть фактическое чтение данных с диска."""
+    for table in TABLES:
+        for name, kind in TABLE_SCHEMAS[table]:
+            column = snapshot.column(table, name)
+            if kind == 'str':
+                column.copy()
+            else:
+                column.sum()
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение колоночных снимков с CSV")
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    args = parser.parse_args(argv)
+
+    results = {'scale': args.scale, 'formats': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        db = generate(os.path.join(directory, 'bench.db'), *SCALES[args.scale])
+
+        csv_dir = os.path.join(directory, 'csv')
+        os.makedirs(csv_dir)
+        _, export_seconds = timed(lambda: [db.export_to_csv(table, os.path.join(csv_dir, f"{table}.csv"))
+                                           for table in TABLES])
+        _, load_seconds = timed(load_csv, csv_dir)
+        _, sql_top_seconds = timed(db.get_top_clients)
+        results['formats']['csv'] = {
+            'bytes': directory_size(csv_dir),
+            'export_seconds': round(export_seconds, 4),
+            'load_seconds': round(load_seconds, 4),
+            'top_clients_seconds': round(sql_top_seconds, 4),  # через SQLite
+        }
+
+        for fmt in FORMATS:
+            snapshot_dir = os.path.join(directory, fmt)
+            try:
+                _, export_seconds = timed(db.export_snapshot, snapshot_dir, fmt)
+            except ImportError as e:
+                results['formats'][fmt] = {'skipped': str(e)}
+                continue
+            snapshot, open_seconds = timed(Snapshot, snapshot_dir)
+            _, load_seconds = timed(touch_snapshot, snapshot)
+            _, top_seconds = timed(snapshot.get_top_clients)
+            results['formats'][fmt] = {
+                'bytes': directory_size(snapshot_dir),
+                'export_seconds': round(export_seconds, 4),
+                'open_seconds': round(open_seconds, 4),
+                'load_seconds': round(open_seconds + load_seconds, 4),
+                'top_clients_seconds': round(top_seconds, 4),
+            }
+
+    json.dump(results, sys.stdout, ensure_ascii=False, indent=4)
+    print()
+
+
+if __name__ == "__main__":
+    main()
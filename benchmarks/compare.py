@@ -0,0 +1,59 @@
+"""Сравнение двух JSON-отчетов ``benchmarks.run``.
+
+Пример::
+
+    python -m benchmarks.compare before.json after.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+
+def compare(before, after, threshold=0.1):
+    """
+    Сравнивает медианы замеров.
+
+    Returns
+    -------
+    list
+        Кортежи ``(имя, медиана до, медиана после, отношение, статус)``,
+        где статус — ``'медленнее'``, ``'быстрее'`` или ``''``.
+    """
+    rows = []
+    for name, result in after['results'].items():
+        old = before['results'].get(name)
+        if not old or 'median' not in old or 'median' not in result:
+            continue
+        ratio = result['median'] / old['median'] if old['median'] else float('inf')
+        status = ''
+        if ratio > 1 + threshold:
+            status = 'медленнее'
+        elif ratio < 1 - threshold:
+            status = 'быстрее'
+        rows.append((name, old['median'], result['median'], ratio, status))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение результатов замеров")
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0.1, help="допустимое относительное отклонение")
+    args = parser.parse_args(argv)
+
+    with open(args.before, encoding='utf-8') as file:
+        before = json.load(file)
+    with open(args.after, encoding='utf-8') as file:
+        after = json.load(file)
+
+    rows = compare(before, after, args.threshold)
+    print(f"{'Замер':<40}{'до, мс':>12}{'после, мс':>12}{'x':>8}")
+    for name, old, new, ratio, status in rows:
+        print(f"{name:<40}{old * 1000:>12.2f}{new * 1000:>12.2f}{ratio:>8.2f}  {status}")
+
+    # Ненулевой код возврата, если есть замедления
+    return 1 if any(status == 'медленнее' for *_, status in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Генератор синтетических данных для замеров.
+
+Данные детерминированы: одинаковые ``seed`` и размеры дают одинаковую базу.
+
+Пример::
+
+    python -m benchmarks.datagen bench.db --clients 100000 --orders 500000
+"""
+import argparse
+import datetime
+import random
+import time
+
+from db import TABLE_COLUMNS, Database
+
+FIRST_NAMES = ['Иван', 'Петр', 'Анна', 'Мария', 'Сергей', 'Ольга', 'Дмитрий', 'Елена', 'Алексей', 'Наталья',
+               'Винсент', 'Джулс', 'Миа', 'Бутч', 'Марселас']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Волков', 'Соколов', 'Лебедев',
+              'Козлов', 'Вега', 'Уоллес', 'Кулидж']
+CITIES = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань', 'Нижний Новгород', 'Самара',
+          'Омск', 'Ростов-на-Дону', 'Уфа', 'Красноярск', 'Пермь']
+STREETS = ['Ленина', 'Мира', 'Советская', 'Садовая', 'Школьная', 'Лесная', 'Новая', 'Центральная']
+PRODUCT_NAMES = ['Телефон', 'Ноутбук', 'Планшет', 'Наушники', 'Монитор', 'Клавиатура', 'Мышь', 'Принтер',
+                 'Колонка', 'Часы', 'Камера', 'Роутер']
+DOMAINS = ['mail.ru', 'yandex.ru', 'gmail.com', 'example.com']
+
+# Пресеты масштаба: клиенты, товары, заказы
+SCALES = {
+    'tiny': (100, 20, 300),
+    'small': (1000, 100, 5000),
+    'medium': (20000, 1000, 100000),
+    'large': (100000, 5000, 1000000),
+    # База в несколько гигабайт для замеров резервного копирования
+    'huge': (1000000, 20000, 20000000),
+}
+
+# Запросы вставки с явным списком столбцов: в таблицах есть служебный rowversion
+INSERT_SQL = {
+    table: f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    for table, columns in TABLE_COLUMNS.items()
+}
+
+
+def iter_clients(rng, count):
+    """Генерирует кортежи строк таблицы clients."""
+    for i in range(1, count + 1):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        yield (
+            f"CLT{i:03d}",
+            f"{first} {last}",
+            f"user{i}@{rng.choice(DOMAINS)}",
+            f"+7{rng.randrange(10 ** 9, 10 ** 10)}",
+            rng.choice(CITIES),
+            f"ул. {rng.choice(STREETS)}, д. {rng.randint(1, 200)}",
+        )
+
+
+def iter_products(rng, count):
+    """Генерирует кортежи строк таблицы products."""
+    for i in range(1, count + 1):
+        yield (
+            f"PRD{i:03d}",
+            f"{rng.choice(PRODUCT_NAMES)} {i}",
+            round(rng.uniform(100, 100000), 2),
+        )
+
+
+def iter_orders(rng, count, clients, prices, max_items=5, start=datetime.datetime(2024, 1, 1), days=365):
+    """
+    Генерирует пары (строка заказа, список строк order_items).
+
+    Сумма заказа считается по ценам товаров, как при оформлении в интерфейсе.
+    """
+    seconds = days * 24 * 3600
+    for i in range(1, count + 1):
+        order_id = f"ORD{i:03d}"
+        date = start + datetime.timedelta(seconds=rng.randrange(seconds))
+        items = {}
+        for _ in range(rng.randint(1, max_items)):
+            product = rng.randrange(len(prices))
+            items[product] = items.get(product, 0) + rng.randint(1, 3)
+        total = sum(prices[product] * quantity for product, quantity in items.items())
+        yield (
+            (order_id, f"CLT{rng.randint(1, clients):03d}", round(total, 2), date.strftime("%Y-%m-%d %H:%M:%S")),
+            [(order_id, f"PRD{product + 1:03d}", quantity) for product, quantity in items.items()],
+        )
+
+
+def generate(db_path, clients=1000, products=100, orders=5000, max_items=5, seed=42, batch_size=10000):
+    """
+    Создает базу данных со сгенерированными данными.
+
+    Parameters
+    ----------
+    db_path : str
+        Путь к файлу базы. Таблицы создаются, если их нет.
+    clients, products, orders : int
+        Количество записей каждого вида.
+    max_items : int
+        Максимальное количество разных товаров в заказе.
+    seed : int
+        Зерно генератора случайных чисел.
+
+    Returns
+    -------
+    Database
+    """
+    rng = random.Random(seed)
+    db = Database(db_path)
+    conn = db.get_connection()
+
+    with conn:
+        conn.executemany(INSERT_SQL['clients'], iter_clients(rng, clients))
+        product_rows = list(iter_products(rng, products))
+        conn.executemany(INSERT_SQL['products'], product_rows)
+
+    prices = [row[2] for row in product_rows]
+    order_batch = []
+    item_batch = []
+    for order, items in iter_orders(rng, orders, clients, prices, max_items):
+        order_batch.append(order)
+        item_batch.extend(items)
+        if len(order_batch) >= batch_size:
+            with conn:
+                conn.executemany(INSERT_SQL['orders'], order_batch)
+                conn.executemany(INSERT_SQL['order_items'], item_batch)
+            order_batch = []
+            item_batch = []
+    if order_batch:
+        with conn:
+            conn.executemany(INSERT_SQL['orders'], order_batch)
+            conn.executemany(INSERT_SQL['order_items'], item_batch)
+
+    conn.close()
+    return db
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генерация синтетической базы ManagerApp")
+    parser.add_argument('db_path')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--clients', type=int)
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--orders', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    clients, products, orders = SCALES[args.scale]
+    started = time.perf_counter()
+    generate(args.db_path, args.clients or clients, args.products or products, args.orders or orders,
+             seed=args.seed)
+    print(f"База {args.db_path} создана за {time.perf_counter() - started:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Сравнение последовательного импорта с параллельным конвейером.
+
+Входные данные — примеры ``clients_import.json`` и ``products_import.json``,
+размноженные до нужного количества строк и разложенные по нескольким файлам.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from db import Database
+from pipeline import ImportPipeline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def replicate_samples(directory, rows, files):
+    """
+    Размножает примеры клиентов и товаров и раскладывает их по файлам.
+
+    Email клиентов делается уникальным, чтобы не нарушать ограничение UNIQUE.
+    Возвращает список путей к созданным файлам.
+    """
+    with open(os.path.join(ROOT, 'clients_import.json'), encoding='utf-8') as file:
+        clients = json.load(file)
+    with open(os.path.join(ROOT, 'products_import.json'), encoding='utf-8') as file:
+        products = json.load(file)
+
+    paths = []
+    per_file = max(1, rows // files)
+    for n in range(files):
+        table, sample = ('clients', clients) if n % 2 == 0 else ('products', products)
+        path = os.path.join(directory, f"{table}_{n:03d}.json")
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('[')
+            for i in range(per_file):
+                item = dict(sample[i % len(sample)])
+                if table == 'clients':
+                    user, domain = item['email'].split('@')
+                    item['email'] = f"{user}.{n}.{i}@{domain}"
+                file.write((',' if i else '') + json.dumps(item, ensure_ascii=False))
+            file.write(']')
+        paths.append(path)
+    return paths
+
+
+def run_sequential(db_path, paths):
+    """Импортирует файлы по одному методами ``Database``."""
+    db = Database(db_path)
+    started = time.perf_counter()
+    rows = 0
+    for path in paths:
+        if os.path.basename(path).startswith('clients'):
+            rows += db.import_clients_from_json(path)
+        else:
+            rows += db.import_products_from_json(path)
+    elapsed = time.perf_counter() - started
+    return {'rows': rows, 'elapsed_seconds': round(elapsed, 4), 'rows_per_second': round(rows / elapsed, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000, help="общее количество строк")
+    parser.add_argument('--files', type=int, default=12, help="количество файлов")
+    parser.add_argument('--workers', type=int, nargs='*', help="варианты числа процессов")
+    parser.add_argument('--skip-sequential', action='store_true', help="не замерять последовательный импорт")
+    args = parser.parse_args(argv)
+
+    cpu_count = os.cpu_count() or 1
+    workers = args.workers or sorted({1, 2, max(1, cpu_count // 2), cpu_count})
+    results = {'rows': args.rows, 'files': args.files, 'cpu_count': cpu_count, 'pipeline': []}
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = replicate_samples(directory, args.rows, args.files)
+
+        if not args.skip_sequential:
+            results['sequential'] = run_sequential(os.path.join(directory, 'sequential.db'), paths)
+
+        for count in workers:
+            db = Database(os.path.join(directory, f"pipeline_{count}.db"))
+            stats = ImportPipeline(db, workers=count).run(paths)
+            results['pipeline'].append(stats.as_dict())
+            print(stats.report(), file=sys.stderr)
+
+    json.dump(results, sys.stdout, ensure_ascii=False, indent=4)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,711 @@
+"""Набор воспроизводимых замеров ManagerApp.
+
+Перед замерами генерируется синтетическая база (см. ``benchmarks.datagen``),
+результаты выводятся в JSON, чтобы их можно было сравнить между коммитами
+с помощью ``benchmarks.compare``.
+
+Пример::
+
+    python -m benchmarks.run --scale small --output results.json
+    python -m benchmarks.run --only "db\\.get_" --repeat 10
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import SCALES, generate
+from models import Client, Product, Order
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Граф связей строит ребра между всеми клиентами одного города,
+# поэтому на больших базах он не замеряется
+CONNECTIONS_MAX_CLIENTS = 2000
+
+BENCHMARKS = []
+
+
+def benchmark(name, writes=False):
+    """
+    Регистрирует функцию замера.
+
+    Функция принимает ``BenchContext`` и возвращает пару
+    ``(setup, run)``: ``setup`` выполняется перед каждым повтором без учета
+    времени (может быть None), ``run`` — замеряемое действие.
+    Замеры с ``writes=True`` получают отдельную копию базы.
+    """
+    def decorator(func):
+        BENCHMARKS.append((name, writes, func))
+        return func
+    return decorator
+
+
+class SkipBenchmark(Exception):
+    """Замер неприменим в текущем окружении."""
+
+
+class BenchContext:
+    """Общие данные для замеров: сгенерированная база и временный каталог."""
+
+    def __init__(self, directory, db_path, counts):
+        self.directory = directory
+        self.db_path = db_path
+        self.clients, self.products, self.orders = counts
+        self.db = None
+        self._serial = 0
+        self._resources = []
+
+    def unique(self, prefix):
+        """Возвращает уникальный идентификатор для вставок."""
+        self._serial += 1
+        return f"{prefix}{self._serial}"
+
+    def path(self, filename):
+        """Возвращает путь во временном каталоге."""
+        return os.path.join(self.directory, filename)
+
+    def closing(self, resource):
+        """Регистрирует ресурс (например, соединение), который закрывается после замера."""
+        self._resources.append(resource)
+        return resource
+
+    def close(self):
+        """Закрывает ресурсы замера и соединения ``db``."""
+        while self._resources:
+            self._resources.pop().close()
+        if self.db is not None:
+            self.db.close()
+
+
+def measure(setup, run, repeat):
+    """Выполняет замер ``repeat`` раз и возвращает длительности в секундах."""
+    timings = []
+    rows = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - started)
+        if isinstance(result, (list, tuple)):
+            rows = len(result)
+        elif isinstance(result, int):
+            rows = result
+    return timings, rows
+
+
+# Методы Database: чтение
+@benchmark('db.get_clients')
+def bench_get_clients(ctx):
+    return None, ctx.db.get_clients
+
+
+@benchmark('db.get_clients.search')
+def bench_get_clients_search(ctx):
+    return None, lambda: ctx.db.get_clients('Москва')
+
+
+@benchmark('db.get_products')
+def bench_get_products(ctx):
+    return None, ctx.db.get_products
+
+
+@benchmark('db.get_products.search')
+def bench_get_products_search(ctx):
+    return None, lambda: ctx.db.get_products('Телефон')
+
+
+@benchmark('db.get_orders')
+def bench_get_orders(ctx):
+    return None, ctx.db.get_orders
+
+
+@benchmark('db.get_orders.search')
+def bench_get_orders_search(ctx):
+    return None, lambda: ctx.db.get_orders('2024-03')
+
+
+# Потоковое чтение: время сопоставимо с get_*, а память не растет с размером таблицы
+@benchmark('db.iter_clients')
+def bench_iter_clients(ctx):
+    return None, lambda: sum(1 for _ in ctx.db.iter_clients())
+
+
+@benchmark('db.iter_orders')
+def bench_iter_orders(ctx):
+    return None, lambda: sum(1 for _ in ctx.db.iter_orders())
+
+
+@benchmark('db.get_order_items')
+def bench_get_order_items(ctx):
+    return None, lambda: ctx.db.get_order_items(f"ORD{ctx.orders // 2:03d}")
+
+
+@benchmark('db.get_order_items_batch')
+def bench_get_order_items_batch(ctx):
+    # Примерно столько заказов видно в таблице на экране
+    order_ids = [f"ORD{i:03d}" for i in range(1, min(ctx.orders, 50) + 1)]
+    return None, lambda: ctx.db.get_order_items_batch(order_ids)
+
+
+@benchmark('db.get_top_clients')
+def bench_get_top_clients(ctx):
+    return None, ctx.db.get_top_clients
+
+
+@benchmark('db.get_orders_dynamics')
+def bench_get_orders_dynamics(ctx):
+    return None, ctx.db.get_orders_dynamics
+
+
+# Методы Database: запись
+@benchmark('db.add_client', writes=True)
+def bench_add_client(ctx):
+    def run():
+        client_id = ctx.unique('BCL')
+        ctx.db.add_client(Client(client_id, "Тест Тестов", f"{client_id}@example.com", "+79160000000",
+                                 "Москва", "ул. Тестовая"))
+    return None, run
+
+
+@benchmark('db.add_product', writes=True)
+def bench_add_product(ctx):
+    return None, lambda: ctx.db.add_product(Product(ctx.unique('BPR'), "Товар", 100.0))
+
+
+@benchmark('db.add_order', writes=True)
+def bench_add_order(ctx):
+    items = [("PRD001", 1), ("PRD002", 2), ("PRD003", 1)]
+    return None, lambda: ctx.db.add_order(Order(ctx.unique('BOR'), "CLT001", 1000.0, "2024-06-01 12:00:00", items))
+
+
+@benchmark('db.delete_client', writes=True)
+def bench_delete_client(ctx):
+    state = {}
+
+    def setup():
+        state['id'] = ctx.unique('DCL')
+        ctx.db.add_client(Client(state['id'], "Удаляемый", f"{state['id']}@example.com", "+79160000000",
+                                 "Москва", "ул. Тестовая"))
+    return setup, lambda: ctx.db.delete_client(state['id'])
+
+
+@benchmark('db.delete_product', writes=True)
+def bench_delete_product(ctx):
+    state = {}
+
+    def setup():
+        state['id'] = ctx.unique('DPR')
+        ctx.db.add_product(Product(state['id'], "Удаляемый", 1.0))
+    return setup, lambda: ctx.db.delete_product(state['id'])
+
+
+@benchmark('db.delete_order', writes=True)
+def bench_delete_order(ctx):
+    state = {}
+
+    def setup():
+        state['id'] = ctx.unique('DOR')
+        ctx.db.add_order(Order(state['id'], "CLT001", 100.0, "2024-06-01 12:00:00", [("PRD001", 1)]))
+    return setup, lambda: ctx.db.delete_order(state['id'])
+
+
+# Повторное использование подготовленных запросов реестра: новое соединение
+# на каждый вызов (fresh), долгоживущее соединение без кеша запросов, когда
+# запрос разбирается при каждом вызове (nocache), и с кешем (cached)
+STATEMENT_CALLS = 1000
+STATEMENT_MODES = ('fresh', 'nocache', 'cached')
+
+
+def _statement_runner(ctx, mode, sql, params_list, write=False):
+    from db import STATEMENT_CACHE_SIZE
+
+    if mode == 'fresh':
+        def run():
+            for params in params_list:
+                conn = sqlite3.connect(ctx.db_path)
+                conn.execute(sql, params).fetchall()
+                if write:
+                    conn.rollback()
+                conn.close()
+            return len(params_list)
+        return run
+
+    conn = ctx.closing(sqlite3.connect(ctx.db_path, cached_statements=0 if mode == 'nocache' else STATEMENT_CACHE_SIZE))
+
+    def run():
+        for params in params_list:
+            conn.execute(sql, params).fetchall()
+        if write:
+            conn.rollback()
+        return len(params_list)
+    return run
+
+
+def _register_statements(mode):
+    @benchmark(f'sql.lookup.{mode}')
+    def bench_lookup(ctx):
+        from db import STATEMENTS
+        params = [(f"CLT{i % ctx.clients + 1:03d}",) for i in range(STATEMENT_CALLS)]
+        return None, _statement_runner(ctx, mode, STATEMENTS['clients.by_id'], params)
+
+    @benchmark(f'sql.search.{mode}')
+    def bench_search(ctx):
+        from db import STATEMENTS
+        params = [("%Теле%", "%Теле%")] * STATEMENT_CALLS
+        return None, _statement_runner(ctx, mode, STATEMENTS['products.search'], params)
+
+    @benchmark(f'sql.insert.{mode}', writes=True)
+    def bench_insert(ctx):
+        from db import STATEMENTS
+
+        def params():
+            return [(ctx.unique('SQL'), "Клиент", f"{ctx.unique('sql')}@mail.com", "+79161234567", "Москва", "-")
+                    for _ in range(STATEMENT_CALLS)]
+        state = {}
+
+        def setup():
+            state['run'] = _statement_runner(ctx, mode, STATEMENTS['clients.insert'], params(), write=True)
+        # Вставки откатываются, поэтому база между повторами не растет
+        return setup, lambda: state['run']()
+
+
+for _mode in STATEMENT_MODES:
+    _register_statements(_mode)
+
+
+# Импорт и экспорт
+def _register_export(table):
+    @benchmark(f'io.export_to_csv.{table}')
+    def bench_csv(ctx):
+        return None, lambda: ctx.db.export_to_csv(table, ctx.path(f"{table}.csv"))
+
+    @benchmark(f'io.export_to_json.{table}')
+    def bench_json(ctx):
+        return None, lambda: ctx.db.export_to_json(table, ctx.path(f"{table}.json"))
+
+
+for _table in ('clients', 'products', 'orders', 'order_items'):
+    _register_export(_table)
+
+
+@benchmark('io.import_from_csv.orders', writes=True)
+def bench_import_csv(ctx):
+    source = ctx.path('orders_source.csv')
+    ctx.db.export_to_csv('orders', source)
+
+    def setup():
+        conn = ctx.db.get_connection()
+        with conn:
+            conn.execute("DELETE FROM orders")
+        conn.close()
+    return setup, lambda: ctx.db.import_from_csv('orders', source)
+
+
+@benchmark('io.import_clients_from_json', writes=True)
+def bench_import_clients_json(ctx):
+    source = ctx.path('clients_source.json')
+    ctx.db.export_to_json('clients', source)
+
+    def setup():
+        conn = ctx.db.get_connection()
+        with conn:
+            conn.execute("DELETE FROM clients")
+        conn.close()
+    return setup, lambda: ctx.db.import_clients_from_json(source)
+
+
+@benchmark('io.import_products_from_json', writes=True)
+def bench_import_products_json(ctx):
+    source = ctx.path('products_source.json')
+    ctx.db.export_to_json('products', source)
+
+    def setup():
+        conn = ctx.db.get_connection()
+        with conn:
+            conn.execute("DELETE FROM products")
+        conn.close()
+    return setup, lambda: ctx.db.import_products_from_json(source)
+
+
+# Резервные копии; пропускная способность — meta.db_bytes / время замера.
+# Для баз в несколько гигабайт: --scale huge --only "io\.(backup|restore)"
+@benchmark('io.backup')
+def bench_backup(ctx):
+    return None, lambda: ctx.db.backup(ctx.path('backup.db'))['pages']
+
+
+@benchmark('io.backup.compressed')
+def bench_backup_compressed(ctx):
+    return None, lambda: ctx.db.backup(ctx.path('backup.db.gz'))['pages']
+
+
+@benchmark('io.restore', writes=True)
+def bench_restore(ctx):
+    source = ctx.path('restore_source.db')
+    ctx.db.backup(source)
+    return None, lambda: ctx.db.restore(source)['pages']
+
+
+# Аналитика: построение и отрисовка графиков в Agg без окна
+def _render(build):
+    fig = build()
+    if fig is not None:
+        fig.savefig(io.BytesIO(), format='png')
+    return fig
+
+
+@benchmark('analysis.top_clients')
+def bench_analysis_top_clients(ctx):
+    from analysis import Analysis
+    analysis = Analysis(ctx.db)
+    return None, lambda: _render(analysis.top_clients_figure)
+
+
+@benchmark('analysis.orders_dynamics')
+def bench_analysis_orders_dynamics(ctx):
+    from analysis import Analysis
+    analysis = Analysis(ctx.db)
+    return None, lambda: _render(analysis.orders_dynamics_figure)
+
+
+@benchmark('analysis.client_connections')
+def bench_analysis_client_connections(ctx):
+    if ctx.clients > CONNECTIONS_MAX_CLIENTS:
+        raise SkipBenchmark(f"больше {CONNECTIONS_MAX_CLIENTS} клиентов")
+    from analysis import Analysis
+    analysis = Analysis(ctx.db)
+    return None, lambda: _render(analysis.client_connections_figure)
+
+
+# Поиск дублей клиентов: чтение и нормализация, затем блокировка и оценка пар
+@benchmark('dedup.load')
+def bench_dedup_load(ctx):
+    from dedup import Deduplicator
+    return None, lambda: len(Deduplicator(ctx.db).load())
+
+
+@benchmark('dedup.find')
+def bench_dedup_find(ctx):
+    from dedup import Deduplicator
+    deduplicator = Deduplicator(ctx.db)
+    records = deduplicator.load()
+    return None, lambda: deduplicator.find_duplicates(records)
+
+
+# Журнал изменений: цена журнала для add_order (пакет заказов с журналом и без)
+# и восстановление базы по журналу
+AUDIT_BATCH_ORDERS = 500
+
+
+def _register_audit_add_order(enabled):
+    @benchmark(f"audit.add_order.{'on' if enabled else 'off'}", writes=True)
+    def bench(ctx):
+        from audit import AuditLog
+        items = [("PRD001", 1), ("PRD002", 2), ("PRD003", 1)]
+        if enabled:
+            log = AuditLog(ctx.db, ctx.path('audit-add-order')).open().attach()
+            # Первый кадр со всей базой пишется до замера
+            log.flush()
+
+        def run():
+            for _ in range(AUDIT_BATCH_ORDERS):
+                ctx.db.add_order(Order(ctx.unique('AOR'), "CLT001", 1000.0, "2024-06-01 12:00:00", items))
+            if enabled:
+                log.flush()
+        return None, run
+
+
+for _enabled in (False, True):
+    _register_audit_add_order(_enabled)
+
+
+@benchmark('audit.replay')
+def bench_audit_replay(ctx):
+    from audit import AuditLog, replay
+    directory = ctx.path('audit-replay')
+    log = AuditLog(ctx.db, directory).open()
+    log.flush()
+    log.close()
+    target = ctx.path('audit-replay.db')
+
+    def setup():
+        if os.path.exists(target):
+            os.remove(target)
+    return setup, lambda: replay(directory, target)
+
+
+# Раскладка графа связей: с нуля, из кеша и дополнение прежней раскладки
+def _register_layout(mode):
+    @benchmark(f'layout.client_connections.{mode}', writes=True)
+    def bench(ctx):
+        if ctx.clients > CONNECTIONS_MAX_CLIENTS:
+            raise SkipBenchmark(f"больше {CONNECTIONS_MAX_CLIENTS} клиентов")
+        from analysis import client_graph
+        from layout import LayoutCache
+        cache = LayoutCache(ctx.db)
+        G = client_graph([(client.id, client.name, client.city) for client in ctx.db.get_clients()])
+        cache.layout('bench', G, group='city')
+
+        def setup():
+            conn = ctx.db.connection()
+            with conn:
+                if mode == 'full':
+                    conn.execute("DELETE FROM graph_layouts WHERE graph = 'bench'")
+                elif mode == 'incremental':
+                    # Координаты остаются, но отпечаток не совпадает
+                    conn.execute("UPDATE graph_layouts SET fingerprint = '' WHERE graph = 'bench'")
+        return setup, lambda: len(cache.layout('bench', G, group='city'))
+
+
+for _mode in ('full', 'cached', 'incremental'):
+    _register_layout(_mode)
+
+
+# Пакетная отрисовка отчета в файлы: без кеша последовательно и в пуле процессов, из кеша
+def _register_reports(name, workers, cached):
+    @benchmark(name)
+    def bench(ctx):
+        if ctx.clients > CONNECTIONS_MAX_CLIENTS:
+            raise SkipBenchmark(f"больше {CONNECTIONS_MAX_CLIENTS} клиентов")
+        from reports import MANIFEST, ReportRenderer
+        renderer = ReportRenderer(ctx.db, ctx.path('report'), workers=workers)
+        manifest = os.path.join(renderer.directory, MANIFEST)
+
+        def setup():
+            if not cached and os.path.exists(manifest):
+                os.remove(manifest)
+        if cached:
+            renderer.render()
+        return setup, lambda: renderer.render()['rendered']
+
+
+_register_reports('reports.render.serial', 1, False)
+_register_reports('reports.render.parallel', None, False)
+_register_reports('reports.render.cached', 1, True)
+
+
+@benchmark('analysis.basket.pairs')
+def bench_basket_pairs(ctx):
+    from basket import MarketBasket
+    basket = MarketBasket(ctx.db)
+    # Кеш сбрасывается, чтобы замерять сам расчет
+    return basket._cache.clear, lambda: basket.pairs(0.001)
+
+
+# Клиентская аналитика; --scale large дает 1 млн заказов
+@benchmark('customers.refresh.full')
+def bench_customers_refresh_full(ctx):
+    from customers import CustomerAnalytics
+    analytics = CustomerAnalytics(ctx.db)
+
+    def setup():
+        analytics.token = None
+    return setup, analytics.refresh
+
+
+@benchmark('customers.refresh.incremental', writes=True)
+def bench_customers_refresh_incremental(ctx):
+    from customers import CustomerAnalytics
+    analytics = CustomerAnalytics(ctx.db)
+    analytics.refresh()
+
+    def setup():
+        # 100 новых заказов между обновлениями
+        rows = [(ctx.unique('INC'), f"CLT{i % ctx.clients + 1:03d}", 1000.0, "2025-01-15 12:00:00")
+                for i in range(100)]
+        conn = ctx.db.get_connection()
+        with conn:
+            conn.executemany("INSERT INTO orders (id, client_id, total_amount, order_date) VALUES (?, ?, ?, ?)",
+                             rows)
+        conn.close()
+    return setup, analytics.refresh
+
+
+def _register_customers(method):
+    @benchmark(f'customers.{method}')
+    def bench(ctx):
+        from customers import CustomerAnalytics
+        analytics = CustomerAnalytics(ctx.db)
+        analytics.refresh()
+        return None, getattr(analytics, method)
+
+
+for _method in ('rfm', 'cohort_retention', 'lifetime_value'):
+    _register_customers(_method)
+
+
+# Запуск приложения
+def _run_python(code, cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@benchmark('startup.interpreter')
+def bench_startup_interpreter(ctx):
+    return None, lambda: _run_python('pass', ctx.directory)
+
+
+@benchmark('startup.import_gui')
+def bench_startup_import(ctx):
+    return None, lambda: _run_python('import gui', ctx.directory)
+
+
+@benchmark('startup.application')
+def bench_startup_application(ctx):
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        raise SkipBenchmark("нет дисплея")
+    # Application открывает database.db в текущем каталоге
+    workdir = ctx.path('startup')
+    os.makedirs(workdir, exist_ok=True)
+    shutil.copy(ctx.db_path, os.path.join(workdir, 'database.db'))
+    code = "from gui import Application\napp = Application()\napp.update()\napp.destroy()"
+    return None, lambda: _run_python(code, workdir)
+
+
+@benchmark('startup.first_paint')
+def bench_startup_first_paint(ctx):
+    """Создание окна до первого показа: строится и загружается только первая страница видимой вкладки."""
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        raise SkipBenchmark("нет дисплея")
+    from gui import Application
+
+    def run():
+        app = Application(ctx.db_path)
+        while app.startup_seconds is None:
+            app.update()
+        app.on_close()
+    return None, run
+
+
+def git_commit():
+    """Возвращает хеш текущего коммита или None."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(counts, repeat=5, seed=42, only=None, progress=None):
+    """
+    Генерирует базу и выполняет замеры.
+
+    Returns
+    -------
+    dict
+        Результаты в формате JSON-отчета.
+    """
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+    except ImportError:
+        pass  # замеры аналитики будут пропущены
+    from db import Database
+
+    pattern = re.compile(only) if only else None
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        base_path = os.path.join(directory, 'base.db')
+        started = time.perf_counter()
+        generate(base_path, *counts, seed=seed)
+        generate_seconds = time.perf_counter() - started
+        db_bytes = os.path.getsize(base_path)
+
+        for name, writes, func in BENCHMARKS:
+            if pattern and not pattern.search(name):
+                continue
+            db_path = base_path
+            if writes:
+                db_path = os.path.join(directory, 'write.db')
+                shutil.copy(base_path, db_path)
+            ctx = BenchContext(directory, db_path, counts)
+            ctx.db = Database(db_path)
+
+            try:
+                setup, run = func(ctx)
+                timings, rows = measure(setup, run, repeat)
+            except SkipBenchmark as e:
+                results[name] = {'skipped': str(e)}
+                continue
+            except ImportError as e:
+                results[name] = {'skipped': f"нет зависимости: {e.name}"}
+                continue
+            except Exception as e:
+                results[name] = {'error': f"{type(e).__name__}: {e}"}
+                continue
+            finally:
+                ctx.close()
+
+            results[name] = {
+                'repeat': repeat,
+                'min': min(timings),
+                'median': statistics.median(timings),
+                'mean': statistics.mean(timings),
+                'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+                'rows': rows,
+            }
+            if progress:
+                progress(name, results[name])
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'clients': counts[0],
+            'products': counts[1],
+            'orders': counts[2],
+            'seed': seed,
+            'repeat': repeat,
+            'generate_seconds': generate_seconds,
+            'db_bytes': db_bytes,
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности ManagerApp")
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--clients', type=int)
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--orders', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help="регулярное выражение для имен замеров")
+    parser.add_argument('--output', help="файл для JSON-результатов (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    clients, products, orders = SCALES[args.scale]
+    counts = (args.clients or clients, args.products or products, args.orders or orders)
+
+    def progress(name, result):
+        print(f"{name:<40}{result['median'] * 1000:>12.2f} мс", file=sys.stderr)
+
+    report = run_benchmarks(counts, args.repeat, args.seed, args.only, progress)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=4)
+        print()
+
+
+if __name__ == "__main__":
+    main()
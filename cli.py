@@ -0,0 +1,398 @@
+"""Консольный интерфейс для импорта, экспорта и отчетов без графической оболочки.
+
+Примеры запуска::
+
+    python -m cli import clients clients_import.json
+    python -m cli import-many clients_*.json products_*.json --workers 4
+    python -m cli export orders orders_export.csv
+    python -m cli changes orders orders_delta.csv --since 1520
+    python -m cli snapshot snapshot/ --format npz
+    python -m cli backup backup.db.gz
+    python -m cli backup --dir backups/ --keep 24 --every 3600
+    python -m cli restore backup.db.gz
+    python -m cli report --out reports/
+    python -m cli report --out reports/ --format pdf
+    python -m cli stores stores/ --limit 10
+    python -m cli dedup --apply
+    python -m cli audit sync audit/
+    python -m cli audit replay audit/ restored.db
+    python -m cli bench --repeat 5
+
+Модуль не импортирует tkinter, поэтому работает на сервере без дисплея.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+from db import Database, TABLES
+
+JSON_IMPORTERS = {
+    'clients': 'import_clients_from_json',
+    'products': 'import_products_from_json',
+}
+
+
+class Progress:
+    """Выводит прогресс и время выполнения задания в stderr."""
+
+    def __init__(self, title, quiet=False, interval=0.5):
+        self.title = title
+        self.quiet = quiet
+        self.interval = interval
+        self.count = 0
+        self.started = None
+        self._last_report = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __call__(self, count):
+        """Обновляет счетчик обработанных строк."""
+        self.count = count
+        now = time.perf_counter()
+        if not self.quiet and now - self._last_report >= self.interval:
+            self._last_report = now
+            print(f"\r{self.title}: {count} строк...", end='', file=sys.stderr, flush=True)
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        if self.quiet:
+            return False
+        status = "ошибка" if exc_type else "готово"
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        print(f"\r{self.title}: {status}, {self.count} строк за {elapsed:.2f} с ({rate:.0f} строк/с)",
+              file=sys.stderr)
+        return False
+
+
+def detect_format(filename, fmt=None):
+    """Определяет формат файла по явному аргументу или расширению."""
+    if fmt:
+        return fmt
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ('.csv', '.json'):
+        return ext[1:]
+    raise ValueError(f"Не удалось определить формат файла {filename}, укажите --format")
+
+
+def cmd_import(db, args):
+    """Импортирует данные из файла в таблицу."""
+    fmt = detect_format(args.file, args.format)
+    with Progress(f"Импорт {args.file} -> {args.table}", args.quiet) as progress:
+        if fmt == 'csv':
+            db.import_from_csv(args.table, args.file, progress=progress)
+        else:
+            if args.table not in JSON_IMPORTERS:
+                raise ValueError(f"Импорт из JSON не поддерживается для таблицы {args.table}")
+            getattr(db, JSON_IMPORTERS[args.table])(args.file, progress=progress)
+    return 0
+
+
+def cmd_import_many(db, args):
+    """Импортирует несколько файлов параллельным конвейером."""
+    from pipeline import ImportPipeline
+
+    pipeline = ImportPipeline(db, workers=args.workers, batch_size=args.batch_size)
+    with Progress(f"Импорт {len(args.files)} файлов", args.quiet) as progress:
+        stats = pipeline.run(args.files, progress=progress)
+    print(stats.report())
+    for error in stats.errors:
+        print(f"  {error}", file=sys.stderr)
+    return 0
+
+
+def cmd_export(db, args):
+    """Экспортирует таблицу в файл."""
+    fmt = detect_format(args.file, args.format)
+    with Progress(f"Экспорт {args.table} -> {args.file}", args.quiet) as progress:
+        if fmt == 'csv':
+            db.export_to_csv(args.table, args.file, progress=progress)
+        else:
+            db.export_to_json(args.table, args.file, progress=progress)
+    return 0
+
+
+def cmd_changes(db, args):
+    """Экспортирует изменения таблицы с момента прошлой выгрузки и печатает новый токен."""
+    with Progress(f"Изменения {args.table} -> {args.file}", args.quiet) as progress:
+        token = db.export_changes(args.table, args.since, args.file, progress=progress)
+    print(token)
+    return 0
+
+
+def cmd_snapshot(db, args):
+    """Выгружает все таблицы в колоночный снимок."""
+    with Progress(f"Снимок {args.directory} ({args.format})", args.quiet) as progress:
+        meta = db.export_snapshot(args.directory, args.format, progress=progress)
+        progress(sum(table['rows'] for table in meta['tables'].values()))
+    return 0
+
+
+def cmd_backup(db, args):
+    """Создает резервную копию в файл или в каталог с ограничением количества копий."""
+    from backup import BackupScheduler
+
+    if (args.file is None) == (args.dir is None):
+        raise ValueError("Укажите файл копии или --dir")
+    if args.every and args.dir is None:
+        raise ValueError("--every используется только с --dir")
+    if args.file is not None:
+        with Progress(f"Резервная копия -> {args.file}", args.quiet) as progress:
+            result = db.backup(args.file, False if args.no_compress else None, args.check, progress=progress)
+        print(f"{result['path']}\t{result['stored_bytes']}")
+        return 0
+
+    scheduler = BackupScheduler(db, args.dir, args.every or 0, args.keep, not args.no_compress, args.check)
+    with Progress(f"Резервная копия -> {args.dir}", args.quiet) as progress:
+        result = scheduler.backup_now()
+        progress(result['pages'])
+    print(f"{result['path']}\t{result['stored_bytes']}")
+    if args.every:
+        scheduler.on_done = lambda result: print(f"{result['path']}\t{result['stored_bytes']}", flush=True)
+        scheduler.on_error = lambda error: print(f"Ошибка: {error}", file=sys.stderr, flush=True)
+        scheduler.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            scheduler.stop()
+    return 0
+
+
+def cmd_restore(db, args):
+    """Восстанавливает базу из резервной копии."""
+    with Progress(f"Восстановление {args.file}", args.quiet) as progress:
+        db.restore(args.file, progress=progress)
+    return 0
+
+
+def cmd_report(db, args):
+    """Печатает аналитические отчеты и при необходимости сохраняет графики."""
+    with Progress("Топ клиентов", args.quiet) as progress:
+        top_clients = db.get_top_clients(args.limit)
+        progress(len(top_clients))
+    print("Топ клиентов по количеству заказов:")
+    for client_id, name, order_count in top_clients:
+        print(f"  {client_id}\t{name}\t{order_count}")
+
+    with Progress("Динамика заказов", args.quiet) as progress:
+        dynamics = db.get_orders_dynamics()
+        progress(len(dynamics))
+    print("Динамика заказов:")
+    for order_date, order_count, total_amount in dynamics:
+        print(f"  {order_date}\t{order_count}\t{total_amount:.2f}")
+
+    from basket import MarketBasket
+
+    with Progress("Товары вместе", args.quiet) as progress:
+        associations = MarketBasket(db).top_associations(args.limit, args.min_support)
+        progress(len(associations))
+    print(f"Товары, которые покупают вместе (поддержка от {args.min_support:.2%}):")
+    for name_a, name_b, count, support, confidence, lift in associations:
+        print(f"  {name_a} + {name_b}\t{count}\t{support:.2%}\t{confidence:.2%}\t{lift:.2f}")
+
+    if args.out:
+        # Графики рисуются без Tk; неизменившиеся берутся из прошлого отчета
+        from reports import ReportRenderer
+
+        renderer = ReportRenderer(db, args.out, args.format, args.workers)
+        with Progress(f"Графики {args.out}", args.quiet) as progress:
+            result = renderer.render()
+            progress(result['rendered'])
+        for name, path in result['files'].items():
+            print(f"  {name}\t{path or 'нет данных'}")
+        print(f"Нарисовано графиков: {result['rendered']}, из кеша: {result['cached']}")
+    return 0
+
+
+def cmd_stores(db, args):
+    """Печатает сводные отчеты по базам всех магазинов из каталога."""
+    from shards import ShardedDatabase
+
+    with ShardedDatabase.from_directory(args.directory, args.workers) as stores:
+        with Progress("Магазины", args.quiet) as progress:
+            totals = stores.get_store_totals()
+            top_clients = stores.get_top_clients(args.limit)
+            dynamics = stores.get_orders_dynamics()
+            progress(len(totals))
+
+    print("Магазины:")
+    for store, order_count, total_amount in totals:
+        print(f"  {store}\t{order_count}\t{total_amount:.2f}")
+    print("Топ клиентов по количеству заказов:")
+    for store, client_id, name, order_count in top_clients:
+        print(f"  {store}\t{client_id}\t{name}\t{order_count}")
+    print("Динамика заказов:")
+    for order_date, order_count, total_amount in dynamics:
+        print(f"  {order_date}\t{order_count}\t{total_amount:.2f}")
+    return 0
+
+
+def cmd_dedup(db, args):
+    """Ищет дубли клиентов и при необходимости объединяет их."""
+    from dedup import Deduplicator
+
+    deduplicator = Deduplicator(db, threshold=args.threshold)
+    with Progress("Поиск дублей", args.quiet) as progress:
+        proposals = deduplicator.propose_merges()
+        progress(deduplicator.stats['candidates'])
+
+    print(f"Клиентов: {deduplicator.stats['clients']}, сравнено пар: {deduplicator.stats['candidates']}, "
+          f"групп дублей: {len(proposals)}")
+    for proposal in proposals:
+        print(f"  {proposal.survivor}\t<- {', '.join(proposal.duplicates)}\t{proposal.score:.2f}")
+
+    if args.apply and proposals:
+        result = deduplicator.apply(proposals)
+        print(f"Удалено дублей: {result['merged']}, перенесено заказов: {result['orders']}")
+    return 0
+
+
+def cmd_audit(db, args):
+    """Дописывает изменения базы в журнал, показывает журнал или восстанавливает по нему базу."""
+    import audit
+
+    if args.action == 'sync':
+        log = audit.AuditLog(db, args.directory).open()
+        try:
+            print(f"Записано изменений: {log.flush()}, версия: {log.version}")
+        finally:
+            log.close()
+    elif args.action == 'show':
+        for timestamp, actor, changes in audit.iter_frames(args.directory):
+            when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+            print(f"{when}\t{actor or '?'}\t{len(changes)}")
+            for version, table_name, operation, values in changes[:args.limit]:
+                print(f"  {version}\t{table_name}\t{operation}\t{values[0]}")
+    else:
+        if args.out is None:
+            raise ValueError("Укажите файл восстановленной базы")
+        with Progress(f"Восстановление по журналу {args.directory} -> {args.out}", args.quiet) as progress:
+            result = audit.replay(args.directory, args.out, progress=progress)
+        print(f"Кадров: {result['frames']}, изменений: {result['changes']}, версия: {result['version']}")
+    return 0
+
+
+def cmd_bench(db, args):
+    """Замеряет время выполнения методов чтения базы данных."""
+    methods = {
+        'get_clients': db.get_clients,
+        'get_products': db.get_products,
+        'get_orders': db.get_orders,
+        'get_top_clients': db.get_top_clients,
+        'get_orders_dynamics': db.get_orders_dynamics,
+    }
+    print(f"{'Метод':<22}{'мин, мс':>10}{'сред, мс':>10}{'строк':>10}")
+    for name, method in methods.items():
+        timings = []
+        rows = 0
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            rows = len(method())
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"{name:<22}{min(timings):>10.2f}{sum(timings) / len(timings):>10.2f}{rows:>10}")
+    return 0
+
+
+def build_parser():
+    """Создает парсер аргументов командной строки."""
+    parser = argparse.ArgumentParser(prog='managerapp', description="ManagerApp без графического интерфейса")
+    parser.add_argument('--db', default='database.db', help="путь к файлу базы данных")
+    parser.add_argument('-q', '--quiet', action='store_true', help="не выводить прогресс")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="импорт данных из CSV/JSON")
+    import_parser.add_argument('table', choices=TABLES)
+    import_parser.add_argument('file')
+    import_parser.add_argument('--format', choices=('csv', 'json'))
+    import_parser.set_defaults(handler=cmd_import)
+
+    many_parser = subparsers.add_parser('import-many', help="параллельный импорт нескольких файлов")
+    many_parser.add_argument('files', nargs='+', help="файлы clients_*.json, products_*.json, orders_*.csv и т.п.")
+    many_parser.add_argument('--workers', type=int, help="количество процессов разбора (по умолчанию — число ядер)")
+    many_parser.add_argument('--batch-size', type=int, default=5000, help="строк в одном пакете записи")
+    many_parser.set_defaults(handler=cmd_import_many)
+
+    export_parser = subparsers.add_parser('export', help="экспорт таблицы в CSV/JSON")
+    export_parser.add_argument('table', choices=TABLES)
+    export_parser.add_argument('file')
+    export_parser.add_argument('--format', choices=('csv', 'json'))
+    export_parser.set_defaults(handler=cmd_export)
+
+    changes_parser = subparsers.add_parser('changes', help="экспорт изменений с момента прошлой выгрузки")
+    changes_parser.add_argument('table', choices=TABLES)
+    changes_parser.add_argument('file', help="файл .csv или .json")
+    changes_parser.add_argument('--since', type=int, help="токен прошлой выгрузки (без него — полная выгрузка)")
+    changes_parser.set_defaults(handler=cmd_changes)
+
+    snapshot_parser = subparsers.add_parser('snapshot', help="колоночный снимок всех таблиц")
+    snapshot_parser.add_argument('directory')
+    snapshot_parser.add_argument('--format', choices=('npy', 'npz', 'parquet'), default='npy')
+    snapshot_parser.set_defaults(handler=cmd_snapshot)
+
+    backup_parser = subparsers.add_parser('backup', help="резервная копия базы")
+    backup_parser.add_argument('file', nargs='?', help="файл копии (.db или .db.gz)")
+    backup_parser.add_argument('--dir', help="каталог копий с именами по времени создания")
+    backup_parser.add_argument('--keep', type=int, default=24, help="сколько копий хранить в каталоге")
+    backup_parser.add_argument('--every', type=float, help="повторять каждые N секунд (только с --dir)")
+    backup_parser.add_argument('--no-compress', action='store_true', help="не сжимать копию")
+    backup_parser.add_argument('--check', choices=('quick', 'full'), default='quick', help="проверка копии")
+    backup_parser.set_defaults(handler=cmd_backup)
+
+    restore_parser = subparsers.add_parser('restore', help="восстановление базы из резервной копии")
+    restore_parser.add_argument('file')
+    restore_parser.set_defaults(handler=cmd_restore)
+
+    report_parser = subparsers.add_parser('report', help="аналитические отчеты")
+    report_parser.add_argument('--limit', type=int, default=5, help="количество клиентов в топе")
+    report_parser.add_argument('--min-support', type=float, default=0.01,
+                               help="минимальная доля заказов с парой товаров")
+    report_parser.add_argument('--out', help="каталог для сохранения графиков")
+    report_parser.add_argument('--format', choices=('png', 'svg', 'pdf'), default='png',
+                               help="формат графиков; pdf — один многостраничный файл")
+    report_parser.add_argument('--workers', type=int, help="процессов для отрисовки графиков")
+    report_parser.set_defaults(handler=cmd_report)
+
+    stores_parser = subparsers.add_parser('stores', help="сводные отчеты по базам нескольких магазинов")
+    stores_parser.add_argument('directory', help="каталог с файлами <магазин>.db")
+    stores_parser.add_argument('--limit', type=int, default=5, help="количество клиентов в топе")
+    stores_parser.add_argument('--workers', type=int, help="потоков для параллельных запросов")
+    stores_parser.set_defaults(handler=cmd_stores)
+
+    dedup_parser = subparsers.add_parser('dedup', help="поиск и объединение дублей клиентов")
+    dedup_parser.add_argument('--threshold', type=float, default=0.7, help="оценка похожести для дубля, от 0 до 1")
+    dedup_parser.add_argument('--apply', action='store_true', help="объединить найденных дублей")
+    dedup_parser.set_defaults(handler=cmd_dedup)
+
+    audit_parser = subparsers.add_parser('audit', help="журнал изменений базы")
+    audit_parser.add_argument('action', choices=('sync', 'show', 'replay'),
+                              help="sync — дописать изменения базы, show — вывести журнал, "
+                                   "replay — восстановить базу по журналу")
+    audit_parser.add_argument('directory', help="каталог журнала")
+    audit_parser.add_argument('out', nargs='?', help="файл восстановленной базы (для replay)")
+    audit_parser.add_argument('--limit', type=int, default=10, help="изменений кадра для show")
+    audit_parser.set_defaults(handler=cmd_audit)
+
+    bench_parser = subparsers.add_parser('bench', help="замер времени запросов")
+    bench_parser.add_argument('--repeat', type=int, default=3, help="количество повторов")
+    bench_parser.set_defaults(handler=cmd_bench)
+
+    return parser
+
+
+def main(argv=None):
+    """Точка входа консольного интерфейса."""
+    args = build_parser().parse_args(argv)
+    db = Database(args.db)
+    try:
+        return args.handler(db, args)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""Колоночные снимки таблиц для офлайн-аналитики.
+
+Таблицы выгружаются по столбцам с типами (строки фиксированной ширины,
+``float64``, ``int64``) порциями строк, не загружая таблицу в память целиком.
+Поддерживаются форматы:
+
+- ``npy`` — каталог ``<таблица>/<столбец>.npy``; загружается через
+  ``numpy.load(mmap_mode='r')`` без чтения файла целиком;
+- ``npz`` — один сжатый архив ``<таблица>.npz`` на таблицу;
+- ``parquet`` — ``<таблица>.parquet`` с группами строк, если установлен pyarrow.
+
+Строки всех столбцов читаются в порядке ``rowid``: без ``ORDER BY`` SQLite
+может читать отдельный столбец из покрывающего индекса (например,
+``idx_clients_name``), и значения разных столбцов разошлись бы по строкам.
+
+``Snapshot`` загружает снимок и предоставляет те же методы чтения, что и
+``Database`` (``get_top_clients``, ``get_orders_dynamics``, ``get_clients``,
+``get_orders``), поэтому ``Analysis(Snapshot(...))`` строит отчеты без SQLite.
+"""
+import datetime
+import json
+import os
+import zipfile
+
+from models import Client, Order
+
+# Типы столбцов: 'str' — строка фиксированной ширины, остальные — dtype numpy
+TABLE_SCHEMAS = {
+    'clients': (('id', 'str'), ('name', 'str'), ('email', 'str'), ('phone', 'str'), ('city', 'str'),
+                ('address', 'str')),
+    'products': (('id', 'str'), ('name', 'str'), ('price', 'f8')),
+    'orders': (('id', 'str'), ('client_id', 'str'), ('total_amount', 'f8'), ('order_date', 'str')),
+    'order_items': (('order_id', 'str'), ('product_id', 'str'), ('quantity', 'i8')),
+}
+
+FORMATS = ('npy', 'npz', 'parquet')
+
+META_FILE = 'snapshot.json'
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Для колоночной выгрузки требуется numpy")
+    return numpy
+
+
+def column_dtypes(conn, table_name):
+    """Определяет dtype каждого столбца; ширина строк берется из ``MAX(LENGTH(...))``."""
+    np = _numpy()
+    schema = TABLE_SCHEMAS[table_name]
+    text_columns = [name for name, kind in schema if kind == 'str']
+    widths = {}
+    if text_columns:
+        select = ', '.join(f"MAX(LENGTH({name}))" for name in text_columns)
+        row = conn.execute(f"SELECT {select} FROM {table_name}").fetchone()
+        widths = {name: width or 1 for name, width in zip(text_columns, row)}
+    return {name: np.dtype(f"U{widths[name]}" if kind == 'str' else kind) for name, kind in schema}
+
+
+def _select(table_name, columns):
+    """Выборка столбцов таблицы в одном и том же порядке строк."""
+    return f"SELECT {', '.join(columns)} FROM {table_name} ORDER BY rowid"
+
+
+def _row_count(conn, table_name):
+    return conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+
+def write_npy(conn, table_name, directory, chunk_size, progress=None):
+    """Выгружает таблицу в каталог ``.npy``-файлов за один проход по таблице."""
+    np = _numpy()
+    dtypes = column_dtypes(conn, table_name)
+    rows = _row_count(conn, table_name)
+    table_dir = os.path.join(directory, table_name)
+    os.makedirs(table_dir, exist_ok=True)
+
+    columns = list(dtypes)
+    arrays = [np.lib.format.open_memmap(os.path.join(table_dir, f"{name}.npy"), mode='w+',
+                                        dtype=dtypes[name], shape=(rows,))
+              for name in columns]
+
+    cursor = conn.execute(_select(table_name, columns))
+    offset = 0
+    while offset < rows:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            break
+        end = offset + len(chunk)
+        for array, values in zip(arrays, zip(*chunk)):
+            array[offset:end] = values
+        offset = end
+        if progress:
+            progress(offset)
+
+    for array in arrays:
+        array.flush()
+    return {'rows': offset, 'columns': {name: dtypes[name].str for name in columns}}
+
+
+def write_npz(conn, table_name, directory, chunk_size, progress=None):
+    """Выгружает таблицу в сжатый ``.npz``; каждый столбец пишется в архив потоком."""
+    np = _numpy()
+    dtypes = column_dtypes(conn, table_name)
+    rows = _row_count(conn, table_name)
+    path = os.path.join(directory, f"{table_name}.npz")
+
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, dtype in dtypes.items():
+            with archive.open(f"{name}.npy", 'w', force_zip64=True) as file:
+                np.lib.format.write_array_header_2_0(file, {
+                    'descr': np.lib.format.dtype_to_descr(dtype),
+                    'fortran_order': False,
+                    'shape': (rows,),
+                })
+                cursor = conn.execute(_select(table_name, (name,)))
+                written = 0
+                while written < rows:
+                    chunk = cursor.fetchmany(chunk_size)
+                    if not chunk:
+                        break
+                    chunk = chunk[:rows - written]
+                    file.write(np.array([row[0] for row in chunk], dtype=dtype).tobytes())
+                    written += len(chunk)
+                    if progress:
+                        progress(written)
+    return {'rows': rows, 'columns': {name: dtype.str for name, dtype in dtypes.items()}}
+
+
+def write_parquet(conn, table_name, directory, chunk_size, progress=None):
+    """Выгружает таблицу в Parquet, одна порция строк — одна группа строк."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Для выгрузки в Parquet требуется pyarrow")
+
+    types = {'str': pa.string(), 'f8': pa.float64(), 'i8': pa.int64()}
+    schema = pa.schema([(name, types[kind]) for name, kind in TABLE_SCHEMAS[table_name]])
+    columns = schema.names
+    path = os.path.join(directory, f"{table_name}.parquet")
+
+    cursor = conn.execute(_select(table_name, columns))
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=schema.field(name).type) for name, values in zip(columns, zip(*chunk))],
+                schema=schema,
+            ))
+            rows += len(chunk)
+            if progress:
+                progress(rows)
+    return {'rows': rows, 'columns': {name: str(schema.field(name).type) for name in columns}}
+
+
+WRITERS = {'npy': write_npy, 'npz': write_npz, 'parquet': write_parquet}
+
+
+def export_table(conn, table_name, directory, fmt='npy', chunk_size=5000, progress=None):
+    """
+    Выгружает одну таблицу в колоночном формате.
+
+    Returns
+    -------
+    dict
+        Количество строк и типы столбцов.
+    """
+    if table_name not in TABLE_SCHEMAS:
+        raise ValueError(f"Неизвестная таблица {table_name}")
+    if fmt not in WRITERS:
+        raise ValueError(f"Неизвестный формат {fmt}, ожидается один из {', '.join(FORMATS)}")
+    os.makedirs(directory, exist_ok=True)
+    return WRITERS[fmt](conn, table_name, directory, chunk_size, progress)
+
+
+def write_meta(directory, fmt, tables, versions):
+    """Сохраняет описание снимка."""
+    meta = {
+        'format': fmt,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'versions': versions,
+        'tables': tables,
+    }
+    with open(os.path.join(directory, META_FILE), 'w', encoding='utf-8') as file:
+        json.dump(meta, file, ensure_ascii=False, indent=4)
+    return meta
+
+
+class Snapshot:
+    """Загруженный колоночный снимок с методами чтения как у ``Database``."""
+
+    def __init__(self, directory):
+        np = _numpy()
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE), encoding='utf-8') as file:
+            self.meta = json.load(file)
+        self.format = self.meta['format']
+        self.tables = {}
+
+        for table_name in self.meta['tables']:
+            if self.format == 'npy':
+                table_dir = os.path.join(directory, table_name)
+                self.tables[table_name] = {
+                    name: np.load(os.path.join(table_dir, f"{name}.npy"), mmap_mode='r')
+                    for name, _ in TABLE_SCHEMAS[table_name]
+                }
+            elif self.format == 'npz':
+                # Столбцы распаковываются при первом обращении
+                self.tables[table_name] = np.load(os.path.join(directory, f"{table_name}.npz"))
+            else:
+                import pyarrow.parquet as pq
+                table = pq.read_table(os.path.join(directory, f"{table_name}.parquet"), memory_map=True)
+                self.tables[table_name] = {name: table.column(name).to_numpy() for name in table.column_names}
+
+    def column(self, table_name, name):
+        """Возвращает столбец таблицы как массив numpy."""
+        return self.tables[table_name][name]
+
+    def get_top_clients(self, limit=5):
+        """Топ клиентов по количеству заказов (как ``Database.get_top_clients``)."""
+        np = _numpy()
+        client_ids, counts = np.unique(self.column('orders', 'client_id'), return_counts=True)
+
+        # Только клиенты, которые есть в таблице clients (аналог JOIN)
+        ids = self.column('clients', 'id')
+        names = self.column('clients', 'name')
+        order = np.argsort(ids)
+        positions = np.searchsorted(ids, client_ids, sorter=order)
+        positions = np.minimum(positions, len(ids) - 1) if len(ids) else positions
+        known = (ids[order[positions]] == client_ids) if len(ids) else np.zeros(len(client_ids), dtype=bool)
+
+        client_ids, counts, positions = client_ids[known], counts[known], positions[known]
+        top = np.argsort(-counts, kind='stable')[:limit]
+        return [(str(client_ids[i]), str(names[order[positions[i]]]), int(counts[i])) for i in top]
+
+    def get_orders_dynamics(self):
+        """Динамика заказов по датам (как ``Database.get_orders_dynamics``)."""
+        np = _numpy()
+        dates, inverse, counts = np.unique(self.column('orders', 'order_date'), return_inverse=True,
+                                           return_counts=True)
+        totals = np.bincount(inverse, weights=self.column('orders', 'total_amount'), minlength=len(dates))
+        return [(str(date), int(count), float(total)) for date, count, total in zip(dates, counts, totals)]
+
+    def get_clients(self, search_term=""):
+        """Возвращает клиентов снимка."""
+        columns = [self.column('clients', name) for name, _ in TABLE_SCHEMAS['clients']]
+        clients = [Client(*(str(value) for value in row)) for row in zip(*columns)]
+        if search_term:
+            term = search_term.casefold()
+            clients = [client for client in clients
+                       if any(term in value.casefold() for value in
+                              (client.name, client.email, client.phone, client.city, client.address))]
+        return clients
+
+    def get_orders(self):
+        """Возвращает заказы снимка (без товаров)."""
+        ids = self.column('orders', 'id')
+        client_ids = self.column('orders', 'client_id')
+        totals = self.column('orders', 'total_amount')
+        dates = self.column('orders', 'order_date')
+        return [Order(str(order_id), str(client_id), float(total), str(date))
+                for order_id, client_id, total, date in zip(ids, client_ids, totals, dates)]
@@ -0,0 +1,289 @@
+"""Клиентская аналитика: RFM-оценки, когортное удержание и ценность клиента (LTV).
+
+Заказы читаются одним проходом по ``orders``: SQLite сворачивает их до строк
+«клиент × месяц» (количество, сумма, первая и последняя дата), дальнейшие
+расчеты выполняются векторно в NumPy. Свертка хранится в памяти, поэтому
+при ``refresh`` читаются только заказы, добавленные после прошлого обновления
+(по ``rowversion``, см. ``Database.export_changes``). Если заказы изменялись
+или удалялись, свертка строится заново.
+"""
+import numpy as np
+
+# Номер месяца от начала эры: год * 12 + месяц - 1
+MONTH_SQL = "CAST(substr(order_date, 1, 4) AS INTEGER) * 12 + CAST(substr(order_date, 6, 2) AS INTEGER) - 1"
+
+GRAIN_COLUMNS = f'''
+    SELECT client_id, {MONTH_SQL} AS month, COUNT(*), SUM(total_amount),
+           MIN(julianday(order_date)), MAX(julianday(order_date))
+    FROM orders
+'''
+FULL_QUERY = GRAIN_COLUMNS + " GROUP BY client_id, month"
+# Полная выборка не фильтрует по rowversion: обход индекса медленнее обхода таблицы
+INCREMENTAL_QUERY = GRAIN_COLUMNS + " WHERE rowversion > ? GROUP BY client_id, month"
+
+# Юлианский день начала эпохи Unix
+UNIX_EPOCH_JD = 2440587.5
+
+# Количество градаций в RFM-оценках
+RFM_LEVELS = 5
+
+
+def month_label(month):
+    """Номер месяца (``год * 12 + месяц - 1``) в виде ``'YYYY-MM'``."""
+    return f"{month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def julian_to_dates(days):
+    """Переводит массив юлианских дней в строки ``'YYYY-MM-DD'``."""
+    seconds = np.round((np.asarray(days) - UNIX_EPOCH_JD) * 86400).astype('datetime64[s]')
+    return np.datetime_as_string(seconds, unit='D')
+
+
+def score(values, higher_is_better=True, levels=RFM_LEVELS):
+    """
+    Оценка от 1 до ``levels`` по рангу значения среди всех клиентов.
+
+    Одинаковые значения получают одинаковую оценку.
+    """
+    values = np.asarray(values)
+    if not len(values):
+        return np.zeros(0, dtype=np.int64)
+    ranks = np.searchsorted(np.sort(values), values, side='left')
+    scores = 1 + ranks * levels // len(values)
+    return scores if higher_is_better else levels + 1 - scores
+
+
+def _reduce_grain(client, month, count, total, first, last):
+    """Сортирует строки «клиент × месяц» и сворачивает повторяющиеся пары."""
+    order = np.lexsort((month, client))
+    client, month, count, total, first, last = (a[order] for a in (client, month, count, total, first, last))
+    if len(client) < 2:
+        return client, month, count, total, first, last
+
+    starts = np.flatnonzero(np.r_[True, (client[1:] != client[:-1]) | (month[1:] != month[:-1])])
+    if len(starts) == len(client):
+        return client, month, count, total, first, last
+    return (client[starts], month[starts], np.add.reduceat(count, starts), np.add.reduceat(total, starts),
+            np.minimum.reduceat(first, starts), np.maximum.reduceat(last, starts))
+
+
+class CustomerAnalytics:
+    """
+    Клиентская аналитика поверх ``Database``.
+
+    Attributes
+    ----------
+    token : int or None
+        Значение ``sync_clock`` на момент последнего обновления.
+    last_refresh : str or None
+        ``'full'``, ``'incremental'`` или ``'unchanged'`` — как выполнено последнее обновление.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.token = None
+        self.order_count = 0
+        self.last_refresh = None
+        self.client_ids = np.array([], dtype=str)
+        # Свертка «клиент × месяц», отсортированная по клиенту и месяцу
+        self.grain = self._empty_grain()
+
+    @staticmethod
+    def _empty_grain():
+        return {
+            'client': np.zeros(0, dtype=np.int64),
+            'month': np.zeros(0, dtype=np.int64),
+            'count': np.zeros(0, dtype=np.int64),
+            'total': np.zeros(0, dtype=np.float64),
+            'first': np.zeros(0, dtype=np.float64),
+            'last': np.zeros(0, dtype=np.float64),
+        }
+
+    def refresh(self):
+        """
+        Обновляет свертку заказов.
+
+        Returns
+        -------
+        str
+            ``'full'``, ``'incremental'`` или ``'unchanged'``.
+        """
+        conn = self.db.get_connection()
+        try:
+            # Счетчик изменений и заказы читаются в одной транзакции
+            conn.execute("BEGIN")
+            token = conn.execute("SELECT version FROM sync_clock").fetchone()[0]
+            order_count = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+            mode = 'full'
+            if self.token is not None:
+                changed = conn.execute("SELECT COUNT(*) FROM orders WHERE rowversion > ?",
+                                       (self.token,)).fetchone()[0]
+                deleted = conn.execute(
+                    "SELECT COUNT(*) FROM tombstones WHERE table_name = 'orders' AND rowversion > ?", (self.token,)
+                ).fetchone()[0]
+                # Если все измененные строки новые, старую свертку можно дополнить
+                if not deleted and changed == order_count - self.order_count:
+                    mode = 'incremental' if changed else 'unchanged'
+
+            if mode != 'unchanged':
+                if mode == 'full':
+                    rows = conn.execute(FULL_QUERY).fetchall()
+                else:
+                    rows = conn.execute(INCREMENTAL_QUERY, (self.token,)).fetchall()
+                self._merge(rows, replace=mode == 'full')
+            conn.rollback()
+        finally:
+            conn.close()
+
+        self.token = token
+        self.order_count = order_count
+        self.last_refresh = mode
+        return mode
+
+    def _merge(self, rows, replace):
+        """Добавляет строки свертки из SQL к текущей (или заменяет ее)."""
+        if rows:
+            client_col, month, count, total, first, last = zip(*rows)
+        else:
+            client_col, month, count, total, first, last = (), (), (), (), (), ()
+        new_ids, new_client = np.unique(np.array(client_col, dtype=str), return_inverse=True)
+        new = {
+            'client': new_client.astype(np.int64),
+            'month': np.array(month, dtype=np.int64),
+            'count': np.array(count, dtype=np.int64),
+            'total': np.array(total, dtype=np.float64),
+            'first': np.array(first, dtype=np.float64),
+            'last': np.array(last, dtype=np.float64),
+        }
+
+        if replace or not len(self.client_ids):
+            self.client_ids = new_ids
+            grain = new
+        else:
+            # Индексы клиентов пересчитываются на объединенный список ID
+            client_ids = np.union1d(self.client_ids, new_ids)
+            old = dict(self.grain, client=np.searchsorted(client_ids, self.client_ids)[self.grain['client']])
+            new['client'] = np.searchsorted(client_ids, new_ids)[new['client']]
+            self.client_ids = client_ids
+            grain = {key: np.concatenate((old[key], new[key])) for key in old}
+
+        keys = ('client', 'month', 'count', 'total', 'first', 'last')
+        self.grain = dict(zip(keys, _reduce_grain(*(grain[key] for key in keys))))
+
+    def summary(self):
+        """
+        Агрегаты по клиентам в виде массивов NumPy.
+
+        Returns
+        -------
+        dict
+            ``client_id``, ``orders``, ``revenue``, ``first`` и ``last`` (юлианские дни
+            первого и последнего заказа) и ``first_month`` — массивы одинаковой длины.
+        """
+        grain = self.grain
+        if not len(grain['client']):
+            return {'client_id': self.client_ids[:0], 'orders': grain['count'], 'revenue': grain['total'],
+                    'first': grain['first'], 'last': grain['last'], 'first_month': grain['month']}
+        # Свертка отсортирована по клиенту, поэтому клиенты — непрерывные отрезки
+        starts = np.flatnonzero(np.r_[True, grain['client'][1:] != grain['client'][:-1]])
+        return {
+            'client_id': self.client_ids[grain['client'][starts]],
+            'orders': np.add.reduceat(grain['count'], starts),
+            'revenue': np.add.reduceat(grain['total'], starts),
+            'first': np.minimum.reduceat(grain['first'], starts),
+            'last': np.maximum.reduceat(grain['last'], starts),
+            'first_month': grain['month'][starts],
+        }
+
+    def rfm(self, as_of=None):
+        """
+        RFM-оценки всех клиентов с заказами.
+
+        Parameters
+        ----------
+        as_of : str, optional
+            Дата отсчета давности (``'YYYY-MM-DD'``). По умолчанию — день
+            после последнего заказа в базе.
+
+        Returns
+        -------
+        list of tuple
+            ``(client_id, recency_days, frequency, monetary, r, f, m)``,
+            отсортированные по убыванию суммы оценок.
+        """
+        self.refresh()
+        data = self.summary()
+        if not len(data['client_id']):
+            return []
+
+        if as_of is None:
+            reference = np.floor(data['last'].max() - 0.5) + 1.5
+        else:
+            reference = (np.datetime64(as_of, 's').astype(np.int64) / 86400) + UNIX_EPOCH_JD
+        recency = np.maximum(reference - data['last'], 0)
+        r = score(recency, higher_is_better=False)
+        f = score(data['orders'])
+        m = score(data['revenue'])
+
+        order = np.lexsort((-data['revenue'], -(r + f + m)))
+        return [(str(data['client_id'][i]), int(recency[i]), int(data['orders'][i]), float(data['revenue'][i]),
+                 int(r[i]), int(f[i]), int(m[i])) for i in order]
+
+    def cohort_retention(self):
+        """
+        Матрица месячного удержания когорт.
+
+        Когорта клиента — месяц его первого заказа. Элемент ``[i, k]`` — доля
+        клиентов когорты ``i``, сделавших заказ через ``k`` месяцев; для месяцев
+        позже последнего заказа в базе — ``nan``.
+
+        Returns
+        -------
+        tuple
+            ``(cohorts, sizes, matrix)``: метки когорт ``'YYYY-MM'``, размеры
+            когорт и матрица долей.
+        """
+        self.refresh()
+        grain = self.grain
+        if not len(grain['client']):
+            return [], np.zeros(0, dtype=np.int64), np.zeros((0, 0))
+
+        starts = np.flatnonzero(np.r_[True, grain['client'][1:] != grain['client'][:-1]])
+        first_month = np.repeat(grain['month'][starts], np.diff(np.r_[starts, len(grain['client'])]))
+
+        cohort_months, cohort = np.unique(first_month, return_inverse=True)
+        offset = grain['month'] - first_month
+        width = int(grain['month'].max() - cohort_months.min()) + 1
+        # Каждая строка свертки — один активный клиент в одном месяце
+        active = np.bincount(cohort * width + offset, minlength=len(cohort_months) * width)
+        active = active.reshape(len(cohort_months), width).astype(np.float64)
+
+        sizes = active[:, 0].astype(np.int64)
+        matrix = active / sizes[:, None]
+        observed = grain['month'].max() - cohort_months
+        matrix[np.arange(width)[None, :] > observed[:, None]] = np.nan
+        return [month_label(int(month)) for month in cohort_months], sizes, matrix
+
+    def lifetime_value(self):
+        """
+        Ценность клиентов за все время.
+
+        Returns
+        -------
+        list of tuple
+            ``(client_id, orders, revenue, avg_order_value, first_order, last_order,
+            lifetime_days)``, отсортированные по убыванию выручки.
+        """
+        self.refresh()
+        data = self.summary()
+        if not len(data['client_id']):
+            return []
+
+        average = data['revenue'] / data['orders']
+        lifetime = data['last'] - data['first']
+        first = julian_to_dates(data['first'])
+        last = julian_to_dates(data['last'])
+        order = np.argsort(-data['revenue'], kind='stable')
+        return [(str(data['client_id'][i]), int(data['orders'][i]), float(data['revenue'][i]), float(average[i]),
+                 str(first[i]), str(last[i]), float(lifetime[i])) for i in order]
@@ -1,19 +1,654 @@
 import sqlite3
+import bisect
+import collections
+import datetime
 import json
+import os
+import re
 import csv
+import functools
+import itertools
+import textwrap
+import threading
+import weakref
+import instrumentation
 from models import Client, Product, Order
 
+# Размер порции строк при потоковом чтении и записи
+CHUNK_SIZE = 5000
+
+# Таблицы с данными приложения
+TABLES = ('clients', 'products', 'orders', 'order_items')
+
+# Столбцы таблиц в порядке полей моделей (без служебного rowversion)
+TABLE_COLUMNS = {
+    'clients': ('id', 'name', 'email', 'phone', 'city', 'address'),
+    'products': ('id', 'name', 'price'),
+    'orders': ('id', 'client_id', 'total_amount', 'order_date'),
+    'order_items': ('order_id', 'product_id', 'quantity'),
+}
+
+# Столбцы, по которым строка идентифицируется в журнале удалений
+TABLE_KEYS = {
+    'clients': ('id',),
+    'products': ('id',),
+    'orders': ('id',),
+    'order_items': ('order_id', 'product_id'),
+}
+
+# Индексы, на которые опираются фильтры Database.find_orders
+ORDER_INDEXES = {
+    'idx_orders_client_date': 'orders (client_id, order_date)',
+    'idx_orders_date': 'orders (order_date)',
+    'idx_orders_amount': 'orders (total_amount)',
+    'idx_order_items_product': 'order_items (product_id, order_id)',
+}
+
+# Индексы для подбора клиентов и товаров по началу названия
+PREFIX_INDEXES = {
+    'idx_clients_name': 'clients (name)',
+    'idx_products_name': 'products (name)',
+}
+
+# Сколько вариантов возвращают suggest_clients и suggest_products по умолчанию
+SUGGEST_LIMIT = 20
+
+# Таблицы, которые читаются страницами get_page, и число параметров LIKE в их поиске
+SEARCH_FIELDS = {'clients': 5, 'products': 2, 'orders': 4}
+
+# Допустимые поля сортировки в find_orders
+ORDER_SORT_FIELDS = ('order_date', 'total_amount', 'id', 'client_id')
+
+# Префиксы генерируемых ID
+ID_PREFIXES = {'clients': 'CLT', 'products': 'PRD', 'orders': 'ORD'}
+
+# Виды изменений в ChangeEvent
+INSERTED = 'inserted'
+UPDATED = 'updated'
+DELETED = 'deleted'
+RELOADED = 'reloaded'  # таблица изменилась целиком (например, импорт из CSV)
+
+# Виды строк в выгрузке изменений
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+# Время начала и конца действия цены в истории цен: в том же формате, что и даты заказов
+PRICE_NOW = "strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')"
+
+# Размер кеша подготовленных запросов у долгоживущих соединений: в реестре
+# около 40 запросов, остальное — варианты find_orders и подбора по префиксу
+STATEMENT_CACHE_SIZE = 256
+
+
+def _table_statements(table_name):
+    """Типовые запросы таблицы; имена столбцов берутся из ``TABLE_COLUMNS``."""
+    columns = ', '.join(TABLE_COLUMNS[table_name])
+    placeholders = ', '.join('?' for _ in TABLE_COLUMNS[table_name])
+    statements = {
+        'all': f"SELECT {columns} FROM {table_name}",
+        'count': f"SELECT COUNT(*) FROM {table_name}",
+        'insert': f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})",
+    }
+    if TABLE_KEYS[table_name] == ('id',):
+        statements['by_id'] = f"SELECT {columns} FROM {table_name} WHERE id = ?"
+        # Список ID передается одним параметром-массивом JSON, поэтому текст запроса
+        # не зависит от количества ID и запрос берется из кеша
+        statements['by_ids'] = f"SELECT {columns} FROM {table_name} WHERE id IN (SELECT value FROM json_each(?))"
+        statements['delete'] = f"DELETE FROM {table_name} WHERE id = ?"
+        # Страница по ключу rowid (см. Database.get_page): rowid идет первым столбцом
+        statements['page'] = f"SELECT rowid, {columns} FROM {table_name} WHERE rowid > ? ORDER BY rowid LIMIT ?"
+    return {f"{table_name}.{kind}": sql for kind, sql in statements.items()}
+
+
+# Товары заказов с датой заказа: цена берется на эту дату (см. order_items_at_order_date)
+ORDER_ITEMS_SQL = '''
+    SELECT oi.order_id, p.id, p.name, p.price, oi.quantity, o.order_date
+    FROM order_items oi
+    JOIN products p ON p.id = oi.product_id
+    JOIN orders o ON o.id = oi.order_id
+'''
+
+# Реестр запросов: имя -> SQL. Запросы собираются один раз из белого списка
+# таблиц и столбцов, значения передаются только параметрами. Текст запроса
+# не меняется от вызова к вызову, поэтому на долгоживущем соединении
+# (Database.connection) он разбирается один раз и дальше берется из кеша.
+STATEMENTS = {
+    **{name: sql for table_name in TABLES for name, sql in _table_statements(table_name).items()},
+    'clients.search': "SELECT id, name, email, phone, city, address FROM clients "
+                      "WHERE name LIKE ? OR email LIKE ? OR phone LIKE ? OR city LIKE ? OR address LIKE ?",
+    'products.search': "SELECT id, name, price FROM products WHERE name LIKE ? OR id LIKE ?",
+    'orders.search': '''
+        SELECT o.id, o.client_id, o.total_amount, o.order_date FROM orders o
+        JOIN clients c ON o.client_id = c.id
+        WHERE c.name LIKE ? OR o.id LIKE ? OR o.order_date LIKE ? OR o.total_amount LIKE ?
+    ''',
+    # Страницы поиска по ключу rowid: параметры (after, LIKE..., limit)
+    'clients.search_page': "SELECT rowid, id, name, email, phone, city, address FROM clients "
+                           "WHERE rowid > ? AND (name LIKE ? OR email LIKE ? OR phone LIKE ? OR city LIKE ? "
+                           "OR address LIKE ?) ORDER BY rowid LIMIT ?",
+    'products.search_page': "SELECT rowid, id, name, price FROM products "
+                            "WHERE rowid > ? AND (name LIKE ? OR id LIKE ?) ORDER BY rowid LIMIT ?",
+    'orders.search_page': '''
+        SELECT o.rowid, o.id, o.client_id, o.total_amount, o.order_date FROM orders o
+        JOIN clients c ON o.client_id = c.id
+        WHERE o.rowid > ? AND (c.name LIKE ? OR o.id LIKE ? OR o.order_date LIKE ? OR o.total_amount LIKE ?)
+        ORDER BY o.rowid LIMIT ?
+    ''',
+    'order_items.delete_for_order': "DELETE FROM order_items WHERE order_id = ?",
+    'order_items.for_order': ORDER_ITEMS_SQL + " WHERE oi.order_id = ?",
+    'order_items.for_orders': ORDER_ITEMS_SQL + " WHERE oi.order_id IN (SELECT value FROM json_each(?))",
+    'analytics.top_clients': '''
+        SELECT c.id, c.name, COUNT(o.id) as order_count
+        FROM clients c
+        JOIN orders o ON c.id = o.client_id
+        GROUP BY c.id, c.name
+        ORDER BY order_count DESC
+        LIMIT ?
+    ''',
+    'analytics.orders_dynamics': '''
+        SELECT order_date, COUNT(id) as order_count, SUM(total_amount) as total_amount
+        FROM orders
+        GROUP BY order_date
+        ORDER BY order_date
+    ''',
+    'products.update': "UPDATE products SET name = ?, price = ? WHERE id = ?",
+    # История цен нескольких товаров по индексу (product_id, valid_from)
+    'product_prices.for_products': '''
+        SELECT product_id, valid_from, price FROM product_prices
+        WHERE product_id IN (SELECT value FROM json_each(?))
+        ORDER BY product_id, valid_from, id
+    ''',
+    'product_prices.history': '''
+        SELECT price, valid_from, valid_to FROM product_prices WHERE product_id = ? ORDER BY valid_from, id
+    ''',
+    'table_versions.all': "SELECT table_name, version FROM table_versions",
+    'sync_clock.version': "SELECT version FROM sync_clock",
+    'tombstones.prune': "DELETE FROM tombstones WHERE rowversion <= ?",
+}
+
+
+def statement(name):
+    """
+    Возвращает SQL запроса из реестра ``STATEMENTS``.
+
+    Raises
+    ------
+    ValueError
+        Если запроса с таким именем нет.
+    """
+    try:
+        return STATEMENTS[name]
+    except KeyError:
+        raise ValueError(f"Неизвестный запрос {name}") from None
+
+
+def table_statement(table_name, kind):
+    """
+    Возвращает типовой запрос таблицы (``'all'``, ``'count'``, ``'insert'``, ...).
+
+    Имя таблицы проверяется по белому списку ``TABLES``, поэтому его можно
+    принимать от пользователя.
+
+    Raises
+    ------
+    ValueError
+        Если таблица неизвестна или у нее нет такого запроса.
+    """
+    if table_name not in TABLES:
+        raise ValueError(f"Неизвестная таблица {table_name}")
+    return statement(f"{table_name}.{kind}")
+
+
+@functools.lru_cache(maxsize=None)
+def insert_statement(table_name, columns):
+    """
+    Возвращает INSERT для части столбцов таблицы (например, из заголовка CSV).
+
+    Parameters
+    ----------
+    table_name : str
+        Имя таблицы из ``TABLES``.
+    columns : tuple of str
+        Столбцы из ``TABLE_COLUMNS``.
+
+    Raises
+    ------
+    ValueError
+        Если таблица или столбцы неизвестны.
+    """
+    if table_name not in TABLES:
+        raise ValueError(f"Неизвестная таблица {table_name}")
+    unknown = [column for column in columns if column not in TABLE_COLUMNS[table_name]]
+    if unknown:
+        raise ValueError(f"Неизвестные столбцы таблицы {table_name}: {', '.join(unknown)}")
+    return f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+
+
+def prices_at(conn, items, history=None):
+    """
+    Возвращает цены товаров на заданные моменты времени.
+
+    История всех товаров пакета читается одним запросом по индексу
+    ``product_prices (product_id, valid_from)``, а цена на момент
+    находится двоичным поиском по началам интервалов, поэтому на каждую
+    позицию не нужен отдельный (коррелированный) подзапрос.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Соединение с базой.
+    items : iterable of tuple
+        ``(product_id, timestamp)``; время — строка ``'%Y-%m-%d %H:%M:%S'``,
+        как даты заказов (подходит и дата без времени).
+    history : dict, optional
+        Кеш истории между вызовами на одном снимке базы (например, по порциям
+        ``iter_orders``): история читается только для товаров, которых в нем нет.
+
+    Returns
+    -------
+    list
+        Цены в порядке ``items``. До начала истории действует первая
+        известная цена; для товаров без истории — None.
+    """
+    items = list(items)
+    if history is None:
+        history = {}
+    product_ids = [product_id for product_id in dict.fromkeys(product_id for product_id, _ in items)
+                   if product_id not in history]
+    if product_ids:
+        for product_id, valid_from, price in conn.execute(STATEMENTS['product_prices.for_products'],
+                                                          (json.dumps(product_ids),)):
+            starts, prices = history.setdefault(product_id, ([], []))
+            starts.append(valid_from)
+            prices.append(price)
+        # Товары без истории тоже запоминаются, чтобы не запрашивать их повторно
+        for product_id in product_ids:
+            history.setdefault(product_id, None)
+
+    result = []
+    for product_id, timestamp in items:
+        if history.get(product_id) is None:
+            result.append(None)
+            continue
+        starts, prices = history[product_id]
+        # Последний интервал, начавшийся не позже timestamp; при равных началах — более поздний
+        result.append(prices[max(bisect.bisect_right(starts, timestamp) - 1, 0)])
+    return result
+
+
+def order_items_at_order_date(conn, rows, history=None):
+    """
+    Товары заказов с ценами на дату заказа.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Соединение, на котором прочитаны ``rows``.
+    rows : iterable of tuple
+        Строки ``ORDER_ITEMS_SQL``.
+    history : dict, optional
+        Кеш истории цен (см. ``prices_at``).
+
+    Returns
+    -------
+    list of tuple
+        ``(order_id, product_id, name, price, quantity)``.
+    """
+    rows = list(rows)
+    prices = prices_at(conn, ((row[1], row[5]) for row in rows), history)
+    return [(order_id, product_id, name, current if price is None else price, quantity)
+            for (order_id, product_id, name, current, quantity, _), price in zip(rows, prices)]
+
+
+# Пробелы между элементами JSON и хвост буфера, которым может продолжаться число
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z')
+
+
+def iter_json_array(file, buffer_size=65536):
+    """
+    Потоково читает JSON-массив из файла и возвращает его элементы по одному.
+
+    Элементы разбираются с текущей позиции буфера; прочитанная часть
+    отбрасывается только при чтении следующего блока, поэтому время
+    разбора линейно по размеру файла.
+
+    Parameters
+    ----------
+    file : file object
+        Открытый текстовый файл, содержащий JSON-массив.
+    buffer_size : int
+        Размер блока чтения в символах.
+
+    Yields
+    ------
+    object
+        Очередной элемент массива.
+
+    Raises
+    ------
+    ValueError
+        Если содержимое файла не является JSON-массивом.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def refill():
+        nonlocal buffer, pos, eof
+        chunk = file.read(buffer_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def next_char():
+        """Пропускает пробелы и возвращает следующий символ ('' в конце файла)."""
+        nonlocal pos
+        while True:
+            pos = JSON_WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            refill()
+
+    if next_char() != '[':
+        raise ValueError("Ожидается JSON-массив")
+    pos += 1
+    if next_char() == ']':
+        return
+
+    while True:
+        while True:
+            if not eof and len(buffer) - pos < buffer_size // 2:
+                refill()
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                refill()
+                continue
+            # Число в конце буфера может быть прочитано не полностью ("4." из "4.5")
+            if not eof and NUMBER_TAIL.match(buffer, end):
+                refill()
+                continue
+            break
+        yield item
+        pos = end
+
+        char = next_char()
+        if char == ']':
+            return
+        if char != ',':
+            raise ValueError("Ожидается ',' или ']'" if char else "Неожиданный конец JSON-массива")
+        pos += 1
+        if next_char() == ']':
+            raise ValueError("Лишняя запятая перед ']'")
+
+
+class ChangeEvent:
+    """
+    Уведомление об изменении строки таблицы.
+
+    Attributes
+    ----------
+    table : str
+        Имя таблицы.
+    action : str
+        Одно из ``INSERTED``, ``UPDATED``, ``DELETED``, ``RELOADED``.
+    row_id : str or None
+        ID измененной строки (None для ``RELOADED``).
+    row : object or None
+        Новое состояние строки (``Client``, ``Product``, ``Order``) для вставки и обновления.
+    """
+
+    def __init__(self, table, action, row_id=None, row=None):
+        self.table = table
+        self.action = action
+        self.row_id = row_id
+        self.row = row
+
+    def __repr__(self):
+        return f"ChangeEvent({self.table!r}, {self.action!r}, {self.row_id!r})"
+
+
+class OrderItemsCache:
+    """
+    Кеш товаров заказов по ID заказа.
+
+    Товары подгружаются пачками (``prefetch``) одним запросом, поэтому детали
+    уже просмотренных или видимых заказов открываются без обращения к базе.
+    Кеш подписывается на уведомления ``Database`` и сбрасывает записи
+    измененных и удаленных заказов; изменение товаров сбрасывает кеш целиком,
+    так как в записях хранятся названия и цены.
+
+    Parameters
+    ----------
+    db : Database
+        База данных.
+    max_orders : int
+        Сколько заказов хранить; давно не использованные вытесняются.
+    """
+
+    def __init__(self, db, max_orders=5000):
+        self.db = db
+        self.max_orders = max_orders
+        self.items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        db.subscribe(self.on_db_change)
+
+    def get(self, order_id):
+        """Возвращает товары заказа ``[(product_id, name, price, quantity), ...]``."""
+        if order_id in self.items:
+            self.hits += 1
+            self.items.move_to_end(order_id)
+            return self.items[order_id]
+        self.misses += 1
+        self.prefetch([order_id])
+        return self.items.get(order_id, [])
+
+    def prefetch(self, order_ids):
+        """Загружает товары заказов, которых еще нет в кеше, одним пакетным запросом."""
+        missing = [order_id for order_id in dict.fromkeys(order_ids) if order_id not in self.items]
+        if not missing:
+            return 0
+        self.items.update(self.db.get_order_items_batch(missing))
+        while len(self.items) > self.max_orders:
+            self.items.popitem(last=False)
+        return len(missing)
+
+    def clear(self):
+        """Очищает кеш."""
+        self.items.clear()
+
+    def on_db_change(self, event):
+        """Сбрасывает устаревшие записи по уведомлению ``Database``."""
+        if event.table in ('orders', 'order_items'):
+            if event.action == RELOADED or event.row_id is None:
+                self.clear()
+            else:
+                self.items.pop(event.row_id, None)
+        elif event.table == 'products' and event.action != INSERTED:
+            self.clear()
+
+
+class _ThreadConnection:
+    """Долгоживущее соединение потока; хранится в ``threading.local`` и удаляется вместе с потоком."""
+
+    __slots__ = ('conn', 'generation', '__weakref__')
+
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+
+
+def _release_connection(db_ref, conn):
+    """Убирает соединение завершившегося потока из ``Database._connections`` и закрывает его."""
+    db = db_ref()
+    if db is not None:
+        with db._connections_lock:
+            if conn in db._connections:
+                db._connections.remove(conn)
+    conn.close()
+
 
 class Database:
     """Класс для работы с базой данных SQLite."""
 
-    def __init__(self, db_name="database.db"):
+    # Методы, которые не оборачиваются при инструментировании
+    NOT_INSTRUMENTED = ('get_connection', 'connection', 'close', 'init_db', 'enable_instrumentation',
+                        'disable_instrumentation', 'stats', 'reset_stats', 'subscribe', 'unsubscribe', 'notify',
+                        'build_orders_query', 'build_suggest_query', 'iter_clients', 'iter_products', 'iter_orders')
+
+    def __init__(self, db_name="database.db", instrument=False, slow_query_ms=100):
         self.db_name = db_name
+        self.instrumentation = None
+        self.listeners = []
+        # Долгоживущие соединения потоков (см. connection)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._generation = 0
         self.init_db()
+        if instrument:
+            self.enable_instrumentation(slow_query_ms)
+
+    def _connect(self, **kwargs):
+        if self.instrumentation is None:
+            return sqlite3.connect(self.db_name, **kwargs)
+        return instrumentation.connect(self.db_name, self.instrumentation, **kwargs)
 
     def get_connection(self):
-        """Создает и возвращает соединение с базой данных."""
-        return sqlite3.connect(self.db_name)
+        """
+        Создает и возвращает новое соединение с базой данных.
+
+        Используется для долгих операций и транзакций (импорт, экспорт,
+        согласованное чтение нескольких таблиц); вызывающий код закрывает его сам.
+        """
+        return self._connect()
+
+    def connection(self):
+        """
+        Возвращает долгоживущее соединение текущего потока.
+
+        Соединение создается при первом обращении из потока и переиспользуется
+        следующими вызовами вместе с кешем подготовленных запросов
+        (``STATEMENT_CACHE_SIZE``), поэтому частые запросы из ``STATEMENTS``
+        не разбираются заново. Закрывать его не нужно; изменения фиксируются
+        блоком ``with conn:``. Соединение закрывается, когда поток завершается.
+        """
+        holder = getattr(self._local, 'holder', None)
+        if holder is None or holder.generation != self._generation:
+            conn = self._connect(cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+            holder = _ThreadConnection(conn, self._generation)
+            weakref.finalize(holder, _release_connection, weakref.ref(self), conn)
+            self._local.holder = holder
+            with self._connections_lock:
+                self._connections.append(conn)
+        return holder.conn
+
+    def close(self):
+        """
+        Закрывает долгоживущие соединения всех потоков.
+
+        Следующий вызов методов откроет новые. Вызывается, когда база больше
+        не используется другими потоками.
+        """
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            conn.close()
+
+    def _fetch(self, sql, params=()):
+        """Выполняет запрос на соединении текущего потока и возвращает все строки."""
+        return self.connection().execute(sql, params).fetchall()
+
+    # Уведомления об изменениях
+    def subscribe(self, listener):
+        """
+        Подписывает обработчик на изменения данных.
+
+        Обработчик вызывается с ``ChangeEvent`` после фиксации транзакции
+        в том же потоке, в котором выполнялось изменение.
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        """Отписывает обработчик от изменений данных."""
+        self.listeners.remove(listener)
+
+    def notify(self, table, action, row_id=None, row=None):
+        """Рассылает ``ChangeEvent`` всем подписчикам."""
+        if not self.listeners:
+            return
+        event = ChangeEvent(table, action, row_id, row)
+        for listener in list(self.listeners):
+            listener(event)
+
+    def get_next_id(self, table_name):
+        """Генерирует ID для новой записи таблицы (``CLT004``, ``PRD012`` и т.п.)."""
+        if table_name not in ID_PREFIXES:
+            raise ValueError(f"Для таблицы {table_name} ID не генерируются")
+        count = self._fetch(table_statement(table_name, 'count'))[0][0]
+        return f"{ID_PREFIXES[table_name]}{count + 1:03d}"
+
+    # Методы для диагностики производительности
+    def enable_instrumentation(self, slow_query_ms=100):
+        """
+        Включает сбор статистики по методам и SQL-запросам.
+
+        Parameters
+        ----------
+        slow_query_ms : float
+            Порог в миллисекундах, начиная с которого запрос попадает
+            в журнал медленных запросов вместе с ``EXPLAIN QUERY PLAN``.
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.slow_query_ms = slow_query_ms
+            return
+
+        self.instrumentation = instrumentation.Instrumentation(slow_query_ms)
+        # Открытые соединения не собирают статистику, поэтому создаются заново
+        self.close()
+        for name in dir(type(self)):
+            method = getattr(self, name)
+            if name.startswith('_') or name in self.NOT_INSTRUMENTED or not callable(method):
+                continue
+            # Обертка ставится на экземпляр, поэтому без инструментирования вызовы не замедляются
+            setattr(self, name, instrumentation.wrap_method(self.instrumentation, name, method))
+
+    def disable_instrumentation(self):
+        """Выключает сбор статистики и снимает обертки методов."""
+        if self.instrumentation is None:
+            return
+        for name, value in list(vars(self).items()):
+            if callable(value) and hasattr(value, '__wrapped__'):
+                delattr(self, name)
+        self.instrumentation = None
+        self.close()
+
+    def stats(self):
+        """
+        Возвращает собранную статистику.
+
+        Returns
+        -------
+        dict
+            Ключи ``methods`` и ``statements`` содержат гистограммы задержек,
+            ``traced`` — количество инструкций SQLite по данным трассировки,
+            ``slow_queries`` — журнал медленных запросов с планами выполнения.
+        """
+        if self.instrumentation is None:
+            return {'enabled': False, 'methods': {}, 'statements': {}, 'traced': {}, 'slow_queries': []}
+        return self.instrumentation.as_dict()
+
+    def reset_stats(self):
+        """Очищает собранную статистику, не выключая инструментирование."""
+        if self.instrumentation is not None:
+            self.instrumentation.reset()
 
     def init_db(self):
         """Инициализирует таблицы в базе данных."""
@@ -62,304 +697,1019 @@ class Database:
                 FOREIGN KEY (product_id) REFERENCES products (id)
             )
         ''')
+        # Товары заказа выбираются по order_id (детали заказа, анализ корзины)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)")
+
+        # Индексы для фильтров find_orders и подбора по началу названия
+        for name, definition in {**ORDER_INDEXES, **PREFIX_INDEXES}.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+        # Версии таблиц: увеличиваются триггерами при каждом изменении строк
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        for table_name in TABLES:
+            cursor.execute("INSERT OR IGNORE INTO table_versions (table_name) VALUES (?)", (table_name,))
+            for operation in ('INSERT', 'UPDATE', 'DELETE'):
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table_name}_version_{operation.lower()}
+                    AFTER {operation} ON {table_name}
+                    BEGIN
+                        UPDATE table_versions SET version = version + 1 WHERE table_name = '{table_name}';
+                    END
+                ''')
+
+        self._init_change_tracking(cursor)
+        self._init_price_history(cursor)
+
+        # Сохраненные раскладки графов (см. layout.LayoutCache)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS graph_layouts (
+                graph TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                algorithm TEXT NOT NULL,
+                positions TEXT NOT NULL
+            )
+        ''')
 
         conn.commit()
         conn.close()
 
-    # Методы для работы с клиентами
-    def add_client(self, client):
-        """Добавляет клиента в базу данных."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _init_change_tracking(self, cursor):
+        """
+        Создает служебные объекты для выгрузки изменений (``export_changes``).
+
+        - ``sync_clock`` — общий для всех таблиц счетчик изменений;
+        - столбец ``rowversion`` в каждой таблице — значение счетчика
+          на момент последней вставки или изменения строки;
+        - ``tombstones`` — ключи удаленных строк со значением счетчика.
+
+        Значения проставляются триггерами, поэтому учитываются изменения
+        из любых соединений, в том числе конвейера импорта и API.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_clock (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO sync_clock (id) VALUES (1)")
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tombstones (
+                table_name TEXT NOT NULL,
+                key1 TEXT NOT NULL,
+                key2 TEXT,
+                rowversion INTEGER NOT NULL
+            )
+        ''')
         cursor.execute(
-            "INSERT INTO clients VALUES (?, ?, ?, ?, ?, ?)",
-            (client.id, client.name, client.email, client.phone, client.city, client.address)
+            "CREATE INDEX IF NOT EXISTS idx_tombstones_version ON tombstones (table_name, rowversion)"
         )
-        conn.commit()
-        conn.close()
 
-    def get_clients(self, search_term=""):
-        """Возвращает всех клиентов с возможностью фильтрации."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        if search_term:
+        for table_name in TABLES:
+            # Базы, созданные до появления выгрузки изменений, получают столбец при открытии;
+            # существующие строки имеют rowversion = 0 и попадают только в полную выгрузку
+            columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table_name})")]
+            if 'rowversion' not in columns:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN rowversion INTEGER NOT NULL DEFAULT 0")
             cursor.execute(
-                "SELECT * FROM clients WHERE name LIKE ? OR email LIKE ? OR phone LIKE ? OR city LIKE ? OR address LIKE ?",
-                (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%", f"%{search_term}%", f"%{search_term}%")
+                f"CREATE INDEX IF NOT EXISTS idx_{table_name}_rowversion ON {table_name} (rowversion)"
             )
-        else:
-            cursor.execute("SELECT * FROM clients")
 
-        clients = [Client(*row) for row in cursor.fetchall()]
-        conn.close()
-        return clients
+            stamp = f'''
+                UPDATE sync_clock SET version = version + 1;
+                UPDATE {table_name} SET rowversion = (SELECT version FROM sync_clock) WHERE rowid = NEW.rowid;
+            '''
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table_name}_rowversion_insert
+                AFTER INSERT ON {table_name}
+                BEGIN {stamp} END
+            ''')
+            # Срабатывает только на столбцы данных, иначе триггер вызывал бы сам себя
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table_name}_rowversion_update
+                AFTER UPDATE OF {', '.join(TABLE_COLUMNS[table_name])} ON {table_name}
+                BEGIN {stamp} END
+            ''')
+
+            keys = TABLE_KEYS[table_name]
+            key2 = f"OLD.{keys[1]}" if len(keys) > 1 else "NULL"
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table_name}_tombstone
+                AFTER DELETE ON {table_name}
+                BEGIN
+                    UPDATE sync_clock SET version = version + 1;
+                    INSERT INTO tombstones (table_name, key1, key2, rowversion)
+                    VALUES ('{table_name}', OLD.{keys[0]}, {key2}, (SELECT version FROM sync_clock));
+                END
+            ''')
+
+    def _init_price_history(self, cursor):
+        """
+        Создает историю цен ``product_prices``.
+
+        Каждая строка — цена товара в интервале ``[valid_from, valid_to)``,
+        у действующей цены ``valid_to`` пуст. Интервалы ведут триггеры на
+        ``products``, поэтому история пополняется при изменениях из любых
+        соединений. Товары, добавленные до появления истории, получают
+        начальную цену при создании таблицы.
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_prices'"
+        ).fetchone()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS product_prices (
+                id INTEGER PRIMARY KEY,
+                product_id TEXT NOT NULL,
+                price REAL NOT NULL,
+                valid_from TEXT NOT NULL,
+                valid_to TEXT
+            )
+        ''')
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_product_prices_product ON product_prices (product_id, valid_from)"
+        )
+        if not exists:
+            cursor.execute(f"INSERT INTO product_prices (product_id, price, valid_from) "
+                           f"SELECT id, price, {PRICE_NOW} FROM products")
+
+        close = f"UPDATE product_prices SET valid_to = {PRICE_NOW} WHERE product_id = OLD.id AND valid_to IS NULL;"
+        start = f"INSERT INTO product_prices (product_id, price, valid_from) VALUES (NEW.id, NEW.price, {PRICE_NOW});"
+        triggers = {
+            'products_price_insert': ('AFTER INSERT ON products', '', close.replace('OLD.', 'NEW.') + start),
+            'products_price_update': ('AFTER UPDATE OF id, price ON products',
+                                      'WHEN NEW.price IS NOT OLD.price OR NEW.id IS NOT OLD.id', close + start),
+            'products_price_delete': ('AFTER DELETE ON products', '', close),
+        }
+        for name, (event, condition, body) in triggers.items():
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} {condition} BEGIN {body} END")
+
+    # Методы для работы с клиентами
+    def add_client(self, client):
+        """Добавляет клиента в базу данных."""
+        conn = self.connection()
+        with conn:
+            conn.execute(STATEMENTS['clients.insert'],
+                         (client.id, client.name, client.email, client.phone, client.city, client.address))
+        self.notify('clients', INSERTED, client.id, client)
+
+    @staticmethod
+    def _paged(sql, params, limit, offset):
+        """Добавляет к запросу ``LIMIT``/``OFFSET``, если задана страница."""
+        if limit is None and not offset:
+            return sql, params
+        return sql + " LIMIT ? OFFSET ?", (*params, -1 if limit is None else int(limit), int(offset))
+
+    def get_clients(self, search_term="", limit=None, offset=0):
+        """
+        Возвращает всех клиентов с возможностью фильтрации.
+
+        ``limit`` и ``offset`` выбирают страницу результата (например, первую
+        страницу таблицы при запуске приложения).
+        """
+        if search_term:
+            sql, params = STATEMENTS['clients.search'], (f"%{search_term}%",) * 5
+        else:
+            sql, params = STATEMENTS['clients.all'], ()
+        rows = self._fetch(*self._paged(sql, params, limit, offset))
+        return [Client(*row) for row in rows]
 
     def delete_client(self, client_id):
         """Удаляет клиента по ID."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM clients WHERE id=?", (client_id,))
-        conn.commit()
-        conn.close()
+        conn = self.connection()
+        with conn:
+            conn.execute(STATEMENTS['clients.delete'], (client_id,))
+        self.notify('clients', DELETED, client_id)
 
     # Методы для работы с товарами
     def add_product(self, product):
         """Добавляет товар в базу данных."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO products VALUES (?, ?, ?)",
-            (product.id, product.name, product.price)
-        )
-        conn.commit()
-        conn.close()
-
-    def get_products(self, search_term=""):
-        """Возвращает все товары с возможностью фильтрации."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        conn = self.connection()
+        with conn:
+            conn.execute(STATEMENTS['products.insert'], (product.id, product.name, product.price))
+        self.notify('products', INSERTED, product.id, product)
 
+    def get_products(self, search_term="", limit=None, offset=0):
+        """Возвращает все товары с возможностью фильтрации (страницу при заданных ``limit``/``offset``)."""
         if search_term:
-            cursor.execute(
-                "SELECT * FROM products WHERE name LIKE ? OR id LIKE ?",
-                (f"%{search_term}%", f"%{search_term}%")
-            )
+            sql, params = STATEMENTS['products.search'], (f"%{search_term}%",) * 2
         else:
-            cursor.execute("SELECT * FROM products")
-
-        products = [Product(*row) for row in cursor.fetchall()]
-        conn.close()
-        return products
+            sql, params = STATEMENTS['products.all'], ()
+        rows = self._fetch(*self._paged(sql, params, limit, offset))
+        return [Product(*row) for row in rows]
+
+    @staticmethod
+    def build_suggest_query(table_name, prefix, limit):
+        """
+        Собирает запрос подбора записей по началу ID или названия (см. ``_suggest``).
+
+        Вместо ``LIKE 'prefix%'`` используется диапазон ``name >= prefix AND name < prefix + U+10FFFF``:
+        он выполняется по индексу при любом алфавите. Название проверяется
+        как введено, с заглавной первой буквой и с заглавными буквами слов,
+        ID — в верхнем регистре.
+
+        Returns
+        -------
+        tuple
+            ``(sql, params)``.
+        """
+        columns = ', '.join(TABLE_COLUMNS[table_name])
+        if not prefix:
+            return f"SELECT {columns} FROM {table_name} ORDER BY name LIMIT ?", (limit,)
+
+        variants = dict.fromkeys([
+            ('id', prefix.upper()),
+            ('name', prefix),
+            ('name', prefix[:1].upper() + prefix[1:]),
+            ('name', prefix.title()),
+        ])
+        parts = []
+        params = []
+        for column, value in variants:
+            # Каждая часть берет не больше limit строк по своему индексу
+            parts.append(f"SELECT * FROM (SELECT {columns} FROM {table_name} "
+                         f"WHERE {column} >= ? AND {column} < ? ORDER BY {column} LIMIT ?)")
+            params.extend((value, value + '\U0010ffff', limit))
+        params.append(limit)
+        return " UNION ".join(parts) + " ORDER BY name, id LIMIT ?", params
+
+    def _suggest(self, table_name, prefix, limit):
+        """Подбирает записи по началу ID или названия."""
+        return self._fetch(*self.build_suggest_query(table_name, prefix, limit))
+
+    def suggest_clients(self, prefix, limit=SUGGEST_LIMIT):
+        """
+        Возвращает до ``limit`` клиентов, у которых ID или имя начинается с ``prefix``.
+
+        Для пустого ``prefix`` возвращаются первые клиенты по имени.
+        """
+        return [Client(*row) for row in self._suggest('clients', prefix, limit)]
+
+    def suggest_products(self, prefix, limit=SUGGEST_LIMIT):
+        """
+        Возвращает до ``limit`` товаров, у которых ID или название начинается с ``prefix``.
+
+        Для пустого ``prefix`` возвращаются первые товары по названию.
+        """
+        return [Product(*row) for row in self._suggest('products', prefix, limit)]
+
+    def _get_by_ids(self, table_name, model, ids):
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return {}
+        rows = self._fetch(STATEMENTS[f'{table_name}.by_ids'], (json.dumps(ids),))
+        return {row[0]: model(*row) for row in rows}
+
+    def get_clients_by_ids(self, client_ids):
+        """
+        Возвращает клиентов с указанными ID.
+
+        Returns
+        -------
+        dict
+            ID клиента -> ``Client`` (отсутствующие в базе ID пропускаются).
+        """
+        return self._get_by_ids('clients', Client, client_ids)
+
+    def get_products_by_ids(self, product_ids):
+        """
+        Возвращает товары с указанными ID.
+
+        Returns
+        -------
+        dict
+            ID товара -> ``Product`` (отсутствующие в базе ID пропускаются).
+        """
+        return self._get_by_ids('products', Product, product_ids)
+
+    def update_product(self, product):
+        """
+        Изменяет название и цену товара.
+
+        Прежняя цена остается в истории цен (``get_price_history``), поэтому
+        товары старых заказов по-прежнему показываются по цене на дату заказа.
+
+        Raises
+        ------
+        ValueError
+            Если товара нет.
+        """
+        conn = self.connection()
+        with conn:
+            cursor = conn.execute(STATEMENTS['products.update'], (product.name, product.price, product.id))
+        if not cursor.rowcount:
+            raise ValueError(f"Товар {product.id} не найден")
+        self.notify('products', UPDATED, product.id, product)
+
+    def get_price_history(self, product_id):
+        """
+        Возвращает историю цен товара ``[(price, valid_from, valid_to), ...]``.
+
+        ``valid_to`` — None у действующей цены.
+        """
+        return self._fetch(STATEMENTS['product_prices.history'], (product_id,))
+
+    def get_prices_at(self, items):
+        """Возвращает цены товаров на моменты времени ``[(product_id, timestamp), ...]`` (см. ``prices_at``)."""
+        return prices_at(self.connection(), items)
 
     def delete_product(self, product_id):
         """Удаляет товар по ID."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM products WHERE id=?", (product_id,))
-        conn.commit()
-        conn.close()
+        conn = self.connection()
+        with conn:
+            conn.execute(STATEMENTS['products.delete'], (product_id,))
+        self.notify('products', DELETED, product_id)
 
     # Методы для работы с заказами
     def add_order(self, order):
         """Добавляет заказ в базу данных."""
+        conn = self.connection()
+        with conn:
+            # Добавляем заказ
+            conn.execute(STATEMENTS['orders.insert'], (order.id, order.client_id, order.total_amount, order.order_date))
+            # Добавляем товары заказа
+            conn.executemany(STATEMENTS['order_items.insert'],
+                             [(order.id, product_id, quantity) for product_id, quantity in order.items])
+        self.notify('orders', INSERTED, order.id, order)
+
+    def get_orders(self, search_term="", limit=None, offset=0):
+        """Возвращает все заказы с возможностью фильтрации (страницу при заданных ``limit``/``offset``)."""
+        if search_term:
+            sql, params = STATEMENTS['orders.search'], (f"%{search_term}%",) * 4
+        else:
+            sql, params = STATEMENTS['orders.all'], ()
+        rows = self._fetch(*self._paged(sql, params, limit, offset))
+
+        # Товары всех заказов загружаются одним запросом
+        items = self.get_order_items_batch([row[0] for row in rows])
+        return [Order(*row, items[row[0]]) for row in rows]
+
+    def get_page(self, table_name, search_term="", after=0, limit=CHUNK_SIZE):
+        """
+        Возвращает страницу записей таблицы по ключу ``rowid`` (keyset-пагинация).
+
+        Страница начинается сразу после строки ``after``, поэтому каждая
+        страница читает не больше ``limit`` строк, а страницы идут подряд
+        в порядке ``rowid`` без пропусков и повторов, даже если между ними
+        база изменилась. Каждая страница читается отдельным запросом без
+        открытой транзакции между ними.
+
+        Parameters
+        ----------
+        table_name : str
+            ``'clients'``, ``'products'`` или ``'orders'``.
+        search_term : str
+            Строка поиска (как в ``get_clients``, ``get_products``, ``get_orders``).
+        after : int
+            ``rowid`` последней записи предыдущей страницы; 0 — первая страница.
+        limit : int
+            Размер страницы.
+
+        Returns
+        -------
+        tuple
+            ``(records, last)``: записи страницы и ``rowid`` последней из них
+            (``after`` следующей страницы) или ``None``, если страница неполная и дальше записей нет.
+
+        Raises
+        ------
+        ValueError
+            Если таблица не читается страницами.
+        """
+        if table_name not in SEARCH_FIELDS:
+            raise ValueError(f"Неизвестная таблица {table_name}")
+        limit = int(limit)
+        if search_term:
+            sql = STATEMENTS[f'{table_name}.search_page']
+            params = (after, *(f"%{search_term}%",) * SEARCH_FIELDS[table_name], limit)
+        else:
+            sql, params = STATEMENTS[f'{table_name}.page'], (after, limit)
+        rows = self._fetch(sql, params)
+        last = rows[-1][0] if len(rows) == limit else None
+        rows = [row[1:] for row in rows]
+        if table_name == 'clients':
+            return [Client(*row) for row in rows], last
+        if table_name == 'products':
+            return [Product(*row) for row in rows], last
+        items = self.get_order_items_batch([row[0] for row in rows])
+        return [Order(*row, items[row[0]]) for row in rows], last
+
+    # Потоковое чтение: объекты создаются порциями, таблица целиком в память не загружается
+    def _stream(self, sql, params, chunk_size, build):
+        """
+        Читает строки запроса порциями по ``chunk_size`` через ``fetchmany``.
+
+        Чтение идет на отдельном соединении в одной транзакции, поэтому все
+        порции берутся из одного снимка базы. ``build(conn, rows)`` превращает
+        порцию строк в объекты. Соединение открывается при первом обращении
+        к генератору и закрывается, когда он исчерпан или закрыт (``close()``
+        или сборка мусора).
+        """
+        if chunk_size < 1:
+            raise ValueError("Размер порции должен быть положительным")
+        return self._stream_chunks(sql, params, chunk_size, build)
+
+    def _stream_chunks(self, sql, params, chunk_size, build):
         conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Добавляем заказ
-        cursor.execute(
-            "INSERT INTO orders VALUES (?, ?, ?, ?)",
-            (order.id, order.client_id, order.total_amount, order.order_date)
-        )
-
-        # Добавляем товары заказа
-        for product_id, quantity in order.items:
-            cursor.execute(
-                "INSERT INTO order_items VALUES (?, ?, ?)",
-                (order.id, product_id, quantity)
-            )
+        try:
+            conn.execute("BEGIN")
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from build(conn, rows)
+        finally:
+            conn.close()
+
+    def iter_clients(self, search_term="", chunk_size=CHUNK_SIZE):
+        """Перебирает клиентов (как ``get_clients``), читая их порциями по ``chunk_size``."""
+        if search_term:
+            sql, params = STATEMENTS['clients.search'], (f"%{search_term}%",) * 5
+        else:
+            sql, params = STATEMENTS['clients.all'], ()
+        return self._stream(sql, params, chunk_size, lambda conn, rows: (Client(*row) for row in rows))
 
-        conn.commit()
-        conn.close()
+    def iter_products(self, search_term="", chunk_size=CHUNK_SIZE):
+        """Перебирает товары (как ``get_products``), читая их порциями по ``chunk_size``."""
+        if search_term:
+            sql, params = STATEMENTS['products.search'], (f"%{search_term}%",) * 2
+        else:
+            sql, params = STATEMENTS['products.all'], ()
+        return self._stream(sql, params, chunk_size, lambda conn, rows: (Product(*row) for row in rows))
 
-    def get_orders(self, search_term=""):
-        """Возвращает все заказы с возможностью фильтрации."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def iter_orders(self, search_term="", chunk_size=CHUNK_SIZE):
+        """
+        Перебирает заказы с товарами (как ``get_orders``), читая их порциями по ``chunk_size``.
 
+        Товары каждой порции заказов загружаются одним запросом из того же снимка базы.
+        """
         if search_term:
-            cursor.execute('''
-                SELECT o.* FROM orders o
-                JOIN clients c ON o.client_id = c.id
-                WHERE c.name LIKE ? OR o.id LIKE ? OR o.order_date LIKE ? OR o.total_amount LIKE ?
-            ''', (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"))
+            sql, params = STATEMENTS['orders.search'], (f"%{search_term}%",) * 4
         else:
-            cursor.execute("SELECT * FROM orders")
-
-        orders = []
-        for row in cursor.fetchall():
-            order_id = row[0]
-            # Получаем товары для этого заказа
-            cursor.execute('''
-                SELECT p.id, p.name, p.price, oi.quantity 
-                FROM products p
-                JOIN order_items oi ON p.id = oi.product_id
-                WHERE oi.order_id = ?
-            ''', (order_id,))
-            items = cursor.fetchall()
-            orders.append(Order(row[0], row[1], row[2], row[3], items))
-
-        conn.close()
-        return orders
+            sql, params = STATEMENTS['orders.all'], ()
+
+        # Все порции читаются из одного снимка, поэтому история цен загружается один раз
+        history = {}
+
+        def build(conn, rows):
+            items = {row[0]: [] for row in rows}
+            for item in order_items_at_order_date(
+                    conn, conn.execute(STATEMENTS['order_items.for_orders'], (json.dumps(list(items)),)), history):
+                items[item[0]].append(item[1:])
+            return (Order(*row, items[row[0]]) for row in rows)
+        return self._stream(sql, params, chunk_size, build)
+
+    @staticmethod
+    def build_orders_query(client_id=None, date_from=None, date_to=None, min_amount=None, max_amount=None,
+                           product_id=None, sort='order_date', descending=False, limit=None):
+        """
+        Собирает запрос ``find_orders``.
+
+        Каждому фильтру соответствует условие, которое SQLite может выполнить
+        по индексу из ``ORDER_INDEXES``: сравнения идут со столбцами без
+        преобразований, товар проверяется через ``order_items (product_id, order_id)``.
+
+        Returns
+        -------
+        tuple
+            ``(sql, params)``.
+
+        Raises
+        ------
+        ValueError
+            Если поле сортировки неизвестно или дата задана неверно.
+        """
+        if sort not in ORDER_SORT_FIELDS:
+            raise ValueError(f"Неизвестное поле сортировки {sort}, ожидается одно из {', '.join(ORDER_SORT_FIELDS)}")
+
+        conditions = []
+        params = []
+        if client_id:
+            conditions.append("client_id = ?")
+            params.append(client_id)
+        if date_from:
+            datetime.date.fromisoformat(date_from[:10])  # проверка формата, ValueError при ошибке
+            conditions.append("order_date >= ?")
+            params.append(date_from)
+        if date_to:
+            if len(date_to) == 10:
+                # Дата без времени включает весь день
+                conditions.append("order_date < ?")
+                params.append((datetime.date.fromisoformat(date_to) + datetime.timedelta(days=1)).isoformat())
+            else:
+                datetime.date.fromisoformat(date_to[:10])  # проверка формата, ValueError при ошибке
+                conditions.append("order_date <= ?")
+                params.append(date_to)
+        if min_amount is not None:
+            conditions.append("total_amount >= ?")
+            params.append(float(min_amount))
+        if max_amount is not None:
+            conditions.append("total_amount <= ?")
+            params.append(float(max_amount))
+        if product_id:
+            conditions.append("id IN (SELECT order_id FROM order_items WHERE product_id = ?)")
+            params.append(product_id)
+
+        sql = "SELECT id, client_id, total_amount, order_date FROM orders"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {sort}{' DESC' if descending else ''}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return sql, params
+
+    def find_orders(self, client_id=None, date_from=None, date_to=None, min_amount=None, max_amount=None,
+                    product_id=None, sort='order_date', descending=False, limit=None):
+        """
+        Возвращает заказы по структурированным фильтрам.
+
+        В отличие от ``get_orders`` товары заказов не загружаются.
+
+        Parameters
+        ----------
+        client_id : str, optional
+            ID клиента.
+        date_from, date_to : str, optional
+            Границы периода ``'YYYY-MM-DD'`` или ``'YYYY-MM-DD HH:MM:SS'``, включительно.
+        min_amount, max_amount : float, optional
+            Границы суммы заказа, включительно.
+        product_id : str, optional
+            Только заказы с этим товаром.
+        sort : str
+            Поле сортировки из ``ORDER_SORT_FIELDS``.
+        descending : bool
+            Сортировка по убыванию.
+        limit : int, optional
+            Максимальное количество заказов.
+
+        Returns
+        -------
+        list of Order
+        """
+        sql, params = self.build_orders_query(client_id, date_from, date_to, min_amount, max_amount, product_id,
+                                              sort, descending, limit)
+        return [Order(*row) for row in self._fetch(sql, params)]
 
     def delete_order(self, order_id):
         """Удаляет заказ по ID."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Сначала удаляем связанные товары
-        cursor.execute("DELETE FROM order_items WHERE order_id=?", (order_id,))
-        # Затем удаляем заказ
-        cursor.execute("DELETE FROM orders WHERE id=?", (order_id,))
-
-        conn.commit()
-        conn.close()
+        conn = self.connection()
+        with conn:
+            # Сначала удаляем связанные товары
+            conn.execute(STATEMENTS['order_items.delete_for_order'], (order_id,))
+            # Затем удаляем заказ
+            conn.execute(STATEMENTS['orders.delete'], (order_id,))
+        self.notify('orders', DELETED, order_id)
 
     def get_order_items(self, order_id):
-        """Возвращает товары для конкретного заказа."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT p.id, p.name, p.price, oi.quantity 
-            FROM products p
-            JOIN order_items oi ON p.id = oi.product_id
-            WHERE oi.order_id = ?
-        ''', (order_id,))
-
-        items = cursor.fetchall()
-        conn.close()
-        return items
+        """Возвращает товары заказа ``[(product_id, name, price, quantity), ...]`` с ценами на дату заказа."""
+        conn = self.connection()
+        rows = conn.execute(STATEMENTS['order_items.for_order'], (order_id,))
+        return [row[1:] for row in order_items_at_order_date(conn, rows)]
+
+    def get_order_items_batch(self, order_ids):
+        """
+        Возвращает товары нескольких заказов.
+
+        Выполняется один запрос по индексу ``order_items (order_id)``; ID
+        передаются одним параметром-массивом JSON.
+
+        Returns
+        -------
+        dict
+            ID заказа -> список ``(product_id, name, price, quantity)``, как у ``get_order_items``.
+        """
+        result = {order_id: [] for order_id in order_ids}
+        if not result:
+            return result
+        conn = self.connection()
+        rows = conn.execute(STATEMENTS['order_items.for_orders'], (json.dumps(list(result)),))
+        for row in order_items_at_order_date(conn, rows):
+            result[row[0]].append(row[1:])
+        return result
 
     # Методы для импорта/экспорта
-    def export_to_csv(self, table_name, filename):
-        """Экспортирует данные из указанной таблицы в CSV."""
+    def export_to_csv(self, table_name, filename, progress=None):
+        """Экспортирует данные из указанной таблицы в CSV.
+
+        Строки читаются порциями по ``CHUNK_SIZE``, поэтому таблица
+        целиком в память не загружается.
+        """
+        query = table_statement(table_name, 'all')
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        cursor.execute(f"SELECT * FROM {table_name}")
-        rows = cursor.fetchall()
+        cursor.execute(query)
 
         with open(filename, 'w', newline='', encoding='utf-8') as file:
             writer = csv.writer(file)
             # Записываем заголовки
             writer.writerow([description[0] for description in cursor.description])
-            # Записываем данные
-            writer.writerows(rows)
+            # Записываем данные порциями
+            count = 0
+            while True:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                count += len(rows)
+                if progress:
+                    progress(count)
 
         conn.close()
+        return count
 
-    def import_from_csv(self, table_name, filename):
+    def import_from_csv(self, table_name, filename, progress=None):
         """Импортирует данные из CSV в указанную таблицу."""
         conn = self.get_connection()
         cursor = conn.cursor()
 
+        count = 0
         with open(filename, 'r', encoding='utf-8') as file:
             reader = csv.reader(file)
-            next(reader)  # Пропускаем заголовок
-
-            for row in reader:
-                placeholders = ', '.join(['?' for _ in row])
-                cursor.execute(f"INSERT INTO {table_name} VALUES ({placeholders})", row)
+            # Столбцы берутся из заголовка, поэтому служебный rowversion в файле не нужен
+            query = insert_statement(table_name, tuple(next(reader)))
+
+            while True:
+                rows = list(itertools.islice(reader, CHUNK_SIZE))
+                if not rows:
+                    break
+                cursor.executemany(query, rows)
+                count += len(rows)
+                if progress:
+                    progress(count)
 
         conn.commit()
         conn.close()
+        self.notify(table_name, RELOADED)
+        return count
 
-    def export_to_json(self, table_name, filename):
-        """Экспортирует данные из указанной таблицы в JSON."""
+    def export_to_json(self, table_name, filename, progress=None):
+        """Экспортирует данные из указанной таблицы в JSON.
+
+        Записи пишутся в файл по мере чтения, формат файла совпадает
+        с ``json.dump(..., indent=4)``.
+        """
+        query = table_statement(table_name, 'all')
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        cursor.execute(f"SELECT * FROM {table_name}")
-        rows = cursor.fetchall()
+        cursor.execute(query)
         column_names = [description[0] for description in cursor.description]
 
-        data = []
-        for row in rows:
-            data.append(dict(zip(column_names, row)))
-
+        count = 0
         with open(filename, 'w', encoding='utf-8') as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
+            file.write('[')
+            while True:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    item = json.dumps(dict(zip(column_names, row)), ensure_ascii=False, indent=4)
+                    file.write(',\n' if count else '\n')
+                    file.write(textwrap.indent(item, '    '))
+                    count += 1
+                if progress:
+                    progress(count)
+            file.write('\n]' if count else ']')
 
         conn.close()
+        return count
+
+    def get_sync_token(self):
+        """Возвращает текущее значение счетчика изменений (см. ``export_changes``)."""
+        return self._fetch(STATEMENTS['sync_clock.version'])[0][0]
+
+    def export_changes(self, table_name, since_token, filename, progress=None):
+        """
+        Экспортирует строки таблицы, измененные после ``since_token``.
+
+        Каждая строка файла содержит поля ``_op`` (``'upsert'`` или ``'delete'``),
+        ``_version`` и столбцы таблицы; у удаленных строк заполнены только ключевые
+        столбцы (``TABLE_KEYS``). Строки упорядочены по ``_version``, поэтому
+        их можно применять к копии данных последовательно. Выборка идет по индексам
+        на ``rowversion``, и стоимость выгрузки пропорциональна числу изменений,
+        а не размеру таблицы.
+
+        Parameters
+        ----------
+        table_name : str
+            Имя таблицы из ``TABLES``.
+        since_token : int or None
+            Токен, возвращенный предыдущей выгрузкой. ``None`` — полная выгрузка
+            текущего содержимого таблицы (без удалений).
+        filename : str
+            Файл ``.csv`` или ``.json``.
+
+        Returns
+        -------
+        int
+            Новый токен для следующей выгрузки.
+
+        Raises
+        ------
+        ValueError
+            Если таблица или формат файла не поддерживаются.
+        """
+        if table_name not in TABLE_COLUMNS:
+            raise ValueError(f"Неизвестная таблица {table_name}")
+        fmt = filename.rsplit('.', 1)[-1].lower()
+        if fmt not in ('csv', 'json'):
+            raise ValueError(f"Выгрузка изменений поддерживает только CSV и JSON: {filename}")
+
+        columns = TABLE_COLUMNS[table_name]
+        keys = TABLE_KEYS[table_name]
+        deleted = ', '.join('key1' if column == keys[0] else 'key2' if column in keys else 'NULL'
+                            for column in columns)
+        query = f'''
+            SELECT '{UPSERT}', rowversion, {', '.join(columns)} FROM {table_name}
+            WHERE rowversion > ? AND rowversion <= ?
+        '''
+        if since_token is not None:
+            query += f'''
+                UNION ALL
+                SELECT '{DELETE}', rowversion, {deleted} FROM tombstones
+                WHERE table_name = ? AND rowversion > ? AND rowversion <= ?
+            '''
+        query += " ORDER BY 2"
 
-    def import_clients_from_json(self, filename):
-        """Импортирует клиентов из JSON с генерацией новых ID."""
         conn = self.get_connection()
-        cursor = conn.cursor()
+        try:
+            # Токен и строки читаются в одной транзакции, поэтому изменения,
+            # зафиксированные во время выгрузки, попадут в следующую
+            conn.execute("BEGIN")
+            token = conn.execute(STATEMENTS['sync_clock.version']).fetchone()[0]
+            if since_token is None:
+                args = (-1, token)
+            else:
+                args = (since_token, token, table_name, since_token, token)
+            cursor = conn.execute(query, args)
+
+            count = 0
+            with open(filename, 'w', newline='', encoding='utf-8') as file:
+                if fmt == 'csv':
+                    writer = csv.writer(file)
+                    writer.writerow(('_op', '_version') + columns)
+                else:
+                    names = ('_op', '_version') + columns
+                    file.write('[')
+                while True:
+                    rows = cursor.fetchmany(CHUNK_SIZE)
+                    if not rows:
+                        break
+                    if fmt == 'csv':
+                        writer.writerows(rows)
+                    else:
+                        for i, row in enumerate(rows, count):
+                            item = json.dumps(dict(zip(names, row)), ensure_ascii=False, indent=4)
+                            file.write(',\n' if i else '\n')
+                            file.write(textwrap.indent(item, '    '))
+                    count += len(rows)
+                    if progress:
+                        progress(count)
+                if fmt == 'json':
+                    file.write('\n]' if count else ']')
+            conn.rollback()
+        finally:
+            conn.close()
+        return token
+
+    def prune_tombstones(self, before_token):
+        """
+        Удаляет записи об удалениях, уже выгруженные всеми получателями.
+
+        Parameters
+        ----------
+        before_token : int
+            Наименьший токен среди получателей изменений; записи с версией
+            не больше него больше не нужны.
+
+        Returns
+        -------
+        int
+            Количество удаленных записей.
+        """
+        conn = self.connection()
+        with conn:
+            return conn.execute(STATEMENTS['tombstones.prune'], (before_token,)).rowcount
+
+    def export_to_columnar(self, table_name, directory, fmt='npy', progress=None):
+        """
+        Экспортирует таблицу в колоночном формате (см. модуль ``columnar``).
+
+        Parameters
+        ----------
+        table_name : str
+            Имя таблицы.
+        directory : str
+            Каталог снимка.
+        fmt : str
+            ``'npy'`` (отображаемые в память файлы), ``'npz'`` (сжатый архив)
+            или ``'parquet'`` (требуется pyarrow).
+
+        Returns
+        -------
+        dict
+            Количество строк и типы столбцов.
+        """
+        import columnar
 
-        with open(filename, 'r', encoding='utf-8') as file:
-            data = json.load(file)
+        conn = self.get_connection()
+        try:
+            return columnar.export_table(conn, table_name, directory, fmt, CHUNK_SIZE, progress)
+        finally:
+            conn.close()
+
+    def export_snapshot(self, directory, fmt='npy', progress=None):
+        """
+        Экспортирует все таблицы в колоночный снимок для ``columnar.Snapshot``.
 
-            # Получаем текущее количество клиентов
-            clients_count = len(self.get_clients())
+        Все таблицы читаются в одной транзакции, поэтому снимок согласован.
+        """
+        import columnar
 
-            for i, item in enumerate(data, 1):
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN")
+            versions = dict(conn.execute(STATEMENTS['table_versions.all']).fetchall())
+            tables = {table_name: columnar.export_table(conn, table_name, directory, fmt, CHUNK_SIZE, progress)
+                      for table_name in TABLES}
+            conn.rollback()
+        finally:
+            conn.close()
+        return columnar.write_meta(directory, fmt, tables, versions)
+
+    def backup(self, path, compress=None, check='quick', progress=None):
+        """
+        Создает согласованную резервную копию базы (см. модуль ``backup``).
+
+        Копирование идет порциями страниц, между которыми база доступна
+        для записи, поэтому его можно выполнять в фоновом потоке, пока
+        приложение работает. Копия проверяется до того, как получит свое имя.
+
+        Parameters
+        ----------
+        path : str
+            Файл копии; окончание ``.gz`` включает сжатие.
+        compress : bool, optional
+            Явно включает или выключает сжатие.
+        check : str or None
+            ``'quick'``, ``'full'`` или None (см. ``backup.backup``).
+        progress : callable, optional
+            Вызывается с количеством скопированных страниц.
+
+        Returns
+        -------
+        dict
+            Размеры, количество страниц и время копирования.
+        """
+        import backup
+
+        conn = self.get_connection()
+        try:
+            return backup.backup(conn, path, compress, check=check, progress=progress)
+        finally:
+            conn.close()
+
+    def restore(self, path, check='quick', progress=None):
+        """
+        Заменяет содержимое базы резервной копией.
+
+        Копия проверяется до восстановления. После восстановления схема
+        обновляется до текущей, а подписчики получают ``RELOADED`` по всем
+        таблицам. Токены ``export_changes``, выданные после создания копии,
+        больше не действительны — получателям нужна полная выгрузка.
+
+        Parameters
+        ----------
+        path : str
+            Файл копии (сжатый, если оканчивается на ``.gz``).
+        check : str or None
+            Проверка копии перед восстановлением.
+        progress : callable, optional
+            Вызывается с количеством восстановленных страниц.
+
+        Returns
+        -------
+        dict
+            Количество страниц и время восстановления.
+        """
+        import backup
+
+        conn = self.get_connection()
+        try:
+            result = backup.restore(conn, path, check=check, progress=progress,
+                                    temp_dir=os.path.dirname(os.path.abspath(self.db_name)))
+        finally:
+            conn.close()
+
+        # Копия могла быть создана до появления новых столбцов, индексов и триггеров
+        self.init_db()
+        for table_name in TABLES:
+            self.notify(table_name, RELOADED)
+        return result
+
+    def import_clients_from_json(self, filename, progress=None):
+        """Импортирует клиентов из JSON с генерацией новых ID; подписчики получают ``RELOADED``."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # Получаем текущее количество клиентов
+        cursor.execute(STATEMENTS['clients.count'])
+        clients_count = cursor.fetchone()[0]
+
+        count = 0
+        with open(filename, 'r', encoding='utf-8') as file:
+            for i, item in enumerate(iter_json_array(file), 1):
                 try:
                     # Генерируем новый ID
                     new_id = f"CLT{clients_count + i:03d}"
+                    client = Client(new_id, item['name'], item['email'], item['phone'], item['city'],
+                                    item['address'])
 
                     cursor.execute(
-                        "INSERT INTO clients (id, name, email, phone, city, address) VALUES (?, ?, ?, ?, ?, ?)",
-                        (new_id, item['name'], item['email'], item['phone'], item['city'], item['address'])
+                        STATEMENTS['clients.insert'],
+                        (client.id, client.name, client.email, client.phone, client.city, client.address)
                     )
+                    count += 1
 
                 except Exception as e:
                     print(f"Ошибка при импорте клиента: {e}")
                     continue
 
+                if progress and i % CHUNK_SIZE == 0:
+                    progress(count)
+
         conn.commit()
         conn.close()
-
-    def import_products_from_json(self, filename):
-        """Импортирует товары из JSON с генерацией новых ID."""
+        if progress:
+            progress(count)
+        # Как и при импорте из CSV — одно уведомление вместо уведомления на каждую строку
+        if count:
+            self.notify('clients', RELOADED)
+        return count
+
+    def import_products_from_json(self, filename, progress=None):
+        """Импортирует товары из JSON с генерацией новых ID; подписчики получают ``RELOADED``."""
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        with open(filename, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-
-            # Получаем текущее количество товаров
-            products_count = len(self.get_products())
+        # Получаем текущее количество товаров
+        cursor.execute(STATEMENTS['products.count'])
+        products_count = cursor.fetchone()[0]
 
-            for i, item in enumerate(data, 1):
+        count = 0
+        with open(filename, 'r', encoding='utf-8') as file:
+            for i, item in enumerate(iter_json_array(file), 1):
                 try:
                     # Генерируем новый ID
                     new_id = f"PRD{products_count + i:03d}"
+                    product = Product(new_id, item['name'], item['price'])
 
-                    cursor.execute(
-                        "INSERT INTO products (id, name, price) VALUES (?, ?, ?)",
-                        (new_id, item['name'], item['price'])
-                    )
+                    cursor.execute(STATEMENTS['products.insert'], (product.id, product.name, product.price))
+                    count += 1
 
                 except Exception as e:
                     print(f"Ошибка при импорте товара: {e}")
                     continue
 
+                if progress and i % CHUNK_SIZE == 0:
+                    progress(count)
+
         conn.commit()
         conn.close()
+        if progress:
+            progress(count)
+        # Как и при импорте из CSV — одно уведомление вместо уведомления на каждую строку
+        if count:
+            self.notify('products', RELOADED)
+        return count
 
     # Методы для анализа данных
     def get_top_clients(self, limit=5):
         """Возвращает топ клиентов по количеству заказов."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT c.id, c.name, COUNT(o.id) as order_count
-            FROM clients c
-            JOIN orders o ON c.id = o.client_id
-            GROUP BY c.id, c.name
-            ORDER BY order_count DESC
-            LIMIT ?
-        ''', (limit,))
-
-        result = cursor.fetchall()
-        conn.close()
-        return result
+        return self._fetch(STATEMENTS['analytics.top_clients'], (limit,))
 
     def get_orders_dynamics(self):
         """Возвращает динамику заказов по датам."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT order_date, COUNT(id) as order_count, SUM(total_amount) as total_amount
-            FROM orders
-            GROUP BY order_date
-            ORDER BY order_date
-        ''')
-
-        result = cursor.fetchall()
-        conn.close()
-        return result
\ No newline at end of file
+        return self._fetch(STATEMENTS['analytics.orders_dynamics'])
+
+    def get_table_versions(self):
+        """
+        Возвращает текущие версии таблиц.
+
+        Версия таблицы увеличивается при каждой вставке, изменении или удалении
+        строки, в том числе из других процессов, поэтому подходит для проверки
+        актуальности кешей.
+
+        Returns
+        -------
+        dict
+            Имя таблицы -> версия.
+        """
+        return dict(self._fetch(STATEMENTS['table_versions.all']))
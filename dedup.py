@@ -0,0 +1,370 @@
+"""Поиск и объединение дублей клиентов.
+
+Импорт создает почти одинаковых клиентов: тот же телефон в другом формате,
+имя с опечаткой или переставленными словами, email в другом регистре.
+``UNIQUE`` на email ловит только точные совпадения.
+
+Поиск идет в три шага:
+
+1. Нормализация: телефон — только цифры с кодом страны 7, email — в нижнем
+   регистре без ``+метки`` (и без точек для Gmail), имя — слова в нижнем
+   регистре по алфавиту, ``ё`` как ``е``.
+2. Блокировка: сравниваются только клиенты с общим ключом — телефоном,
+   email или (домен почты, город, инициалы). Блоки больше
+   ``max_block_size`` не сравниваются попарно: записи сортируются по имени
+   и сравниваются с ``window`` соседями, поэтому число сравнений растет
+   линейно и на миллионе клиентов.
+3. Оценка: взвешенная сумма похожести имени и email (коэффициент Дайса по
+   парам символов) и совпадения телефона и города.
+
+Пары с оценкой от ``threshold`` объединяются в группы; в каждой группе
+остается клиент с наибольшим числом заказов. ``apply`` переносит заказы
+дублей на него и удаляет дубли в одной транзакции.
+"""
+import json
+import re
+import sys
+from collections import defaultdict
+from functools import lru_cache
+
+from db import DELETED, RELOADED
+
+# Веса признаков в оценке пары (в сумме 1)
+WEIGHTS = {'name': 0.35, 'email': 0.3, 'phone': 0.25, 'city': 0.1}
+
+# Оценка, начиная с которой пара считается дублем
+MATCH_THRESHOLD = 0.7
+
+# Блоки больше этого сравниваются только с соседями по имени
+MAX_BLOCK_SIZE = 50
+
+# Сколько соседей по имени сравнивается в больших блоках
+WINDOW = 10
+
+# Почтовые сервисы, которые игнорируют точки в имени ящика
+DOTLESS_DOMAINS = {'gmail.com': 'gmail.com', 'googlemail.com': 'gmail.com'}
+
+NON_DIGITS = re.compile(r'\D')
+NON_WORDS = re.compile(r'[^\w\s]')
+
+ORDER_COUNTS = '''
+    SELECT client_id, COUNT(*) FROM orders
+    WHERE client_id IN (SELECT value FROM json_each(?))
+    GROUP BY client_id
+'''
+MOVE_ORDERS = "UPDATE orders SET client_id = ? WHERE client_id IN (SELECT value FROM json_each(?))"
+DELETE_CLIENTS = "DELETE FROM clients WHERE id IN (SELECT value FROM json_each(?))"
+CLIENT_EXISTS = "SELECT 1 FROM clients WHERE id = ?"
+
+
+def normalize_phone(phone):
+    """Оставляет цифры; российские номера приводятся к виду ``7XXXXXXXXXX``."""
+    digits = NON_DIGITS.sub('', phone or '')
+    if len(digits) == 11 and digits[0] == '8':
+        return '7' + digits[1:]
+    if len(digits) == 10:
+        return '7' + digits
+    return digits
+
+
+def normalize_email(email):
+    """Приводит email к нижнему регистру и убирает ``+метку`` (и точки для Gmail)."""
+    local, _, domain = (email or '').strip().lower().rpartition('@')
+    local = local.split('+', 1)[0]
+    if domain in DOTLESS_DOMAINS:
+        local = local.replace('.', '')
+        domain = DOTLESS_DOMAINS[domain]
+    return f"{local}@{domain}"
+
+
+def normalize_name(name):
+    """Слова имени в нижнем регистре по алфавиту: ``'Иванов Иван'`` и ``'иван  иванов'`` совпадают."""
+    words = NON_WORDS.sub(' ', (name or '').lower().replace('ё', 'е')).split()
+    return ' '.join(sorted(words))
+
+
+def normalize_city(city):
+    """Город в нижнем регистре без лишних пробелов."""
+    return ' '.join((city or '').lower().replace('ё', 'е').split())
+
+
+@lru_cache(maxsize=1 << 16)
+def bigrams(text):
+    """Множество пар соседних символов строки (с пробелами по краям)."""
+    padded = f" {text} "
+    return frozenset(padded[i:i + 2] for i in range(len(padded) - 1))
+
+
+def similarity(a, b):
+    """Коэффициент Дайса по парам символов: 1 — строки совпадают, 0 — нет общих пар."""
+    if a == b:
+        return 1.0
+    grams_a, grams_b = bigrams(a), bigrams(b)
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+def make_record(client):
+    """
+    Нормализованная запись клиента для сравнения.
+
+    Повторяющиеся значения (города, домены, частые имена) интернируются,
+    чтобы миллион записей не хранил миллион копий одних и тех же строк.
+
+    Returns
+    -------
+    tuple
+        ``(id, name, phone, email, city)``.
+    """
+    return (client.id, sys.intern(normalize_name(client.name)), normalize_phone(client.phone),
+            normalize_email(client.email), sys.intern(normalize_city(client.city)))
+
+
+def blocking_keys(record):
+    """Ключи блоков, в которые попадает запись."""
+    _, name, phone, email, city = record
+    keys = []
+    if len(phone) >= 10:
+        keys.append(('phone', phone))
+    local, _, domain = email.partition('@')
+    if local:
+        keys.append(('email', email))
+    initials = ''.join(word[0] for word in name.split())
+    keys.append(('domain', domain, city, initials))
+    return keys
+
+
+def score(a, b, threshold=0.0):
+    """
+    Оценка похожести двух записей от 0 до 1.
+
+    Имя и email сравниваются по ``similarity`` (email с другим доменом —
+    только по имени ящика и с половинным весом), телефон и город — на
+    совпадение. Если пара заведомо не набирает ``threshold``, строки не
+    сравниваются и возвращается оценка снизу.
+    """
+    _, name_a, phone_a, email_a, city_a = a
+    _, name_b, phone_b, email_b, city_b = b
+    result = WEIGHTS['phone'] * (phone_a == phone_b and len(phone_a) >= 10)
+    result += WEIGHTS['city'] * (city_a == city_b)
+    # Имя и email дают не больше своих весов: если и с ними порог не достигается, дальше не считаем
+    if result + WEIGHTS['name'] + WEIGHTS['email'] < threshold:
+        return result
+
+    if email_a == email_b:
+        result += WEIGHTS['email']
+    else:
+        local_a, _, domain_a = email_a.partition('@')
+        local_b, _, domain_b = email_b.partition('@')
+        factor = 1.0 if domain_a == domain_b else 0.5
+        result += WEIGHTS['email'] * factor * similarity(local_a, local_b)
+    return result + WEIGHTS['name'] * similarity(name_a, name_b)
+
+
+class MergeProposal:
+    """
+    Предложение объединить группу клиентов.
+
+    Attributes
+    ----------
+    survivor : str
+        ID клиента, который остается (больше всего заказов).
+    duplicates : list of str
+        ID дублей: их заказы переходят к ``survivor``, а сами они удаляются.
+    pairs : list of tuple
+        Найденные пары ``(id_a, id_b, score)``, связавшие группу.
+    """
+
+    def __init__(self, survivor, duplicates, pairs):
+        self.survivor = survivor
+        self.duplicates = duplicates
+        self.pairs = pairs
+
+    @property
+    def score(self):
+        """Наименьшая оценка среди пар группы."""
+        return min(pair[2] for pair in self.pairs)
+
+    def __repr__(self):
+        return f"MergeProposal({self.survivor!r}, {self.duplicates!r}, score={self.score:.2f})"
+
+
+class Deduplicator:
+    """
+    Поиск дублей клиентов в базе.
+
+    Parameters
+    ----------
+    db : Database
+        База данных приложения.
+    threshold : float
+        Оценка, начиная с которой пара считается дублем.
+    max_block_size : int
+        Блоки больше этого сравниваются только с соседями по имени.
+    window : int
+        Сколько соседей по имени сравнивается в больших блоках.
+
+    Attributes
+    ----------
+    stats : dict
+        Счетчики последнего поиска: ``clients``, ``blocks``, ``large_blocks``,
+        ``candidates`` (сравненных пар) и ``matches``.
+    """
+
+    def __init__(self, db, threshold=MATCH_THRESHOLD, max_block_size=MAX_BLOCK_SIZE, window=WINDOW):
+        self.db = db
+        self.threshold = threshold
+        self.max_block_size = max_block_size
+        self.window = window
+        self.stats = {}
+
+    def load(self):
+        """Читает клиентов потоково и возвращает их нормализованные записи."""
+        return [make_record(client) for client in self.db.iter_clients()]
+
+    def candidate_pairs(self, records):
+        """
+        Перебирает пары индексов записей с общим ключом блока, каждую один раз.
+
+        Yields
+        ------
+        tuple
+            ``(i, j)``, ``i < j``.
+        """
+        blocks = defaultdict(list)
+        for index, record in enumerate(records):
+            for key in blocking_keys(record):
+                blocks[key].append(index)
+
+        # Пара из блока телефона или email может встретиться и в других блоках, а пара
+        # с разными телефонами и email — только в блоке домена. Первых мало (в основном
+        # это и есть дубли), поэтому запоминаются только они
+        seen = set()
+        self.stats['blocks'] = len(blocks)
+        self.stats['large_blocks'] = 0
+        for members in blocks.values():
+            if len(members) < 2:
+                continue
+            if len(members) <= self.max_block_size:
+                pairs = ((members[i], members[j]) for i in range(len(members)) for j in range(i + 1, len(members)))
+            else:
+                # Отсортированное окно: соседи по имени вместо всех пар блока
+                self.stats['large_blocks'] += 1
+                members = sorted(members, key=lambda index: records[index][1])
+                pairs = ((members[i], members[j]) for i in range(len(members))
+                         for j in range(i + 1, min(i + 1 + self.window, len(members))))
+            for i, j in pairs:
+                pair = (i, j) if i < j else (j, i)
+                if records[i][2] == records[j][2] or records[i][3] == records[j][3]:
+                    if pair in seen:
+                        continue
+                    seen.add(pair)
+                yield pair
+
+    def find_duplicates(self, records=None):
+        """
+        Находит пары дублей.
+
+        Parameters
+        ----------
+        records : list of tuple, optional
+            Записи ``make_record``; по умолчанию читаются из базы.
+
+        Returns
+        -------
+        list of tuple
+            ``(id_a, id_b, score)`` по убыванию оценки.
+        """
+        if records is None:
+            records = self.load()
+        self.stats = {'clients': len(records)}
+        matches = []
+        candidates = 0
+        for i, j in self.candidate_pairs(records):
+            candidates += 1
+            value = score(records[i], records[j], self.threshold)
+            if value >= self.threshold:
+                matches.append((records[i][0], records[j][0], round(value, 4)))
+        self.stats['candidates'] = candidates
+        self.stats['matches'] = len(matches)
+        matches.sort(key=lambda match: (-match[2], match[0], match[1]))
+        return matches
+
+    def propose_merges(self, records=None):
+        """
+        Группирует пары дублей и выбирает в каждой группе остающегося клиента.
+
+        Пары связываются транзитивно: если A похож на B, а B на C, все трое
+        попадают в одну группу. Остается клиент с наибольшим числом заказов,
+        при равенстве — с меньшим ID.
+
+        Returns
+        -------
+        list of MergeProposal
+        """
+        matches = self.find_duplicates(records)
+        parent = {}
+
+        def find(node):
+            parent.setdefault(node, node)
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for id_a, id_b, _ in matches:
+            root_a, root_b = find(id_a), find(id_b)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+
+        groups = defaultdict(list)
+        for node in parent:
+            groups[find(node)].append(node)
+        group_pairs = defaultdict(list)
+        for match in matches:
+            group_pairs[find(match[0])].append(match)
+
+        orders = dict(self.db.connection().execute(ORDER_COUNTS, (json.dumps(list(parent)),)))
+        proposals = []
+        for root, members in groups.items():
+            members.sort(key=lambda client_id: (-orders.get(client_id, 0), client_id))
+            proposals.append(MergeProposal(members[0], members[1:], group_pairs[root]))
+        proposals.sort(key=lambda proposal: proposal.survivor)
+        return proposals
+
+    def apply(self, proposals):
+        """
+        Объединяет клиентов по предложениям в одной транзакции.
+
+        Заказы дублей переходят к остающемуся клиенту, дубли удаляются.
+        Если хотя бы одно предложение устарело (остающегося клиента уже нет),
+        не применяется ни одно.
+
+        Returns
+        -------
+        dict
+            ``merged`` (удалено клиентов) и ``orders`` (перенесено заказов).
+
+        Raises
+        ------
+        ValueError
+            Если остающегося клиента нет в базе.
+        """
+        merged = moved = 0
+        conn = self.db.get_connection()
+        try:
+            with conn:
+                for proposal in proposals:
+                    if conn.execute(CLIENT_EXISTS, (proposal.survivor,)).fetchone() is None:
+                        raise ValueError(f"Клиент {proposal.survivor} не найден")
+                    duplicates = json.dumps(proposal.duplicates)
+                    moved += conn.execute(MOVE_ORDERS, (proposal.survivor, duplicates)).rowcount
+                    merged += conn.execute(DELETE_CLIENTS, (duplicates,)).rowcount
+        finally:
+            conn.close()
+
+        for proposal in proposals:
+            for client_id in proposal.duplicates:
+                self.db.notify('clients', DELETED, client_id)
+        if moved:
+            self.db.notify('orders', RELOADED)
+        return {'merged': merged, 'orders': moved}
@@ -1,25 +1,142 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-from db import Database
+from db import Database, OrderItemsCache, DELETED, RELOADED, ORDER_SORT_FIELDS
 from models import Client, Product, Order
 import datetime
+import itertools
+import sqlite3
+import threading
+import time
 from analysis import Analysis
+from audit import AuditLog
+from backup import BackupScheduler
+import profiling
+
+# Каталог и расписание автоматических резервных копий
+BACKUP_DIR = 'backups'
+BACKUP_INTERVAL = 3600
+BACKUP_KEEP = 24
+
+# Каталог журнала изменений (см. audit.AuditLog)
+AUDIT_DIR = 'audit'
+
+# Сколько строк таблицы загружается за один шаг: первая страница показывается сразу,
+# остальные догружаются порциями, пока окно простаивает
+PAGE_SIZE = 200
+
+# Методы окна (имена или префиксы), которые замеряются при заданной переменной
+# окружения MANAGER_PROFILE (см. profiling)
+PROFILED_HANDLERS = ('load_', 'add_', 'remove_from_order', 'create_order', 'show_', 'import_', 'export_',
+                     'delete_', 'apply_order_filters', 'reset_order_filters', 'backup_database', 'build_tab',
+                     'fill_page', 'prefetch_visible_order_items', 'on_db_change')
+
+
+class TypeAheadCombobox(ttk.Combobox):
+    """
+    Выпадающий список, варианты которого подбираются запросом по мере ввода.
+
+    Parameters
+    ----------
+    search : callable
+        ``search(prefix, limit)`` возвращает подходящие записи.
+    format_value : callable
+        Преобразует запись в строку списка вида ``'ID - ...'``.
+    limit : int
+        Сколько вариантов показывать.
+    delay_ms : int
+        Задержка после последнего нажатия клавиши перед запросом.
+    """
+
+    # Клавиши навигации по списку не запускают поиск
+    NAVIGATION_KEYS = ('Up', 'Down', 'Left', 'Right', 'Return', 'Escape', 'Tab', 'Home', 'End')
+
+    def __init__(self, master, search, format_value, limit=20, delay_ms=150, **kwargs):
+        super().__init__(master, postcommand=self.refresh, **kwargs)
+        self.search = search
+        self.format_value = format_value
+        self.limit = limit
+        self.delay_ms = delay_ms
+        self.job = None
+        self.bind('<KeyRelease>', self.on_key_release)
+
+    def on_key_release(self, event):
+        if event.keysym in self.NAVIGATION_KEYS:
+            return
+        if self.job is not None:
+            self.after_cancel(self.job)
+        self.job = self.after(self.delay_ms, self.refresh)
+
+    def selected_id(self):
+        """Возвращает ID выбранной записи (часть строки до ``' - '``)."""
+        return self.get().split(' - ')[0].strip()
+
+    def refresh(self):
+        """Загружает варианты для текущего текста поля."""
+        if self.job is not None:
+            self.after_cancel(self.job)
+            self.job = None
+        # После выбора варианта в поле строка 'ID - ...', ищем по ID
+        prefix = self.selected_id() if ' - ' in self.get() else self.get().strip()
+        self['values'] = [self.format_value(item) for item in self.search(prefix, self.limit)]
 
 
 class Application(tk.Tk):
     """ Окно приложения."""
 
-    def __init__(self):
+    def __init__(self, db_name="database.db"):
+        # Время запуска: от создания окна до его первого показа (см. on_map)
+        self.startup_started = time.perf_counter()
+        self.startup_seconds = None
         super().__init__()
         self.title("MANAGER APP")
         self.geometry("1200x700")
 
-        self.db = Database()
+        self.db = Database(db_name)
         self.analysis = Analysis(self.db)
+        # Товары заказов для окна деталей; подгружаются для видимых строк таблицы заказов
+        self.order_items_cache = OrderItemsCache(self.db)
+        self.order_prefetch_job = None
         self.current_order_items = []  # Товары в текущем заказе [(product_id, quantity)]
 
+        # Индексы строк таблиц: ID записи -> идентификатор строки Treeview
+        self.client_rows = {}
+        self.product_rows = {}
+        self.order_rows = {}
+
+        # Примененные фильтры заказов (аргументы Database.find_orders)
+        self.order_filters = {}
+
+        # Догружаемые таблицы: имя -> задание after со следующей страницей
+        self.fill_jobs = {}
+
+        # Профилирование обработчиков включается переменной окружения; обертки
+        # ставятся до создания виджетов, которые ссылаются на методы окна
+        self.profiler = profiling.from_environment()
+        if self.profiler is not None:
+            self.profiler.install(self, PROFILED_HANDLERS)
+
+        # Вкладки строятся и загружаются при первом выборе; до первой отрисовки
+        # строится только видимая, остальные — в фоне после нее (prewarm_tabs)
         self.create_widgets()
-        self.load_data()
+        self.build_tab(self.notebook.select())
+        self.bind('<Map>', self.on_map, '+')
+
+        # Таблицы обновляются точечно по уведомлениям базы данных
+        self.db.subscribe(self.on_db_change)
+
+        # Журнал изменений открывается и догоняет базу в фоновом потоке, запуск не задерживается
+        self.audit_log = AuditLog(self.db, AUDIT_DIR).attach()
+        self.audit_log.start()
+
+        # Скрытая панель диагностики производительности
+        self.bind_all('<Control-Shift-D>', lambda e: self.show_diagnostics())
+
+        # Резервные копии создаются в фоновом потоке, окно при этом не блокируется
+        self.backup_scheduler = BackupScheduler(self.db, BACKUP_DIR, BACKUP_INTERVAL, BACKUP_KEEP)
+        self.backup_scheduler.start()
+        self.backup_thread = None
+        self.bind_all('<Control-Shift-B>', lambda e: self.backup_database())
+        self.protocol('WM_DELETE_WINDOW', self.on_close)
 
     def create_widgets(self):
         """Создает интерфейс приложения."""
@@ -38,10 +155,45 @@ class Application(tk.Tk):
         self.notebook.add(self.order_frame, text="Заказы")
         self.notebook.add(self.analysis_frame, text="Аналитика")
 
-        self.setup_client_tab()
-        self.setup_product_tab()
-        self.setup_order_tab()
-        self.setup_analysis_tab()
+        # Вкладка -> (построение виджетов, загрузка данных); порядок — порядок фоновой подготовки
+        self.tabs = {
+            str(self.client_frame): (self.setup_client_tab, self.load_clients),
+            str(self.product_frame): (self.setup_product_tab, self.load_products),
+            str(self.order_frame): (self.setup_order_tab, self.load_order_tab),
+            str(self.analysis_frame): (self.setup_analysis_tab, None),
+        }
+        self.built_tabs = set()
+        self.notebook.bind('<<NotebookTabChanged>>', lambda e: self.build_tab(self.notebook.select()))
+
+    def build_tab(self, tab):
+        """Строит вкладку и загружает ее данные, если это еще не сделано."""
+        tab = str(tab)
+        if tab in self.built_tabs or tab not in self.tabs:
+            return
+        setup, load = self.tabs[tab]
+        self.built_tabs.add(tab)
+        setup()
+        if load is not None:
+            load()
+
+    def is_built(self, frame):
+        """Построена ли вкладка."""
+        return str(frame) in self.built_tabs
+
+    def on_map(self, event):
+        """Запоминает время до первого показа окна и запускает подготовку остальных вкладок."""
+        if event.widget is not self or self.startup_seconds is not None:
+            return
+        self.startup_seconds = time.perf_counter() - self.startup_started
+        self.after_idle(self.prewarm_tabs)
+
+    def prewarm_tabs(self):
+        """Строит следующую непостроенную вкладку; по одной за проход, чтобы окно не замирало."""
+        for tab in self.tabs:
+            if tab not in self.built_tabs:
+                self.build_tab(tab)
+                self.after_idle(self.prewarm_tabs)
+                return
 
     def setup_client_tab(self):
         """Создает вкладку клиентов."""
@@ -192,13 +344,15 @@ class Application(tk.Tk):
         # Выбор клиента
         ttk.Label(form_frame, text="Клиент:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
         self.client_var = tk.StringVar()
-        self.client_combo = ttk.Combobox(form_frame, textvariable=self.client_var, state="readonly", width=27)
+        self.client_combo = TypeAheadCombobox(form_frame, self.db.suggest_clients, self.client_combo_value,
+                                              textvariable=self.client_var, width=27)
         self.client_combo.grid(row=0, column=1, padx=5, pady=5, sticky='w')
 
         # Выбор товара и количества
         ttk.Label(form_frame, text="Товар:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
         self.product_var = tk.StringVar()
-        self.product_combo = ttk.Combobox(form_frame, textvariable=self.product_var, state="readonly", width=27)
+        self.product_combo = TypeAheadCombobox(form_frame, self.db.suggest_products, self.product_combo_value,
+                                               textvariable=self.product_var, width=27)
         self.product_combo.grid(row=1, column=1, padx=5, pady=5, sticky='w')
 
         ttk.Label(form_frame, text="Количество:").grid(row=1, column=2, padx=5, pady=5, sticky='e')
@@ -257,6 +411,33 @@ class Application(tk.Tk):
         ttk.Button(search_frame, text="Импорт из CSV", command=lambda: self.import_data('orders')).grid(row=0, column=4,
                                                                                                         padx=5, pady=5)
 
+        # Фильтры заказов: каждому полю соответствует индексированное условие в find_orders
+        filter_frame = ttk.LabelFrame(self.order_frame, text="Фильтры")
+        filter_frame.pack(fill='x', padx=10, pady=5)
+
+        self.order_filter_entries = {}
+        fields = (('client_id', "ID клиента:"), ('product_id', "ID товара:"), ('date_from', "Дата с:"),
+                  ('date_to', "по:"), ('min_amount', "Сумма от:"), ('max_amount', "до:"))
+        for i, (name, label) in enumerate(fields):
+            ttk.Label(filter_frame, text=label).grid(row=i // 2, column=(i % 2) * 2, padx=5, pady=2, sticky='e')
+            entry = ttk.Entry(filter_frame, width=20)
+            entry.grid(row=i // 2, column=(i % 2) * 2 + 1, padx=5, pady=2, sticky='w')
+            entry.bind('<Return>', lambda e: self.apply_order_filters())
+            self.order_filter_entries[name] = entry
+
+        ttk.Label(filter_frame, text="Сортировка:").grid(row=0, column=4, padx=5, pady=2, sticky='e')
+        self.order_sort_var = tk.StringVar(value=ORDER_SORT_FIELDS[0])
+        ttk.Combobox(filter_frame, textvariable=self.order_sort_var, values=ORDER_SORT_FIELDS, state="readonly",
+                     width=15).grid(row=0, column=5, padx=5, pady=2, sticky='w')
+        self.order_descending_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(filter_frame, text="По убыванию", variable=self.order_descending_var).grid(row=1, column=5,
+                                                                                                 padx=5, pady=2,
+                                                                                                 sticky='w')
+        ttk.Button(filter_frame, text="Применить", command=self.apply_order_filters).grid(row=0, column=6, padx=5,
+                                                                                          pady=2)
+        ttk.Button(filter_frame, text="Сбросить", command=self.reset_order_filters).grid(row=1, column=6, padx=5,
+                                                                                         pady=2)
+
         # Таблица заказов
         table_frame = ttk.Frame(self.order_frame)
         table_frame.pack(fill='both', expand=True, padx=10, pady=5)
@@ -271,13 +452,36 @@ class Application(tk.Tk):
         # Привязываем двойной клик для просмотра деталей заказа
         self.orders_tree.bind('<Double-1>', self.show_order_details)
 
-        # Полоса прокрутки
+        # Полоса прокрутки; при прокрутке подгружаются товары видимых заказов
         scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.orders_tree.yview)
-        self.orders_tree.configure(yscroll=scrollbar.set)
+
+        def on_yscroll(first, last):
+            scrollbar.set(first, last)
+            self.schedule_order_prefetch()
+
+        self.orders_tree.configure(yscroll=on_yscroll)
 
         self.orders_tree.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
 
+    def schedule_order_prefetch(self, delay_ms=100):
+        """Откладывает подгрузку товаров видимых заказов до окончания прокрутки."""
+        if self.order_prefetch_job is not None:
+            self.after_cancel(self.order_prefetch_job)
+        self.order_prefetch_job = self.after(delay_ms, self.prefetch_visible_order_items)
+
+    def prefetch_visible_order_items(self):
+        """Загружает в кеш товары заказов, видимых в таблице, одним запросом."""
+        self.order_prefetch_job = None
+        children = self.orders_tree.get_children()
+        if not children:
+            return
+        first, last = self.orders_tree.yview()
+        start = int(first * len(children))
+        end = min(len(children), int(last * len(children)) + 1)
+        order_ids = [str(self.orders_tree.item(row)['values'][0]) for row in children[start:end]]
+        self.order_items_cache.prefetch(order_ids)
+
     def setup_analysis_tab(self):
         """Создает вкладку аналитики."""
         # Кнопки для анализа
@@ -288,75 +492,280 @@ class Application(tk.Tk):
         ttk.Button(button_frame, text="Динамика заказов", command=self.show_orders_dynamics).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Граф связей клиентов", command=self.show_client_connections).pack(side='left',
                                                                                                          padx=5)
+        ttk.Button(button_frame, text="RFM-сегменты", command=self.show_rfm).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Удержание когорт", command=self.show_cohort_retention).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Товары вместе", command=self.show_product_associations).pack(side='left', padx=5)
 
         # Фрейм для отображения графиков
         self.analysis_frame_inner = ttk.Frame(self.analysis_frame)
         self.analysis_frame_inner.pack(fill='both', expand=True, padx=10, pady=10)
 
     def load_data(self):
-        """Загружает данные во все таблицы."""
-        self.load_clients()
-        self.load_products()
+        """Загружает данные во все построенные вкладки."""
+        for tab in self.built_tabs:
+            load = self.tabs[tab][1]
+            if load is not None:
+                load()
+
+    def load_order_tab(self):
+        """Загружает таблицу заказов и варианты выпадающих списков."""
         self.load_orders()
         self.update_client_combo()
         self.update_product_combo()
 
+    @staticmethod
+    def client_values(client):
+        """Значения строки таблицы клиентов."""
+        return client.id, client.name, client.email, client.phone, client.city, client.address
+
+    @staticmethod
+    def product_values(product):
+        """Значения строки таблицы товаров."""
+        return product.id, product.name, product.price
+
+    @staticmethod
+    def order_values(order):
+        """Значения строки таблицы заказов."""
+        return order.id, order.client_id, order.total_amount, order.order_date
+
+    @staticmethod
+    def client_combo_value(client):
+        """Строка клиента в выпадающем списке."""
+        return f"{client.id} - {client.name}"
+
+    @staticmethod
+    def product_combo_value(product):
+        """Строка товара в выпадающем списке."""
+        return f"{product.id} - {product.name} ({product.price} руб.)"
+
+    def fill_table(self, name, tree, rows, records, to_values):
+        """
+        Заполняет таблицу записями из итератора.
+
+        Первая страница (``PAGE_SIZE`` строк) вставляется сразу, остальные —
+        по странице за проход цикла событий, пока окно простаивает. Повторный
+        вызов для той же таблицы отменяет незавершенную догрузку.
+
+        Parameters
+        ----------
+        name : str
+            Имя таблицы в ``fill_jobs``.
+        tree : ttk.Treeview
+            Таблица.
+        rows : dict
+            Индекс строк таблицы (ID -> строка Treeview); очищается.
+        records : iterator
+            Записи с атрибутом ``id``.
+        to_values : callable
+            Преобразует запись в значения строки.
+        """
+        self.cancel_fill(name)
+        tree.delete(*tree.get_children())
+        rows.clear()
+        self.fill_page(name, tree, rows, iter(records), to_values)
+
+    def fill_page(self, name, tree, rows, records, to_values):
+        """Вставляет очередную страницу записей и планирует следующую."""
+        self.fill_jobs.pop(name, None)
+        inserted = 0
+        for record in itertools.islice(records, PAGE_SIZE):
+            rows[record.id] = tree.insert('', 'end', values=to_values(record))
+            inserted += 1
+        if inserted == PAGE_SIZE:
+            self.fill_jobs[name] = self.after_idle(self.fill_page, name, tree, rows, records, to_values)
+
+    def cancel_fill(self, name):
+        """Отменяет догрузку таблицы."""
+        job = self.fill_jobs.pop(name, None)
+        if job is not None:
+            self.after_cancel(job)
+
+    @staticmethod
+    def paged(db, table_name, search_term):
+        """
+        Записи таблицы страницами ``db.get_page`` по ``PAGE_SIZE`` строк.
+
+        Страница запрашивается, только когда ``fill_page`` дошел до нее,
+        поэтому каждый шаг догрузки читает из базы не больше одной страницы.
+        Между шагами транзакция чтения не держится открытой, иначе она
+        блокировала бы запись в базу из окна.
+        """
+        after = 0
+        while after is not None:
+            records, after = db.get_page(table_name, search_term, after, PAGE_SIZE)
+            yield from records
+
     def load_clients(self):
         """Загружает клиентов в таблицу."""
         search_term = self.client_search_entry.get()
-        clients = self.db.get_clients(search_term)
-
-        self.client_tree.delete(*self.client_tree.get_children())
-        for client in clients:
-            self.client_tree.insert('', 'end', values=(
-                client.id, client.name, client.email,
-                client.phone, client.city, client.address
-            ))
+        self.fill_table('clients', self.client_tree, self.client_rows,
+                        self.paged(self.db, 'clients', search_term), self.client_values)
 
     def load_products(self):
         """Загружает товары в таблицу."""
         search_term = self.product_search_entry.get()
-        products = self.db.get_products(search_term)
-
-        self.product_tree.delete(*self.product_tree.get_children())
-        for product in products:
-            self.product_tree.insert('', 'end', values=(
-                product.id, product.name, product.price
-            ))
+        self.fill_table('products', self.product_tree, self.product_rows,
+                        self.paged(self.db, 'products', search_term), self.product_values)
 
     def load_orders(self):
-        """Загружает заказы в таблицу."""
-        search_term = self.order_search_entry.get()
-        orders = self.db.get_orders(search_term)
+        """Загружает заказы в таблицу (по фильтрам, если они заданы, иначе по строке поиска)."""
+        if self.order_filters:
+            orders = self.db.find_orders(**self.order_filters)
+        else:
+            search_term = self.order_search_entry.get()
+            orders = self.paged(self.db, 'orders', search_term)
+
+        self.fill_table('orders', self.orders_tree, self.order_rows, orders, self.order_values)
+
+    def apply_order_filters(self):
+        """Применяет фильтры заказов из полей формы."""
+        filters = {name: entry.get().strip() for name, entry in self.order_filter_entries.items()}
+        filters = {name: value for name, value in filters.items() if value}
+        try:
+            for name in ('min_amount', 'max_amount'):
+                if name in filters:
+                    filters[name] = float(filters[name].replace(',', '.'))
+            # Без фильтров и с сортировкой по умолчанию работает обычный поиск
+            if filters or self.order_sort_var.get() != ORDER_SORT_FIELDS[0] or self.order_descending_var.get():
+                filters['sort'] = self.order_sort_var.get()
+                filters['descending'] = self.order_descending_var.get()
+                # Проверка фильтров до загрузки таблицы
+                self.db.build_orders_query(**filters)
+        except ValueError as e:
+            messagebox.showerror("Ошибка", f"Неверный фильтр: {e}")
+            return
+        self.order_filters = filters
+        self.load_orders()
 
-        self.orders_tree.delete(*self.orders_tree.get_children())
-        for order in orders:
-            self.orders_tree.insert('', 'end', values=(
-                order.id, order.client_id, order.total_amount, order.order_date
-            ))
+    def reset_order_filters(self):
+        """Сбрасывает фильтры заказов."""
+        for entry in self.order_filter_entries.values():
+            entry.delete(0, tk.END)
+        self.order_sort_var.set(ORDER_SORT_FIELDS[0])
+        self.order_descending_var.set(False)
+        self.order_filters = {}
+        self.load_orders()
+
+    @staticmethod
+    def matches_search(search_term, values):
+        """Проверяет, попадает ли строка под поисковый запрос (аналог LIKE '%term%')."""
+        term = search_term.casefold()
+        return any(term in str(value).casefold() for value in values)
+
+    @staticmethod
+    def apply_row_change(tree, rows, event, values, visible):
+        """
+        Применяет изменение одной записи к таблице.
+
+        Parameters
+        ----------
+        tree : ttk.Treeview
+            Таблица.
+        rows : dict
+            Индекс строк таблицы (ID -> строка Treeview).
+        event : ChangeEvent
+            Изменение.
+        values : tuple or None
+            Новые значения строки.
+        visible : bool
+            Должна ли строка отображаться при текущем поиске.
+        """
+        iid = rows.get(event.row_id)
+        if event.action == DELETED or not visible:
+            if iid is not None:
+                tree.delete(iid)
+                del rows[event.row_id]
+        elif iid is not None:
+            tree.item(iid, values=values)
+        else:
+            rows[event.row_id] = tree.insert('', 'end', values=values)
+
+    @staticmethod
+    def apply_combo_change(combo, event, value):
+        """
+        Применяет изменение записи к загруженным вариантам выпадающего списка.
+
+        Новые записи не добавляются: список содержит только результаты
+        подбора по введенному тексту и обновится при следующем вводе.
+        """
+        prefix = f"{event.row_id} - "
+        values = list(combo['values'])
+        for i, item in enumerate(values):
+            if item.startswith(prefix):
+                if event.action == DELETED:
+                    del values[i]
+                else:
+                    values[i] = value
+                combo['values'] = values
+                break
+
+    def on_db_change(self, event):
+        """
+        Обновляет таблицы и списки по уведомлению об изменении данных.
+
+        Непостроенные вкладки пропускаются: они загрузятся при построении.
+        Таблица, которая еще догружается, перезагружается целиком, иначе
+        изменение разошлось бы с еще не вставленными страницами.
+        """
+        if event.table == 'clients':
+            if self.is_built(self.order_frame):
+                if event.action == RELOADED:
+                    self.update_client_combo()
+                else:
+                    self.apply_combo_change(self.client_combo, event,
+                                            self.client_combo_value(event.row) if event.row else None)
+            if not self.is_built(self.client_frame):
+                return
+            if event.action == RELOADED or 'clients' in self.fill_jobs:
+                self.load_clients()
+                return
+            values = self.client_values(event.row) if event.row else None
+            search_term = self.client_search_entry.get()
+            visible = not search_term or (values is not None and self.matches_search(search_term, values[1:]))
+            self.apply_row_change(self.client_tree, self.client_rows, event, values, visible)
+
+        elif event.table == 'products':
+            if self.is_built(self.order_frame):
+                if event.action == RELOADED:
+                    self.update_product_combo()
+                else:
+                    self.apply_combo_change(self.product_combo, event,
+                                            self.product_combo_value(event.row) if event.row else None)
+            if not self.is_built(self.product_frame):
+                return
+            if event.action == RELOADED or 'products' in self.fill_jobs:
+                self.load_products()
+                return
+            values = self.product_values(event.row) if event.row else None
+            search_term = self.product_search_entry.get()
+            visible = not search_term or (values is not None and self.matches_search(search_term, values[:2]))
+            self.apply_row_change(self.product_tree, self.product_rows, event, values, visible)
+
+        elif event.table in ('orders', 'order_items'):
+            if not self.is_built(self.order_frame):
+                return
+            # Поиск заказов учитывает имя клиента, а фильтры — товары и сортировку,
+            # поэтому при активном поиске или фильтрах таблица перезагружается
+            if (event.action == RELOADED or event.table == 'order_items' or self.order_filters
+                    or self.order_search_entry.get() or 'orders' in self.fill_jobs):
+                self.load_orders()
+                return
+            values = self.order_values(event.row) if event.row else None
+            self.apply_row_change(self.orders_tree, self.order_rows, event, values, True)
 
     def update_client_combo(self):
-        """Обновляет выпадающий список клиентов."""
-        clients = self.db.get_clients()
-        client_values = [f"{client.id} - {client.name}" for client in clients]
-        self.client_combo['values'] = client_values
-        if client_values:
-            self.client_combo.current(0)
+        """Обновляет варианты выпадающего списка клиентов для введенного текста."""
+        self.client_combo.refresh()
 
     def update_product_combo(self):
-        """Обновляет выпадающий список товаров."""
-        products = self.db.get_products()
-        product_values = [f"{product.id} - {product.name} ({product.price} руб.)" for product in products]
-        self.product_combo['values'] = product_values
-        if product_values:
-            self.product_combo.current(0)
+        """Обновляет варианты выпадающего списка товаров для введенного текста."""
+        self.product_combo.refresh()
 
     def add_client(self):
         """Добавляет нового клиента."""
         try:
             # Генерируем ID
-            clients = self.db.get_clients()
-            new_id = f"CLT{len(clients) + 1:03d}"
+            new_id = self.db.get_next_id('clients')
 
             # Получаем данные из полей ввода
             name = self.client_entries['имя'].get()
@@ -369,10 +778,8 @@ class Application(tk.Tk):
             client = Client(new_id, name, email, phone, city, address)
             client.validate_all()
 
-            # Добавляем в базу
+            # Добавляем в базу (таблица обновится по уведомлению)
             self.db.add_client(client)
-            self.load_clients()
-            self.update_client_combo()
 
             # Очищаем поля ввода
             self.clear_client_fields()
@@ -386,8 +793,7 @@ class Application(tk.Tk):
         """Добавляет новый товар."""
         try:
             # Генерируем ID
-            products = self.db.get_products()
-            new_id = f"PRD{len(products) + 1:03d}"
+            new_id = self.db.get_next_id('products')
 
             # Получаем данные из полей ввода
             name = self.product_entries['наименование'].get()
@@ -397,10 +803,8 @@ class Application(tk.Tk):
             product = Product(new_id, name, price)
             product.validate_all()
 
-            # Добавляем в базу
+            # Добавляем в базу (таблица обновится по уведомлению)
             self.db.add_product(product)
-            self.load_products()
-            self.update_product_combo()
 
             # Очищаем поля ввода
             self.clear_product_fields()
@@ -420,14 +824,13 @@ class Application(tk.Tk):
                 return
 
             # Извлекаем ID товара из строки
-            product_id = product_str.split(' - ')[0]
+            product_id = self.product_combo.selected_id()
 
             # Получаем количество
             quantity = int(self.quantity_var.get())
 
             # Находим товар в базе
-            products = self.db.get_products()
-            product = next((p for p in products if p.id == product_id), None)
+            product = self.db.get_products_by_ids([product_id]).get(product_id)
 
             if not product:
                 messagebox.showerror("Ошибка", "Товар не найден")
@@ -483,11 +886,13 @@ class Application(tk.Tk):
                 return
 
             # Извлекаем ID клиента из строки
-            client_id = client_str.split(' - ')[0]
+            client_id = self.client_combo.selected_id()
+            if client_id not in self.db.get_clients_by_ids([client_id]):
+                messagebox.showwarning("Предупреждение", "Выберите клиента из списка")
+                return
 
             # Генерируем ID заказа
-            orders = self.db.get_orders()
-            new_id = f"ORD{len(orders) + 1:03d}"
+            new_id = self.db.get_next_id('orders')
 
             # Получаем текущую дату
             current_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -496,9 +901,8 @@ class Application(tk.Tk):
             order = Order(new_id, client_id, self.calculate_order_total(), current_date, self.current_order_items)
             order.validate_all()
 
-            # Добавляем в базу
+            # Добавляем в базу (таблица обновится по уведомлению)
             self.db.add_order(order)
-            self.load_orders()
 
             # Очищаем текущий заказ
             self.clear_order()
@@ -511,10 +915,10 @@ class Application(tk.Tk):
     def calculate_order_total(self):
         """Рассчитывает общую сумму заказа."""
         total = 0
-        products = self.db.get_products()
+        products = self.db.get_products_by_ids(product_id for product_id, _ in self.current_order_items)
 
         for product_id, quantity in self.current_order_items:
-            product = next((p for p in products if p.id == product_id), None)
+            product = products.get(product_id)
             if product:
                 total += product.price * quantity
 
@@ -524,11 +928,11 @@ class Application(tk.Tk):
         """Обновляет таблицу товаров в заказе."""
         self.order_tree.delete(*self.order_tree.get_children())
 
-        products = self.db.get_products()
+        products = self.db.get_products_by_ids(product_id for product_id, _ in self.current_order_items)
         total = 0
 
         for product_id, quantity in self.current_order_items:
-            product = next((p for p in products if p.id == product_id), None)
+            product = products.get(product_id)
             if product:
                 item_total = product.price * quantity
                 total += item_total
@@ -547,10 +951,10 @@ class Application(tk.Tk):
             return
 
         # Получаем ID заказа
-        order_id = self.orders_tree.item(selected[0])['values'][0]
+        order_id = str(self.orders_tree.item(selected[0])['values'][0])
 
-        # Получаем товары заказа
-        items = self.db.get_order_items(order_id)
+        # Товары видимых заказов обычно уже в кеше
+        items = self.order_items_cache.get(order_id)
 
         # Создаем окно с деталями
         details_window = tk.Toplevel(self)
@@ -588,8 +992,6 @@ class Application(tk.Tk):
 
         if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите удалить этого клиента?"):
             self.db.delete_client(client_id)
-            self.load_clients()
-            self.update_client_combo()
 
     def delete_product(self):
         """Удаляет выбранный товар."""
@@ -602,8 +1004,6 @@ class Application(tk.Tk):
 
         if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите удалить этот товар?"):
             self.db.delete_product(product_id)
-            self.load_products()
-            self.update_product_combo()
 
     def delete_order(self):
         """Удаляет выбранный заказ."""
@@ -616,7 +1016,6 @@ class Application(tk.Tk):
 
         if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите удалить этот заказ?"):
             self.db.delete_order(order_id)
-            self.load_orders()
 
     def export_data(self, table_name):
         """Экспортирует данные в CSV."""
@@ -639,33 +1038,18 @@ class Application(tk.Tk):
         """Импортирует данные из JSON."""
         filename = f"{table_name}_import.json"
 
+        # Таблицы обновляются по уведомлениям базы данных
         try:
             if table_name == 'clients':
                 self.db.import_clients_from_json(filename)
-                self.load_clients()
-                self.update_client_combo()
             elif table_name == 'products':
                 self.db.import_products_from_json(filename)
-                self.load_products()
-                self.update_product_combo()
 
             messagebox.showinfo("Успех", f"Данные импортированы из {filename}")
 
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка импорта: {str(e)}")
 
-        # Обновляем данные
-        if table_name == 'clients':
-            self.load_clients()
-            self.update_client_combo()
-        elif table_name == 'products':
-            self.load_products()
-            self.update_product_combo()
-        elif table_name == 'orders':
-            self.load_orders()
-
-        messagebox.showinfo("Успех", f"Данные импортированы из {filename}")
-
     def show_top_clients(self):
         """Показывает топ-5 клиентов."""
         self.analysis.show_top_clients(self.analysis_frame_inner)
@@ -678,6 +1062,141 @@ class Application(tk.Tk):
         """Показывает граф связей клиентов."""
         self.analysis.show_client_connections(self.analysis_frame_inner)
 
+    def show_rfm(self):
+        """Показывает RFM-сегменты клиентов."""
+        self.analysis.show_rfm(self.analysis_frame_inner)
+
+    def show_cohort_retention(self):
+        """Показывает удержание клиентов по когортам."""
+        self.analysis.show_cohort_retention(self.analysis_frame_inner)
+
+    def show_product_associations(self):
+        """Показывает товары, которые чаще всего покупают вместе."""
+        self.analysis.show_product_associations(self.analysis_frame_inner)
+
+    def backup_database(self):
+        """Создает резервную копию в фоновом потоке и сообщает о результате."""
+        if self.backup_thread is not None and self.backup_thread.is_alive():
+            messagebox.showinfo("Резервная копия", "Копия уже создается")
+            return
+        outcome = {}
+
+        def run():
+            try:
+                outcome['result'] = self.backup_scheduler.backup_now()
+            except (OSError, sqlite3.Error) as e:
+                outcome['error'] = e
+
+        self.backup_thread = threading.Thread(target=run, name='backup', daemon=True)
+        self.backup_thread.start()
+        self.after(200, self.check_backup, outcome)
+
+    def check_backup(self, outcome):
+        """Ждет завершения фоновой копии; Tk вызывается только из главного потока."""
+        if self.backup_thread.is_alive():
+            self.after(200, self.check_backup, outcome)
+            return
+        if 'error' in outcome:
+            messagebox.showerror("Ошибка", f"Ошибка резервного копирования: {outcome['error']}")
+        else:
+            messagebox.showinfo("Резервная копия", f"Копия сохранена в {outcome['result']['path']}")
+
+    def on_close(self):
+        """Останавливает фоновые копии, дописывает журнал изменений и профили и закрывает окно."""
+        self.backup_scheduler.stop()
+        self.audit_log.close()
+        if self.profiler is not None:
+            self.profiler.close()
+        self.destroy()
+
+    def show_diagnostics(self):
+        """Показывает панель диагностики: статистику методов, запросов и медленные запросы."""
+        if self.db.instrumentation is None:
+            self.db.enable_instrumentation()
+
+        window = tk.Toplevel(self)
+        window.title("Диагностика")
+        window.geometry("1000x500")
+
+        control_frame = ttk.Frame(window)
+        control_frame.pack(fill='x', padx=10, pady=5)
+
+        ttk.Label(control_frame, text="Порог медленного запроса, мс:").pack(side='left', padx=5)
+        threshold_var = tk.StringVar(value=str(self.db.instrumentation.slow_query_ms))
+        ttk.Spinbox(control_frame, from_=1, to=10000, textvariable=threshold_var, width=8).pack(side='left', padx=5)
+
+        notebook = ttk.Notebook(window)
+        notebook.pack(fill='both', expand=True, padx=10, pady=5)
+
+        tables = {
+            'methods': ('Методы', ('Метод', 'Вызовы', 'Всего, мс', 'Сред, мс', 'p95, мс', 'Макс, мс')),
+            'statements': ('Запросы', ('Запрос', 'Вызовы', 'Всего, мс', 'Сред, мс', 'p95, мс', 'Макс, мс')),
+            'slow_queries': ('Медленные запросы', ('Время', 'мс', 'Метод', 'Запрос', 'План')),
+        }
+        if self.profiler is not None:
+            tables['handlers'] = ('Обработчики', ('Обработчик', 'Вызовы', 'Всего, мс', 'p95, мс', 'Макс, мс',
+                                                  'БД, мс', 'Python, мс', 'Tk, мс', 'Отрисовка, мс'))
+            tables['stalls'] = ('Зависания', ('Время', 'мс', 'Обработчик', 'Профиль'))
+        trees = {}
+        for key, (title, columns) in tables.items():
+            frame = ttk.Frame(notebook)
+            notebook.add(frame, text=title)
+            tree = ttk.Treeview(frame, columns=columns, show='headings')
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=90)
+            tree.column('Запрос' if 'Запрос' in columns else columns[0], width=350)
+            tree.pack(fill='both', expand=True)
+            trees[key] = tree
+
+        def refresh():
+            try:
+                self.db.enable_instrumentation(float(threshold_var.get()))
+            except ValueError:
+                pass
+            stats = self.db.stats()
+            for tree in trees.values():
+                tree.delete(*tree.get_children())
+            for key in ('methods', 'statements'):
+                for name, hist in stats[key].items():
+                    trees[key].insert('', 'end', values=(
+                        name, hist['calls'], hist['total_ms'], hist['avg_ms'], hist['p95_ms'], hist['max_ms']
+                    ))
+            for entry in reversed(stats['slow_queries']):
+                trees['slow_queries'].insert('', 'end', values=(
+                    entry['time'], entry['ms'], entry['method'], entry['sql'], '; '.join(entry['plan'] or [])
+                ))
+            if self.profiler is not None:
+                report = self.profiler.stats()
+                for name, hist in report['handlers'].items():
+                    phases = hist['phases_ms']
+                    trees['handlers'].insert('', 'end', values=(
+                        name, hist['calls'], hist['total_ms'], hist['p95_ms'], hist['max_ms'],
+                        phases['db'], phases['python'], phases['tk'], phases['render']
+                    ))
+                for entry in reversed(report['stalls']):
+                    trees['stalls'].insert('', 'end', values=(
+                        entry['time'], entry['ms'], entry['handler'] or 'цикл событий', entry['profile'] or ''
+                    ))
+
+        def reset():
+            self.db.reset_stats()
+            if self.profiler is not None:
+                self.profiler.reset()
+            refresh()
+
+        ttk.Button(control_frame, text="Обновить", command=refresh).pack(side='left', padx=5)
+        ttk.Button(control_frame, text="Сбросить", command=reset).pack(side='left', padx=5)
+        # При профилировании статистика запросов нужна для фазы БД, поэтому не выключается
+        if self.profiler is None:
+            ttk.Button(control_frame, text="Выключить сбор",
+                       command=lambda: (self.db.disable_instrumentation(), window.destroy())).pack(side='left', padx=5)
+        if self.startup_seconds is not None:
+            ttk.Label(control_frame, text=f"Запуск до первой отрисовки: {self.startup_seconds * 1000:.0f} мс").pack(
+                side='right', padx=5)
+
+        refresh()
+
     def clear_client_fields(self):
         """Очищает поля ввода клиента."""
         for entry in self.client_entries.values():
@@ -0,0 +1,306 @@
+"""Сбор статистики по методам Database и SQL-запросам.
+
+Инструментирование включается через ``Database.enable_instrumentation``.
+Пока оно выключено, ``Database`` работает с обычными соединениями
+``sqlite3`` и обертки методов не установлены, поэтому накладные расходы
+сводятся к одной проверке атрибута в ``get_connection``.
+"""
+import bisect
+import collections
+import datetime
+import re
+import sqlite3
+import threading
+import time
+import weakref
+
+# Границы корзин гистограммы задержек в миллисекундах
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Сколько медленных запросов хранить
+SLOW_LOG_SIZE = 200
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(sql):
+    """Приводит текст запроса к одной строке для группировки статистики."""
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def strip_literals(sql):
+    """Заменяет литералы на ``?``, чтобы запросы из трассировки группировались по шаблону."""
+    return _LITERALS.sub('?', normalize_sql(sql))
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с логарифмическими корзинами."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Добавляет одно измерение."""
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.min = ms if self.min is None else min(self.min, ms)
+
+    def percentile(self, q):
+        """Оценивает перцентиль (0..100) по верхней границе корзины."""
+        if not self.count:
+            return 0.0
+        target = self.count * q / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def as_dict(self):
+        """Возвращает сводку гистограммы в миллисекундах."""
+        return {
+            'calls': self.count,
+            'total_ms': round(self.total, 3),
+            'avg_ms': round(self.total / self.count, 3) if self.count else 0.0,
+            'min_ms': round(self.min or 0.0, 3),
+            'max_ms': round(self.max, 3),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'buckets': {f"<={bound}": count for bound, count in zip(BUCKETS_MS, self.counts) if count},
+        }
+
+
+class Instrumentation:
+    """Хранилище статистики: методы, запросы и журнал медленных запросов."""
+
+    def __init__(self, slow_query_ms=100):
+        self.slow_query_ms = slow_query_ms
+        self.methods = collections.defaultdict(LatencyHistogram)
+        self.statements = collections.defaultdict(LatencyHistogram)
+        self.traced = collections.Counter()
+        self.slow_queries = collections.deque(maxlen=SLOW_LOG_SIZE)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def reset(self):
+        """Очищает собранную статистику."""
+        with self.lock:
+            self.methods.clear()
+            self.statements.clear()
+            self.traced.clear()
+            self.slow_queries.clear()
+
+    def current_method(self):
+        """Возвращает имя метода Database, выполняющегося в текущем потоке."""
+        return getattr(self.local, 'method', None)
+
+    def thread_seconds(self):
+        """Возвращает суммарное время запросов, выполненных в текущем потоке."""
+        return getattr(self.local, 'seconds', 0.0)
+
+    def record_method(self, name, seconds):
+        """Учитывает вызов метода Database."""
+        with self.lock:
+            self.methods[name].record(seconds)
+
+    def record_statement(self, conn, sql, params, seconds):
+        """Учитывает выполнение запроса и при необходимости пишет его в журнал медленных."""
+        key = normalize_sql(sql)
+        # Время запросов потока: по нему профилировщик окна выделяет фазу БД (см. profiling)
+        self.local.seconds = getattr(self.local, 'seconds', 0.0) + seconds
+        with self.lock:
+            self.statements[key].record(seconds)
+
+        if seconds * 1000 >= self.slow_query_ms:
+            self.slow_queries.append({
+                'time': datetime.datetime.now().isoformat(timespec='seconds'),
+                'ms': round(seconds * 1000, 3),
+                'method': self.current_method(),
+                'sql': key,
+                'params': repr(params)[:200] if params is not None else None,
+                'plan': explain(conn, sql, params),
+            })
+
+    def trace(self, statement):
+        """Обработчик ``set_trace_callback``: считает все выполненные SQLite инструкции."""
+        with self.lock:
+            # Трассировка получает запрос с подставленными параметрами
+            self.traced[strip_literals(statement)] += 1
+
+    def as_dict(self):
+        """Возвращает всю собранную статистику."""
+        with self.lock:
+            return {
+                'enabled': True,
+                'slow_query_ms': self.slow_query_ms,
+                'methods': {name: hist.as_dict() for name, hist in sorted(self.methods.items())},
+                'statements': {sql: hist.as_dict() for sql, hist in
+                               sorted(self.statements.items(), key=lambda item: -item[1].total)},
+                'traced': dict(self.traced.most_common()),
+                'slow_queries': list(self.slow_queries),
+            }
+
+
+def explain(conn, sql, params):
+    """Возвращает ``EXPLAIN QUERY PLAN`` для запроса или None, если план получить нельзя."""
+    if not sql.lstrip().upper().startswith(('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')):
+        return None
+    try:
+        cursor = sqlite3.Connection.cursor(conn)
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params if params is not None else ())
+        return [row[-1] for row in cursor.fetchall()]
+    except sqlite3.Error:
+        return None
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, замеряющий время выполнения запроса вместе с чтением результатов."""
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self._pending = None  # (sql, params, накопленное время)
+
+    def _start(self, sql, params, seconds):
+        self._finish()
+        self._pending = [sql, params, seconds]
+        self.connection.open_cursors.add(self)
+
+    def _add(self, seconds, exhausted):
+        if self._pending is not None:
+            self._pending[2] += seconds
+            if exhausted:
+                self._finish()
+
+    def _finish(self):
+        if self._pending is not None:
+            sql, params, seconds = self._pending
+            self._pending = None
+            self.connection.open_cursors.discard(self)
+            self.connection.instrumentation.record_statement(self.connection, sql, params, seconds)
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._start(sql, parameters, time.perf_counter() - started)
+        if self.description is None:
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._start(sql, None, time.perf_counter() - started)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - started, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(time.perf_counter() - started, not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - started, True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - started, True)
+            raise
+        self._add(time.perf_counter() - started, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Курсор, не дочитанный до конца (например, после fetchone), учитывается при удалении
+        if getattr(self, '_pending', None) is not None:
+            self._finish()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение, которое создает ``InstrumentedCursor`` и замеряет COMMIT."""
+
+    instrumentation = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Слабые ссылки: брошенный курсор удаляется и учитывает свой запрос сам
+        self.open_cursors = weakref.WeakSet()
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        super().commit()
+        self.instrumentation.record_statement(self, 'COMMIT', None, time.perf_counter() - started)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            started = time.perf_counter()
+            result = super().__exit__(exc_type, exc, tb)
+            self.instrumentation.record_statement(self, 'COMMIT', None, time.perf_counter() - started)
+            return result
+        return super().__exit__(exc_type, exc, tb)
+
+    def close(self):
+        for cursor in list(self.open_cursors):
+            cursor._finish()
+        super().close()
+
+
+def connect(db_name, instrumentation, **kwargs):
+    """Открывает инструментированное соединение с базой данных."""
+    conn = sqlite3.connect(db_name, factory=InstrumentedConnection, **kwargs)
+    conn.instrumentation = instrumentation
+    conn.set_trace_callback(instrumentation.trace)
+    return conn
+
+
+def wrap_method(instrumentation, name, method):
+    """Оборачивает метод Database замером времени и учетом вызовов."""
+    def wrapper(*args, **kwargs):
+        local = instrumentation.local
+        outer = getattr(local, 'method', None)
+        local.method = name if outer is None else outer
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            instrumentation.record_method(name, time.perf_counter() - started)
+            local.method = outer
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    wrapper.__wrapped__ = method
+    return wrapper
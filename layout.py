@@ -0,0 +1,203 @@
+"""Кеш раскладки графа связей клиентов.
+
+``nx.spring_layout`` итеративен и сверхлинеен по числу узлов, а без
+``seed`` дает новую картинку при каждом построении. ``LayoutCache``
+хранит координаты узлов в таблице ``graph_layouts`` вместе с отпечатком
+графа (SHA-256 от отсортированных узлов и ребер):
+
+- граф не изменился — координаты берутся из базы без пересчета;
+- граф изменился — прежние координаты служат начальной раскладкой, новые
+  узлы ставятся рядом с соседями, и ``spring_layout`` делает несколько
+  итераций, поэтому картинка не «прыгает»;
+- узлов больше ``spring_max_nodes`` — вместо силовой раскладки узлы
+  раскладываются по группам (городам) за линейное время.
+
+Случайность фиксирована ``seed``, поэтому один и тот же граф всегда
+раскладывается одинаково.
+"""
+import hashlib
+import json
+from collections import defaultdict
+
+import networkx as nx
+import numpy as np
+
+# Зерно генератора случайных чисел для раскладки и размещения новых узлов
+LAYOUT_SEED = 42
+
+# Сколько узлов раскладывается силовым алгоритмом; больше — раскладка по группам.
+# Начиная с 500 узлов networkx переходит на разреженный вариант, которому нужен scipy
+SPRING_MAX_NODES = 500
+
+# Итераций spring_layout при полном и при дополняющем пересчете
+SPRING_ITERATIONS = 50
+INCREMENTAL_ITERATIONS = 15
+
+# Разброс новых узлов вокруг центра их соседей
+NEW_NODE_JITTER = 0.05
+
+LOAD_LAYOUT = "SELECT fingerprint, algorithm, positions FROM graph_layouts WHERE graph = ?"
+SAVE_LAYOUT = "INSERT OR REPLACE INTO graph_layouts (graph, fingerprint, algorithm, positions) VALUES (?, ?, ?, ?)"
+
+
+def graph_fingerprint(G, group=None):
+    """
+    Отпечаток графа: узлы (с атрибутом ``group``, если задан) и ребра.
+
+    Порядок добавления узлов и ребер не влияет на результат.
+    """
+    keys = {node: repr(node) for node in G}
+    nodes = sorted((keys[node], repr(data.get(group)) if group else '') for node, data in G.nodes(data=True))
+    edges = sorted((keys[u], keys[v]) if keys[u] <= keys[v] else (keys[v], keys[u]) for u, v in G.edges())
+    payload = json.dumps([nodes, edges], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def grouped_layout(G, group, seed=LAYOUT_SEED):
+    """
+    Раскладка по группам за линейное время.
+
+    Центры групп (значений атрибута ``group``) стоят на окружности, узлы
+    группы — на окружности вокруг ее центра радиусом по размеру группы.
+    Без ``group`` все узлы лежат на одной окружности.
+    Группы и узлы упорядочены, поэтому раскладка не зависит от порядка
+    добавления узлов.
+
+    Returns
+    -------
+    dict
+        Узел -> ``(x, y)``.
+    """
+    groups = defaultdict(list)
+    for node, data in G.nodes(data=True):
+        groups[str(data.get(group)) if group else ''].append(node)
+    if not groups:
+        return {}
+
+    names = sorted(groups)
+    # Поворот всей раскладки задается зерном, как и у spring_layout
+    phase = np.random.default_rng(seed).uniform(0, 2 * np.pi)
+    centers = np.linspace(0, 2 * np.pi, len(names), endpoint=False) + phase
+    largest = max(len(nodes) for nodes in groups.values())
+    # Радиус группы пропорционален корню из размера, чтобы группы не перекрывались
+    max_radius = np.pi / max(len(names), 2) * 0.8 if len(names) > 1 else 1.0
+
+    positions = {}
+    for name, angle in zip(names, centers):
+        nodes = sorted(groups[name], key=repr)
+        center = np.array([np.cos(angle), np.sin(angle)]) if len(names) > 1 else np.zeros(2)
+        radius = max_radius * np.sqrt(len(nodes) / largest)
+        angles = np.linspace(0, 2 * np.pi, len(nodes), endpoint=False)
+        xs = center[0] + radius * np.cos(angles)
+        ys = center[1] + radius * np.sin(angles)
+        for node, x, y in zip(nodes, xs, ys):
+            positions[node] = (float(x), float(y))
+    return positions
+
+
+class LayoutCache:
+    """
+    Раскладки графов, сохраняемые в базе.
+
+    Parameters
+    ----------
+    db : Database
+        База данных приложения (таблица ``graph_layouts``).
+    seed : int
+        Зерно раскладки.
+    spring_max_nodes : int
+        Сколько узлов раскладывается ``spring_layout``; для больших графов
+        используется ``grouped_layout``.
+
+    Attributes
+    ----------
+    last_mode : str or None
+        Как получена последняя раскладка: ``'cached'``, ``'incremental'``
+        или ``'full'``.
+    """
+
+    def __init__(self, db, seed=LAYOUT_SEED, spring_max_nodes=SPRING_MAX_NODES):
+        self.db = db
+        self.seed = seed
+        self.spring_max_nodes = spring_max_nodes
+        self.last_mode = None
+
+    def load(self, name):
+        """
+        Возвращает сохраненную раскладку графа.
+
+        Returns
+        -------
+        tuple or None
+            ``(fingerprint, algorithm, positions)`` или None, если раскладки нет.
+        """
+        row = self.db.connection().execute(LOAD_LAYOUT, (name,)).fetchone()
+        if row is None:
+            return None
+        fingerprint, algorithm, positions = row
+        return fingerprint, algorithm, {node: (x, y) for node, x, y in json.loads(positions)}
+
+    def save(self, name, fingerprint, algorithm, positions):
+        """Сохраняет раскладку графа, заменяя прежнюю."""
+        data = json.dumps([[node, x, y] for node, (x, y) in positions.items()], ensure_ascii=False)
+        conn = self.db.connection()
+        with conn:
+            conn.execute(SAVE_LAYOUT, (name, fingerprint, algorithm, data))
+
+    def _place_new_nodes(self, G, known):
+        """Начальные координаты: известные узлы на месте, новые — у центра известных соседей."""
+        rng = np.random.default_rng(self.seed)
+        initial = dict(known)
+        for node in sorted((node for node in G if node not in known), key=repr):
+            neighbours = [initial[other] for other in G[node] if other in initial]
+            if neighbours:
+                center = np.mean(neighbours, axis=0)
+                initial[node] = tuple(center + rng.uniform(-NEW_NODE_JITTER, NEW_NODE_JITTER, 2))
+            else:
+                initial[node] = tuple(rng.uniform(-1, 1, 2))
+        return initial
+
+    def layout(self, name, G, group=None):
+        """
+        Возвращает раскладку графа, пересчитывая ее только при изменении графа.
+
+        Parameters
+        ----------
+        name : str
+            Имя графа в кеше.
+        G : networkx.Graph
+            Граф.
+        group : str, optional
+            Атрибут узлов для раскладки по группам больших графов; он же
+            входит в отпечаток.
+
+        Returns
+        -------
+        dict
+            Узел -> ``(x, y)``.
+        """
+        fingerprint = graph_fingerprint(G, group)
+        algorithm = 'spring' if len(G) <= self.spring_max_nodes else 'grouped'
+        stored = self.load(name)
+        if stored is not None and stored[0] == fingerprint and stored[1] == algorithm:
+            self.last_mode = 'cached'
+            return stored[2]
+
+        if algorithm == 'grouped':
+            positions = grouped_layout(G, group, self.seed)
+            self.last_mode = 'full'
+        else:
+            known = {}
+            if stored is not None and stored[1] == algorithm:
+                known = {node: position for node, position in stored[2].items() if node in G}
+            if known:
+                pos = nx.spring_layout(G, pos=self._place_new_nodes(G, known), iterations=INCREMENTAL_ITERATIONS,
+                                       seed=self.seed, method='force')
+                self.last_mode = 'incremental'
+            else:
+                pos = nx.spring_layout(G, iterations=SPRING_ITERATIONS, seed=self.seed, method='force')
+                self.last_mode = 'full'
+            positions = {node: (float(x), float(y)) for node, (x, y) in pos.items()}
+
+        self.save(name, fingerprint, algorithm, positions)
+        return positions
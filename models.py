@@ -1,5 +1,94 @@
 import re
 
+# Коды ошибок проверки: check_* возвращают их вместо исключений
+EMPTY_FIELD = 'empty_field'
+INVALID_EMAIL = 'invalid_email'
+INVALID_PHONE = 'invalid_phone'
+INVALID_PRICE = 'invalid_price'
+NEGATIVE_AMOUNT = 'negative_amount'
+
+# Тексты ошибок для validate_all
+ERROR_MESSAGES = {
+    EMPTY_FIELD: "Все поля должны быть заполнены",
+    INVALID_EMAIL: "Неверный формат email",
+    INVALID_PHONE: "Неверный формат телефона",
+    INVALID_PRICE: "Цена должна быть положительным числом",
+    NEGATIVE_AMOUNT: "Сумма заказа не может быть отрицательной",
+}
+
+# Шаблоны компилируются один раз при импорте, а не ищутся в кеше re при каждой проверке
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+PHONE_PATTERN = re.compile(r"^\+?[0-9]{10,15}$")
+
+
+def is_empty(value):
+    """Проверяет, что значение отсутствует или состоит из одних пробелов."""
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def check_client(name, email, phone, city, address):
+    """
+    Проверяет поля клиента без создания объекта и без исключений.
+
+    Returns
+    -------
+    tuple of str
+        Коды ошибок (``EMPTY_FIELD``, ``INVALID_EMAIL``, ``INVALID_PHONE``)
+        в порядке проверки; пустой кортеж, если поля корректны.
+    """
+    errors = ()
+    if is_empty(name) or is_empty(email) or is_empty(phone) or is_empty(city) or is_empty(address):
+        errors += (EMPTY_FIELD,)
+    if not isinstance(email, str) or EMAIL_PATTERN.match(email) is None:
+        errors += (INVALID_EMAIL,)
+    if not isinstance(phone, str) or PHONE_PATTERN.match(phone) is None:
+        errors += (INVALID_PHONE,)
+    return errors
+
+
+def check_product(name, price):
+    """
+    Проверяет поля товара без создания объекта и без исключений.
+
+    Returns
+    -------
+    tuple of str
+        Коды ``EMPTY_FIELD`` и ``INVALID_PRICE``; пустой кортеж, если поля корректны.
+    """
+    errors = (EMPTY_FIELD,) if name is None or (isinstance(name, str) and not name.strip()) else ()
+    if not isinstance(price, (int, float)) or not price > 0:
+        errors += (INVALID_PRICE,)
+    return errors
+
+
+def check_order(client_id, order_date, total_amount):
+    """
+    Проверяет поля заказа без создания объекта и без исключений.
+
+    Returns
+    -------
+    tuple of str
+        Коды ``EMPTY_FIELD`` и ``NEGATIVE_AMOUNT``; пустой кортеж, если поля корректны.
+    """
+    # is_empty встроена: проверка заказа вызывается на каждой строке импорта
+    empty = (client_id is None or (isinstance(client_id, str) and not client_id.strip())
+             or order_date is None or (isinstance(order_date, str) and not order_date.strip()))
+    errors = (EMPTY_FIELD,) if empty else ()
+    if not isinstance(total_amount, (int, float)) or total_amount < 0:
+        errors += (NEGATIVE_AMOUNT,)
+    return errors
+
+
+def raise_for_errors(errors):
+    """Выбрасывает ``ValueError`` с текстом первой ошибки, если ошибки есть."""
+    if errors:
+        raise ValueError(ERROR_MESSAGES[errors[0]])
+
+
+def to_float(value):
+    """Приводит значение к float, не создавая новый объект для float."""
+    return value if type(value) is float else float(value)
+
 
 class RootClass:
     """Родительский класс с базовой валидацией."""
@@ -19,8 +108,8 @@ class RootClass:
             Если хотя бы один аргумент пустой.
         """
         for value in args:
-            if value is None or (isinstance(value, str) and value.strip() == ''):
-                raise ValueError("Все поля должны быть заполнены")
+            if is_empty(value):
+                raise ValueError(ERROR_MESSAGES[EMPTY_FIELD])
 
 
 class Client(RootClass):
@@ -34,17 +123,13 @@ class Client(RootClass):
         self.city = city
         self.address = address
 
+    def check(self):
+        """Возвращает коды ошибок полей клиента (см. ``check_client``)."""
+        return check_client(self.name, self.email, self.phone, self.city, self.address)
+
     def validate_all(self):
         """Проверяет все поля клиента."""
-        super().validate(self.name, self.email, self.phone, self.city, self.address)
-
-        # Проверка email
-        if not re.match(r"[^@]+@[^@]+\.[^@]+", self.email):
-            raise ValueError("Неверный формат email")
-
-        # Проверка телефона
-        if not re.match(r"^\+?[0-9]{10,15}$", self.phone):
-            raise ValueError("Неверный формат телефона")
+        raise_for_errors(check_client(self.name, self.email, self.phone, self.city, self.address))
 
 
 class Product(RootClass):
@@ -53,14 +138,15 @@ class Product(RootClass):
     def __init__(self, id, name, price):
         self.id = id
         self.name = name
-        self.price = float(price)
+        self.price = to_float(price)
+
+    def check(self):
+        """Возвращает коды ошибок полей товара (см. ``check_product``)."""
+        return check_product(self.name, self.price)
 
     def validate_all(self):
         """Проверяет все поля товара."""
-        super().validate(self.name)
-
-        if self.price <= 0:
-            raise ValueError("Цена должна быть положительным числом")
+        raise_for_errors(check_product(self.name, self.price))
 
 
 class Order(RootClass):
@@ -69,13 +155,14 @@ class Order(RootClass):
     def __init__(self, id, client_id, total_amount, order_date, items=None):
         self.id = id
         self.client_id = client_id
-        self.total_amount = float(total_amount)
+        self.total_amount = to_float(total_amount)
         self.order_date = order_date
         self.items = items if items else []
 
+    def check(self):
+        """Возвращает коды ошибок полей заказа (см. ``check_order``)."""
+        return check_order(self.client_id, self.order_date, self.total_amount)
+
     def validate_all(self):
         """Проверяет все поля заказа."""
-        super().validate(self.client_id, self.order_date)
-
-        if self.total_amount < 0:
-            raise ValueError("Сумма заказа не может быть отрицательной")
\ No newline at end of file
+        raise_for_errors(check_order(self.client_id, self.order_date, self.total_amount))
\ No newline at end of file
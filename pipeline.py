@@ -0,0 +1,364 @@
+"""Параллельный конвейер импорта нескольких файлов CSV/JSON.
+
+Конвейер состоит из трех стадий:
+
+1. разбор и валидация файлов в пуле процессов (по одному файлу на задачу);
+2. ограниченная очередь пакетов строк — если запись не успевает,
+   процессы разбора блокируются на ``put`` (обратное давление);
+3. единственный поток записи в SQLite, вставляющий пакеты через
+   ``executemany`` в одной транзакции на пакет.
+
+Пример::
+
+    pipeline = ImportPipeline(Database(), workers=4)
+    stats = pipeline.run(['clients_1.json', 'products_1.json', 'orders_1.csv'])
+    print(stats.report())
+"""
+import csv
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from db import CHUNK_SIZE, TABLE_COLUMNS, iter_json_array, table_statement
+from models import check_client, check_order, check_product, raise_for_errors, to_float
+
+# Префиксы для генерации ID, если во входных данных его нет
+ID_PREFIXES = {'clients': 'CLT', 'products': 'PRD'}
+
+# Сколько сообщений об ошибках хранить в статистике
+MAX_ERRORS = 100
+
+
+def detect_table(filename):
+    """Определяет таблицу по имени файла (``clients_*.json``, ``orders_*.csv`` и т.п.)."""
+    name = os.path.basename(filename).lower()
+    # order_items проверяется раньше orders, так как имена пересекаются
+    for table in ('order_items', 'clients', 'products', 'orders'):
+        if name.startswith(table):
+            return table
+    raise ValueError(f"Не удалось определить таблицу для файла {filename}")
+
+
+def validate_record(table, record):
+    """
+    Проверяет запись и приводит ее к кортежу значений таблицы.
+
+    Parameters
+    ----------
+    table : str
+        Имя таблицы из ``TABLE_COLUMNS``.
+    record : dict
+        Запись из файла. Поле ``id`` может отсутствовать у клиентов и товаров.
+
+    Returns
+    -------
+    tuple
+        Значения в порядке столбцов таблицы.
+
+    Raises
+    ------
+    ValueError
+        Если запись не проходит валидацию.
+    """
+    try:
+        # Поля проверяются функциями check_* без создания объектов моделей
+        if table == 'clients':
+            row = (record.get('id'), record['name'], record['email'], record['phone'], record['city'],
+                   record['address'])
+            raise_for_errors(check_client(*row[1:]))
+            return row
+        if table == 'products':
+            row = (record.get('id'), record['name'], to_float(record['price']))
+            raise_for_errors(check_product(row[1], row[2]))
+            return row
+        if table == 'orders':
+            row = (record['id'], record['client_id'], to_float(record['total_amount']), record['order_date'])
+            raise_for_errors(check_order(row[1], row[3], row[2]))
+            return row
+        if table == 'order_items':
+            quantity = int(record['quantity'])
+            if quantity <= 0:
+                raise ValueError("Количество должно быть положительным числом")
+            return record['order_id'], record['product_id'], quantity
+    except KeyError as e:
+        raise ValueError(f"Отсутствует поле {e}")
+    raise ValueError(f"Неизвестная таблица {table}")
+
+
+def parse_file(filename, table, out_queue, batch_size):
+    """
+    Разбирает и валидирует один файл, отправляя пакеты строк в очередь.
+
+    Выполняется в процессе пула. Возвращает словарь со статистикой файла.
+    """
+    started = time.perf_counter()
+    blocked = 0.0
+    parsed = 0
+    rejected = 0
+    errors = []
+    batch = []
+
+    def flush():
+        nonlocal blocked
+        put_started = time.perf_counter()
+        out_queue.put((table, batch))
+        blocked += time.perf_counter() - put_started
+
+    with open(filename, 'r', encoding='utf-8', newline='') as file:
+        if filename.lower().endswith('.json'):
+            records = iter_json_array(file)
+        else:
+            records = csv.DictReader(file)
+
+        for record in records:
+            try:
+                batch.append(validate_record(table, record))
+                parsed += 1
+            except (ValueError, TypeError) as e:
+                rejected += 1
+                if len(errors) < MAX_ERRORS:
+                    errors.append(f"{filename}: {e}")
+                continue
+            if len(batch) >= batch_size:
+                flush()
+                batch = []
+
+    if batch:
+        flush()
+
+    return {
+        'file': filename,
+        'parsed': parsed,
+        'rejected': rejected,
+        'errors': errors,
+        'seconds': time.perf_counter() - started,
+        'blocked': blocked,
+    }
+
+
+class StageStats:
+    """Статистика одной стадии конвейера."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.rejected = 0
+        self.busy = 0.0  # суммарное время работы стадии
+        self.blocked = 0.0  # время ожидания соседней стадии
+
+    @property
+    def throughput(self):
+        """Количество строк в секунду рабочего времени стадии."""
+        return self.rows / self.busy if self.busy > 0 else 0.0
+
+    def as_dict(self):
+        """Возвращает статистику в виде словаря."""
+        return {
+            'rows': self.rows,
+            'rejected': self.rejected,
+            'busy_seconds': round(self.busy, 4),
+            'blocked_seconds': round(self.blocked, 4),
+            'rows_per_second': round(self.throughput, 1),
+        }
+
+
+class PipelineStats:
+    """Итоговая статистика запуска конвейера."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.parse = StageStats('parse')
+        self.write = StageStats('write')
+        self.files = 0
+        self.max_queue_depth = 0
+        self.elapsed = 0.0
+        self.errors = []
+
+    def as_dict(self):
+        """Возвращает статистику в виде словаря (для JSON-отчетов)."""
+        return {
+            'workers': self.workers,
+            'files': self.files,
+            'elapsed_seconds': round(self.elapsed, 4),
+            'rows_per_second': round(self.write.rows / self.elapsed, 1) if self.elapsed > 0 else 0.0,
+            'max_queue_depth': self.max_queue_depth,
+            'parse': self.parse.as_dict(),
+            'write': self.write.as_dict(),
+        }
+
+    def report(self):
+        """Возвращает текстовый отчет по стадиям."""
+        total_rate = self.write.rows / self.elapsed if self.elapsed > 0 else 0.0
+        lines = [
+            f"Файлов: {self.files}, процессов: {self.workers}, "
+            f"время: {self.elapsed:.2f} с, итого {total_rate:.0f} строк/с",
+            f"Максимальная глубина очереди: {self.max_queue_depth}",
+        ]
+        for stage in (self.parse, self.write):
+            lines.append(
+                f"  {stage.name:<6} строк: {stage.rows:>9}, отклонено: {stage.rejected:>6}, "
+                f"работа: {stage.busy:.2f} с, ожидание: {stage.blocked:.2f} с, "
+                f"{stage.throughput:.0f} строк/с"
+            )
+        return '\n'.join(lines)
+
+
+class ImportPipeline:
+    """Конвейер импорта: разбор в пуле процессов и один поток записи в SQLite."""
+
+    def __init__(self, db, workers=None, batch_size=CHUNK_SIZE, queue_size=8):
+        """
+        Parameters
+        ----------
+        db : Database
+            База данных, в которую выполняется импорт.
+        workers : int, optional
+            Количество процессов разбора, по умолчанию — число ядер.
+        batch_size : int
+            Количество строк в одном пакете.
+        queue_size : int
+            Максимальное количество пакетов в очереди между стадиями.
+        """
+        self.db = db
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+    def run(self, files, progress=None):
+        """
+        Импортирует файлы и возвращает статистику.
+
+        Parameters
+        ----------
+        files : list
+            Пути к файлам или пары ``(путь, таблица)``.
+        progress : callable, optional
+            Вызывается с количеством записанных строк после каждого пакета.
+
+        Returns
+        -------
+        PipelineStats
+        """
+        tasks = []
+        for entry in files:
+            if isinstance(entry, (tuple, list)):
+                filename, table = entry
+            else:
+                filename, table = entry, detect_table(entry)
+            if table not in TABLE_COLUMNS:
+                raise ValueError(f"Неизвестная таблица {table}")
+            tasks.append((filename, table))
+
+        stats = PipelineStats(self.workers)
+        stats.files = len(tasks)
+        failure = []
+        started = time.perf_counter()
+
+        with multiprocessing.Manager() as manager:
+            batches = manager.Queue(maxsize=self.queue_size)
+            writer = threading.Thread(target=self._write, args=(batches, stats, progress, failure), daemon=True)
+            writer.start()
+
+            try:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    futures = [executor.submit(parse_file, filename, table, batches, self.batch_size)
+                               for filename, table in tasks]
+                    for future in futures:
+                        result = future.result()
+                        stats.parse.rows += result['parsed']
+                        stats.parse.rejected += result['rejected']
+                        stats.parse.busy += result['seconds'] - result['blocked']
+                        stats.parse.blocked += result['blocked']
+                        stats.errors.extend(result['errors'][:MAX_ERRORS - len(stats.errors)])
+            finally:
+                # Сигнал завершения для потока записи
+                batches.put(None)
+                writer.join()
+
+        if failure:
+            raise failure[0]
+
+        stats.elapsed = time.perf_counter() - started
+        return stats
+
+    def _write(self, batches, stats, progress, failure):
+        """Стадия записи: забирает пакеты из очереди и вставляет их в базу."""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        next_ids = {}
+
+        try:
+            while True:
+                wait_started = time.perf_counter()
+                message = batches.get()
+                stats.write.blocked += time.perf_counter() - wait_started
+                if message is None:
+                    break
+                stats.max_queue_depth = max(stats.max_queue_depth, batches.qsize() + 1)
+
+                if failure:
+                    # После ошибки продолжаем разбирать очередь, чтобы не заблокировать процессы разбора
+                    continue
+
+                write_started = time.perf_counter()
+                table, rows = message
+                try:
+                    if table in ID_PREFIXES:
+                        rows = self._assign_ids(cursor, table, rows, next_ids)
+                    written, rejected = self._insert_batch(conn, table, rows, stats)
+                except Exception as e:
+                    failure.append(e)
+                    continue
+                stats.write.rows += written
+                stats.write.rejected += rejected
+                stats.write.busy += time.perf_counter() - write_started
+
+                if progress:
+                    progress(stats.write.rows)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _assign_ids(cursor, table, rows, next_ids):
+        """Генерирует ID для строк без него так же, как ``import_*_from_json``."""
+        if table not in next_ids:
+            cursor.execute(table_statement(table, 'count'))
+            next_ids[table] = cursor.fetchone()[0] + 1
+
+        prefix = ID_PREFIXES[table]
+        result = []
+        for row in rows:
+            if not row[0]:
+                row = (f"{prefix}{next_ids[table]:03d}",) + tuple(row[1:])
+                next_ids[table] += 1
+            result.append(row)
+        return result
+
+    @staticmethod
+    def _insert_batch(conn, table, rows, stats):
+        """Вставляет пакет одной транзакцией, при конфликте — построчно."""
+        query = table_statement(table, 'insert')
+
+        try:
+            with conn:
+                conn.executemany(query, rows)
+            return len(rows), 0
+        except sqlite3.IntegrityError:
+            pass
+
+        # В пакете есть конфликтующие строки: вставляем по одной и пропускаем ошибочные
+        written = 0
+        rejected = 0
+        with conn:
+            for row in rows:
+                try:
+                    conn.execute(query, row)
+                    written += 1
+                except sqlite3.IntegrityError as e:
+                    rejected += 1
+                    if len(stats.errors) < MAX_ERRORS:
+                        stats.errors.append(f"{table} {row[0]}: {e}")
+        return written, rejected
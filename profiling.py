@@ -0,0 +1,447 @@
+"""Профилирование обработчиков событий окна приложения.
+
+Включается переменной окружения ``MANAGER_PROFILE``:
+
+- ``1`` или ``time`` — время обработчиков по фазам и журнал зависаний;
+- ``cprofile`` — то же и профиль ``cProfile`` каждого вызова;
+- ``stacks`` — то же и выборки стека главного потока раз в
+  ``SAMPLE_INTERVAL`` секунд в формате collapsed stacks (``flamegraph.pl``,
+  speedscope).
+
+После режима через двоеточие задается порог зависания в миллисекундах,
+например ``MANAGER_PROFILE=stacks:50``. Без переменной профилировщик не
+создается и окно работает без оберток.
+
+Время вызова обработчика делится на фазы:
+
+- ``db`` — SQL-запросы и чтение их результатов (по инструментированию ``Database``);
+- ``tk`` — вызовы Tcl/Tk внутри обработчика, например вставка строк в ``Treeview``;
+- ``render`` — отрисовка графиков matplotlib и перерисовка окна после
+  обработчика, до ближайшего простоя цикла событий;
+- ``python`` — остальное: построение моделей, подготовка данных.
+
+Модальные диалоги (сообщения, выбор файла) — ожидание пользователя, в фазы
+оно не входит. Вызов дольше порога попадает в журнал зависаний; туда же
+записываются задержки цикла событий вне обернутых обработчиков (их ловит
+таймер с периодом ``HEARTBEAT_MS``). Профиль зависшего вызова сохраняется
+в каталог сразу, сводка и общие профили обработчиков — при закрытии окна.
+"""
+import collections
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+from instrumentation import SLOW_LOG_SIZE, LatencyHistogram
+
+# Переменная окружения, включающая профилирование
+ENV_VAR = 'MANAGER_PROFILE'
+
+# Значение переменной -> режим
+MODES = {'1': 'time', 'time': 'time', 'cprofile': 'cprofile', 'stacks': 'stacks'}
+
+# Каталог сводки и профилей
+PROFILE_DIR = 'profiles'
+
+# Порог зависания по умолчанию, мс
+STALL_MS = 100
+
+# Период проверки цикла событий, мс
+HEARTBEAT_MS = 50
+
+# Период выборки стека в режиме stacks, с
+SAMPLE_INTERVAL = 0.005
+
+# Фазы вызова обработчика
+PHASES = ('db', 'python', 'tk', 'render')
+
+# Команды Tcl/Tk, которые ждут пользователя
+WAIT_COMMANDS = frozenset(('tk_messageBox', 'tk_getOpenFile', 'tk_getSaveFile', 'tk_chooseDirectory',
+                           'tk_chooseColor', 'tkwait', 'vwait'))
+
+SUMMARY_NAME = 'summary.json'
+STACKS_NAME = 'stacks.folded'
+
+
+def from_environment(environ=None):
+    """
+    Создает профилировщик по переменной ``MANAGER_PROFILE``.
+
+    Returns
+    -------
+    Profiler or None
+        None, если переменная не задана, пуста или равна ``0``.
+    """
+    value = (os.environ if environ is None else environ).get(ENV_VAR, '').strip().lower()
+    if value in ('', '0', 'off'):
+        return None
+    mode, _, stall_ms = value.partition(':')
+    if mode not in MODES:
+        raise ValueError(f"Неизвестный режим профилирования {mode}, ожидается один из {', '.join(MODES)}")
+    try:
+        stall_ms = float(stall_ms) if stall_ms else STALL_MS
+    except ValueError:
+        raise ValueError(f"Порог зависания должен быть числом миллисекунд: {stall_ms}") from None
+    return Profiler(MODES[mode], stall_ms=stall_ms)
+
+
+def write_folded(path, stacks):
+    """Сохраняет выборки стека в формате collapsed stacks: ``кадр;кадр;... число``."""
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+    os.replace(path + '.tmp', path)
+
+
+class _Call:
+    """Один вызов обработчика: время по фазам и стек текущих фаз."""
+
+    def __init__(self, name, sql_seconds):
+        self.name = name
+        self.phases = dict.fromkeys(PHASES + ('wait',), 0.0)
+        self.stack = ['python']
+        self.started = self.switched = time.perf_counter()
+        self.ended = None
+        self.sql_started = sql_seconds
+        self.profile = None
+        self.samples = collections.Counter()
+
+    def switch(self, now):
+        """Относит время с прошлого переключения к текущей фазе."""
+        self.phases[self.stack[-1]] += now - self.switched
+        self.switched = now
+
+    def enter(self, phase):
+        self.switch(time.perf_counter())
+        self.stack.append(phase)
+
+    def leave(self):
+        self.switch(time.perf_counter())
+        self.stack.pop()
+
+
+class TkTimer:
+    """
+    Обертка интерпретатора Tcl окна, замеряющая вызовы Tk внутри обработчиков.
+
+    Виджеты берут ``master.tk`` при создании, поэтому обертка ставится до
+    создания виджетов. Остальные атрибуты передаются интерпретатору.
+    """
+
+    def __init__(self, tk, profiler):
+        self._tk = tk
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._tk, name)
+
+    def call(self, *args):
+        call = self._profiler.current
+        if call is None:
+            return self._tk.call(*args)
+        # tkinter передает команду и отдельными аргументами, и одним кортежем
+        command = args[0] if args else None
+        if isinstance(command, tuple):
+            command = command[0] if command else None
+        call.enter('wait' if isinstance(command, str) and command in WAIT_COMMANDS else 'tk')
+        try:
+            return self._tk.call(*args)
+        finally:
+            call.leave()
+
+
+class Profiler:
+    """
+    Замеры обработчиков событий окна.
+
+    Parameters
+    ----------
+    mode : str
+        ``'time'``, ``'cprofile'`` или ``'stacks'`` (см. описание модуля).
+    directory : str
+        Каталог сводки и профилей; создается при первой записи.
+    stall_ms : float
+        Порог зависания в миллисекундах.
+
+    Attributes
+    ----------
+    current : _Call or None
+        Выполняющийся обработчик; вложенные обработчики учитываются во внешнем.
+    """
+
+    def __init__(self, mode='time', directory=PROFILE_DIR, stall_ms=STALL_MS):
+        if mode not in MODES.values():
+            raise ValueError(f"Неизвестный режим профилирования {mode}")
+        self.mode = mode
+        self.directory = directory
+        self.stall_ms = stall_ms
+        self.current = None
+        self.handlers = collections.defaultdict(LatencyHistogram)
+        self.phase_totals = collections.defaultdict(lambda: dict.fromkeys(PHASES, 0.0))
+        self.stalls = collections.deque(maxlen=SLOW_LOG_SIZE)
+        self.stall_count = 0
+        # Общие профили и выборки стека по всем вызовам
+        self.profiles = {}
+        self.stacks = collections.Counter()
+        # Время обработчиков без ожидания пользователя: вычитается из задержек цикла событий
+        self.busy = 0.0
+        self.app = None
+        self.db = None
+        self._main = threading.get_ident()
+        self._patched = []
+        self._heartbeat_job = None
+        self._expected = None
+        self._busy_mark = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def install(self, app, handlers):
+        """
+        Подключает профилировщик к окну.
+
+        Обертки ставятся на экземпляр, поэтому вызывается до создания
+        виджетов, которые ссылаются на методы окна.
+
+        Parameters
+        ----------
+        app : Application
+            Окно приложения.
+        handlers : tuple of str
+            Имена или префиксы имен методов окна, которые замеряются.
+        """
+        self.app = app
+        self.db = app.db
+        if self.db.instrumentation is None:
+            self.db.enable_instrumentation()
+        app.tk = TkTimer(app.tk, self)
+        for name in vars(type(app)):
+            if name.startswith(handlers) and callable(getattr(app, name)):
+                setattr(app, name, self.wrap(name, getattr(app, name)))
+
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        self.patch(FigureCanvasTkAgg, 'draw', 'render')
+        self.start()
+        return self
+
+    def wrap(self, name, func):
+        """Оборачивает обработчик замером; вызовы не из главного потока не замеряются."""
+        def wrapper(*args, **kwargs):
+            if self.current is not None or threading.get_ident() != self._main:
+                return func(*args, **kwargs)
+            return self._call(name, func, args, kwargs)
+
+        wrapper.__name__ = name
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def patch(self, cls, attr, phase):
+        """Относит время метода класса (например, отрисовки графика) к фазе ``phase``."""
+        original = getattr(cls, attr)
+
+        def wrapper(*args, **kwargs):
+            call = self.current
+            if call is None:
+                return original(*args, **kwargs)
+            call.enter(phase)
+            try:
+                return original(*args, **kwargs)
+            finally:
+                call.leave()
+
+        wrapper.__name__ = original.__name__
+        wrapper.__wrapped__ = original
+        self._patched.append((cls, attr, vars(cls).get(attr)))
+        setattr(cls, attr, wrapper)
+
+    def _sql_seconds(self):
+        instrumentation = self.db.instrumentation if self.db is not None else None
+        return instrumentation.thread_seconds() if instrumentation is not None else 0.0
+
+    def _call(self, name, func, args, kwargs):
+        call = _Call(name, self._sql_seconds())
+        if self.mode == 'cprofile':
+            call.profile = cProfile.Profile()
+        self.current = call
+        try:
+            if call.profile is not None:
+                return call.profile.runcall(func, *args, **kwargs)
+            return func(*args, **kwargs)
+        finally:
+            now = time.perf_counter()
+            call.switch(now)
+            call.ended = now
+            self.current = None
+            # Запросы выполняются из кода обработчика, поэтому их время вычитается из фазы python
+            sql = max(self._sql_seconds() - call.sql_started, 0.0)
+            call.phases['db'] = sql
+            call.phases['python'] = max(call.phases['python'] - sql, 0.0)
+            self.busy += now - call.started - call.phases['wait']
+            if self.app is not None:
+                # Перерисовка, запланированная обработчиком, выполняется до простоя цикла событий
+                self.app.after_idle(self._finish, call, self.busy)
+            else:
+                self._finish(call)
+
+    def _finish(self, call, busy_mark=None):
+        if busy_mark is not None:
+            # Обработчики, выполненные до простоя, замерены отдельно
+            render = max(time.perf_counter() - call.ended - (self.busy - busy_mark), 0.0)
+            call.phases['render'] += render
+            self.busy += render
+        phases = {phase: call.phases[phase] for phase in PHASES}
+        total = sum(phases.values())
+        with self._lock:
+            self.handlers[call.name].record(total)
+            for phase, seconds in phases.items():
+                self.phase_totals[call.name][phase] += seconds
+            self.stacks.update(call.samples)
+            if call.profile is not None:
+                if call.name in self.profiles:
+                    self.profiles[call.name].add(call.profile)
+                else:
+                    self.profiles[call.name] = pstats.Stats(call.profile)
+        if total * 1000 >= self.stall_ms:
+            self._stall(call.name, total, phases, call)
+
+    def _path(self, name):
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, name)
+
+    def _stall(self, name, seconds, phases, call=None):
+        """Записывает зависание; профиль зависшего вызова сохраняется в каталог."""
+        self.stall_count += 1
+        path = None
+        stem = f"stall-{self.stall_count:04d}-{name or 'loop'}"
+        if call is not None and call.profile is not None:
+            path = self._path(stem + '.prof')
+            call.profile.dump_stats(path)
+        elif call is not None and call.samples:
+            path = self._path(stem + '.folded')
+            write_folded(path, call.samples)
+        self.stalls.append({
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'handler': name,
+            'ms': round(seconds * 1000, 3),
+            'phases_ms': {phase: round(value * 1000, 3) for phase, value in phases.items()} if phases else None,
+            'profile': path,
+        })
+
+    def _heartbeat(self):
+        """Проверяет, насколько опоздал таймер, не считая времени замеренных обработчиков."""
+        now = time.perf_counter()
+        blocked = now - self._expected - (self.busy - self._busy_mark)
+        if blocked * 1000 >= self.stall_ms:
+            self._stall(None, blocked, None)
+        self._expected = now + HEARTBEAT_MS / 1000
+        self._busy_mark = self.busy
+        self._heartbeat_job = self.app.after(HEARTBEAT_MS, self._heartbeat)
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            call = self.current
+            frame = sys._current_frames().get(self._main) if call is not None else None
+            stack = []
+            # Стек от кадра обертки обработчика; кадры tkinter и mainloop ниже него отбрасываются
+            while frame is not None and frame.f_code is not _CALL_CODE:
+                code = frame.f_code
+                if code is _TK_CALL_CODE:
+                    stack.append('[tk]')
+                elif code.co_filename != __file__:
+                    stack.append(f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}")
+                frame = frame.f_back
+            if frame is None:
+                continue
+            with self._lock:
+                if self.current is call:
+                    call.samples[';'.join([call.name] + stack[::-1])] += 1
+
+    def start(self):
+        """Запускает проверку цикла событий и, в режиме stacks, поток выборки стека."""
+        if self.app is not None and self._heartbeat_job is None:
+            self._expected = time.perf_counter() + HEARTBEAT_MS / 1000
+            self._busy_mark = self.busy
+            self._heartbeat_job = self.app.after(HEARTBEAT_MS, self._heartbeat)
+        if self.mode == 'stacks' and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name='profiler-sampler', daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        """
+        Возвращает собранную статистику.
+
+        Returns
+        -------
+        dict
+            ``handlers`` — гистограммы времени обработчиков с суммами по фазам
+            (``phases_ms``), ``stalls`` — журнал зависаний; ``handler`` равен
+            None для задержек цикла событий вне обработчиков.
+        """
+        with self._lock:
+            handlers = {}
+            for name, hist in sorted(self.handlers.items()):
+                handlers[name] = hist.as_dict()
+                handlers[name]['phases_ms'] = {phase: round(seconds * 1000, 3)
+                                               for phase, seconds in self.phase_totals[name].items()}
+            return {
+                'mode': self.mode,
+                'stall_ms': self.stall_ms,
+                'handlers': handlers,
+                'stalls': list(self.stalls),
+            }
+
+    def reset(self):
+        """Очищает собранную статистику; сохраненные профили зависаний остаются."""
+        with self._lock:
+            self.handlers.clear()
+            self.phase_totals.clear()
+            self.stalls.clear()
+            self.profiles.clear()
+            self.stacks.clear()
+
+    def close(self):
+        """
+        Останавливает замеры и сохраняет сводку и общие профили в каталог.
+
+        Пишутся ``summary.json``, ``<обработчик>.prof`` в режиме cprofile
+        и ``stacks.folded`` в режиме stacks.
+
+        Returns
+        -------
+        str
+            Путь к сводке.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._heartbeat_job is not None:
+            self.app.after_cancel(self._heartbeat_job)
+            self._heartbeat_job = None
+        for cls, attr, original in reversed(self._patched):
+            if original is None:
+                delattr(cls, attr)
+            else:
+                setattr(cls, attr, original)
+        self._patched = []
+
+        path = self._path(SUMMARY_NAME)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.stats(), f, ensure_ascii=False, indent=2)
+        os.replace(path + '.tmp', path)
+        for name, stats in self.profiles.items():
+            stats.dump_stats(self._path(f"{name}.prof"))
+        if self.stacks:
+            write_folded(self._path(STACKS_NAME), self.stacks)
+        return path
+
+
+# Кадры, по которым выборка стека узнает обертку обработчика и вызов Tk
+_CALL_CODE = Profiler._call.__code__
+_TK_CALL_CODE = TkTimer.call.__code__
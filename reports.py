@@ -0,0 +1,212 @@
+"""Пакетная отрисовка графиков аналитики в файлы без дисплея.
+
+Данные графиков готовит ``Analysis.<имя>_data`` в текущем процессе, а рисуют
+их функции из ``analysis.CHARTS`` в ``Figure`` без pyplot и Tk: при сохранении
+matplotlib сам выбирает бэкенд по формату (Agg для PNG, SVG, PDF).
+Отрисовка занимает большую часть времени, поэтому отдельные файлы рисуются
+параллельно в пуле процессов; в рабочие процессы передаются только данные,
+соединение с базой туда не попадает.
+
+Рядом с файлами отчета хранится ``.report-cache.json`` с отпечатками данных
+(SHA-256 от pickle данных и параметров отрисовки). Если данные графика не
+изменились и файл на месте, график не перерисовывается.
+"""
+import hashlib
+import io
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis import CHARTS, Analysis
+
+# Форматы файлов; pdf — один многостраничный файл со всеми графиками
+FORMATS = ('png', 'svg', 'pdf')
+
+# Разрешение растровых файлов
+DPI = 100
+
+# Файл с отпечатками данных в каталоге отчета
+MANIFEST = '.report-cache.json'
+
+# Входит в отпечаток: увеличьте при изменении функций draw_*, чтобы сбросить кеш
+RENDER_VERSION = 1
+
+# Имя многостраничного PDF-отчета
+PDF_NAME = 'report.pdf'
+
+
+def fingerprint(name, data, fmt, dpi=DPI):
+    """Возвращает отпечаток данных графика вместе с параметрами отрисовки."""
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    # Без мемоизации: иначе равные данные дают разные байты в зависимости от того,
+    # ссылаются ли они на одни и те же объекты (например, ID из базы и из кеша раскладок)
+    pickler.fast = True
+    pickler.dump((RENDER_VERSION, name, fmt, dpi, data))
+    return hashlib.sha256(buffer.getvalue()).hexdigest()
+
+
+def _save(fig, path, fmt, dpi):
+    """Сохраняет график через временный файл, чтобы не оставить недописанный файл."""
+    temp_path = path + '.tmp'
+    try:
+        fig.savefig(temp_path, format=fmt, dpi=dpi)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def render_chart(name, data, path, fmt='png', dpi=DPI):
+    """
+    Рисует график по подготовленным данным и сохраняет в файл.
+
+    Функция верхнего уровня, поэтому выполняется и в рабочем процессе.
+
+    Returns
+    -------
+    str or None
+        ``path`` или None, если данных для графика нет (файл не создается).
+    """
+    fig = CHARTS[name](data)
+    if fig is None:
+        return None
+    _save(fig, path, fmt, dpi)
+    return path
+
+
+class ReportRenderer:
+    """
+    Отрисовка графиков аналитики в каталог отчета.
+
+    Parameters
+    ----------
+    db : Database
+        База данных приложения.
+    directory : str
+        Каталог отчета; создается при необходимости.
+    fmt : str
+        ``'png'``, ``'svg'`` — файл ``<график>.<fmt>`` на каждый график,
+        или ``'pdf'`` — один многостраничный ``report.pdf``.
+    workers : int, optional
+        Число процессов для отрисовки; по умолчанию — число ядер.
+        При ``1`` графики рисуются в текущем процессе.
+    dpi : int
+        Разрешение растровых файлов.
+    """
+
+    def __init__(self, db, directory, fmt='png', workers=None, dpi=DPI):
+        if fmt not in FORMATS:
+            raise ValueError(f"Неизвестный формат {fmt}, ожидается один из {', '.join(FORMATS)}")
+        self.analysis = Analysis(db)
+        self.directory = directory
+        self.fmt = fmt
+        self.workers = workers or os.cpu_count() or 1
+        self.dpi = dpi
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        path = os.path.join(self.directory, MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def _is_fresh(self, manifest, key, digest):
+        entry = manifest.get(key)
+        return (entry is not None and entry['fingerprint'] == digest
+                and (entry['path'] is None or os.path.exists(entry['path'])))
+
+    def render(self, charts=None):
+        """
+        Рисует графики, данные которых изменились с прошлой отрисовки.
+
+        Parameters
+        ----------
+        charts : list of str, optional
+            Имена графиков из ``analysis.CHARTS``; по умолчанию — все.
+
+        Returns
+        -------
+        dict
+            ``files`` (график -> путь или None, если данных нет), ``rendered``
+            и ``cached`` (сколько графиков нарисовано и взято из кеша)
+            и ``seconds``.
+        """
+        started = time.perf_counter()
+        names = list(charts or CHARTS)
+        os.makedirs(self.directory, exist_ok=True)
+        # Данные готовятся последовательно: все запросы идут через одно соединение
+        data = {name: self.analysis.chart_data(name) for name in names}
+        manifest = self._load_manifest()
+
+        if self.fmt == 'pdf':
+            files, rendered = self._render_pdf(names, data, manifest)
+        else:
+            files, rendered = self._render_files(names, data, manifest)
+
+        self._save_manifest(manifest)
+        return {
+            'files': files,
+            'rendered': rendered,
+            'cached': len(names) - rendered,
+            'seconds': time.perf_counter() - started,
+        }
+
+    def _render_files(self, names, data, manifest):
+        files = {}
+        pending = {}
+        for name in names:
+            digest = fingerprint(name, data[name], self.fmt, self.dpi)
+            if self._is_fresh(manifest, name, digest):
+                files[name] = manifest[name]['path']
+            else:
+                pending[name] = digest
+
+        paths = {name: os.path.join(self.directory, f"{name}.{self.fmt}") for name in pending}
+        if self.workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(pending))) as executor:
+                futures = {name: executor.submit(render_chart, name, data[name], paths[name], self.fmt, self.dpi)
+                           for name in pending}
+                results = {name: future.result() for name, future in futures.items()}
+        else:
+            results = {name: render_chart(name, data[name], paths[name], self.fmt, self.dpi) for name in pending}
+
+        for name, digest in pending.items():
+            path = results[name]
+            # График без данных: удаляем файл прошлого отчета, чтобы он не выдавался за текущий
+            if path is None and os.path.exists(paths[name]):
+                os.remove(paths[name])
+            manifest[name] = {'fingerprint': digest, 'path': path}
+            files[name] = path
+        return {name: files[name] for name in names}, len(pending)
+
+    def _render_pdf(self, names, data, manifest):
+        """Рисует многостраничный PDF; страницы пишутся в один файл, поэтому последовательно."""
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        path = os.path.join(self.directory, PDF_NAME)
+        digest = fingerprint(tuple(names), [data[name] for name in names], self.fmt, self.dpi)
+        if self._is_fresh(manifest, PDF_NAME, digest):
+            return {name: path for name in names}, 0
+
+        temp_path = path + '.tmp'
+        try:
+            with PdfPages(temp_path) as pdf:
+                for name in names:
+                    fig = CHARTS[name](data[name])
+                    if fig is not None:
+                        pdf.savefig(fig)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        manifest[PDF_NAME] = {'fingerprint': digest, 'path': path}
+        return {name: path for name in names}, len(names)
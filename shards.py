@@ -0,0 +1,245 @@
+"""Несколько магазинов: отдельная база SQLite на каждый магазин.
+
+``ShardedDatabase`` направляет запись в базу нужного магазина, а чтение
+выполняет во всех базах параллельно в пуле потоков и объединяет результаты.
+Клиенты, товары и заказы принадлежат одному магазину, поэтому ID могут
+повторяться в разных базах; в объединенных результатах к записи
+добавляется имя магазина.
+
+Для произвольных запросов по всем магазинам ``connect_attached`` подключает
+базы через ``ATTACH`` и создает представления ``all_<таблица>``.
+"""
+import glob
+import heapq
+import operator
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from db import Database, TABLES, TABLE_COLUMNS
+
+# Имя магазина используется как имя схемы в ATTACH
+STORE_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# Расширение файлов баз в каталоге магазинов
+SHARD_SUFFIX = '.db'
+
+
+class ShardedDatabase:
+    """
+    Базы данных нескольких магазинов.
+
+    Parameters
+    ----------
+    shards : dict
+        Имя магазина -> путь к файлу базы или ``Database``. Базы, открытые
+        по пути, закрываются в ``close``; переданные ``Database`` — нет.
+    workers : int, optional
+        Размер пула потоков для чтения; по умолчанию — число магазинов.
+        SQLite отпускает GIL на время выполнения запроса, поэтому запросы
+        к разным базам идут параллельно.
+    """
+
+    def __init__(self, shards, workers=None):
+        if not shards:
+            raise ValueError("Нужен хотя бы один магазин")
+        self.shards = {}
+        # Базы, открытые самим классом
+        self.owned = []
+        for store, shard in shards.items():
+            if not STORE_NAME.match(store):
+                raise ValueError(f"Недопустимое имя магазина: {store}")
+            if not isinstance(shard, Database):
+                shard = Database(shard)
+                self.owned.append(shard)
+            self.shards[store] = shard
+        self.executor = ThreadPoolExecutor(max_workers=workers or len(self.shards), thread_name_prefix='shard')
+
+    @classmethod
+    def from_directory(cls, directory, workers=None):
+        """Создает по базе на каждый файл ``<магазин>.db`` в каталоге."""
+        paths = sorted(glob.glob(os.path.join(directory, '*' + SHARD_SUFFIX)))
+        shards = {os.path.basename(path)[:-len(SHARD_SUFFIX)]: path for path in paths}
+        return cls(shards, workers)
+
+    def close(self):
+        """Останавливает пул потоков и закрывает соединения баз, открытых по пути."""
+        self.executor.shutdown()
+        for db in self.owned:
+            db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    @property
+    def stores(self):
+        """Имена магазинов."""
+        return list(self.shards)
+
+    def __getitem__(self, store):
+        """Возвращает ``Database`` магазина."""
+        try:
+            return self.shards[store]
+        except KeyError:
+            raise KeyError(f"Неизвестный магазин: {store}") from None
+
+    def fan_out(self, method, *args, **kwargs):
+        """
+        Вызывает метод ``Database`` во всех магазинах параллельно.
+
+        Returns
+        -------
+        dict
+            Имя магазина -> результат, в порядке магазинов.
+
+        Raises
+        ------
+        Exception
+            Первая ошибка из магазинов (остальные запросы дожидаются завершения).
+        """
+        futures = {store: self.executor.submit(getattr(db, method), *args, **kwargs)
+                   for store, db in self.shards.items()}
+        return {store: future.result() for store, future in futures.items()}
+
+    def _tagged(self, method, *args, **kwargs):
+        return [(store, row) for store, rows in self.fan_out(method, *args, **kwargs).items() for row in rows]
+
+    # Запись направляется в базу магазина
+    def add_client(self, store, client):
+        """Добавляет клиента в базу магазина."""
+        return self[store].add_client(client)
+
+    def add_product(self, store, product):
+        """Добавляет товар в базу магазина."""
+        return self[store].add_product(product)
+
+    def add_order(self, store, order):
+        """Добавляет заказ в базу магазина."""
+        return self[store].add_order(order)
+
+    def delete_client(self, store, client_id):
+        """Удаляет клиента из базы магазина."""
+        return self[store].delete_client(client_id)
+
+    def delete_product(self, store, product_id):
+        """Удаляет товар из базы магазина."""
+        return self[store].delete_product(product_id)
+
+    def delete_order(self, store, order_id):
+        """Удаляет заказ из базы магазина."""
+        return self[store].delete_order(order_id)
+
+    def get_next_id(self, store, table_name):
+        """Генерирует ID новой записи в базе магазина."""
+        return self[store].get_next_id(table_name)
+
+    # Чтение по всем магазинам
+    def get_clients(self, search_term=""):
+        """Возвращает клиентов всех магазинов: ``[(store, Client), ...]``."""
+        return self._tagged('get_clients', search_term)
+
+    def get_products(self, search_term=""):
+        """Возвращает товары всех магазинов: ``[(store, Product), ...]``."""
+        return self._tagged('get_products', search_term)
+
+    def get_orders(self, search_term=""):
+        """Возвращает заказы всех магазинов: ``[(store, Order), ...]``."""
+        return self._tagged('get_orders', search_term)
+
+    def find_orders(self, sort='order_date', descending=False, limit=None, **filters):
+        """
+        Ищет заказы во всех магазинах (фильтры как в ``Database.find_orders``).
+
+        Каждый магазин возвращает не больше ``limit`` заказов, уже
+        отсортированных; списки сливаются без полной пересортировки.
+
+        Returns
+        -------
+        list of tuple
+            ``[(store, Order), ...]``.
+        """
+        results = self.fan_out('find_orders', sort=sort, descending=descending, limit=limit, **filters)
+        key = operator.attrgetter(sort)
+        streams = [[(store, order) for order in orders] for store, orders in results.items()]
+        merged = heapq.merge(*streams, key=lambda row: key(row[1]), reverse=descending)
+        return list(merged)[:limit] if limit is not None else list(merged)
+
+    def get_top_clients(self, limit=5):
+        """
+        Возвращает топ клиентов всех магазинов по количеству заказов.
+
+        Клиент принадлежит одному магазину, поэтому общий топ выбирается
+        из топов магазинов.
+
+        Returns
+        -------
+        list of tuple
+            ``(store, client_id, name, order_count)``.
+        """
+        rows = [(store, *row) for store, top in self.fan_out('get_top_clients', limit).items() for row in top]
+        return heapq.nlargest(limit, rows, key=operator.itemgetter(3))
+
+    def get_orders_dynamics(self):
+        """
+        Возвращает динамику заказов всех магазинов по датам.
+
+        Returns
+        -------
+        list of tuple
+            ``(order_date, order_count, total_amount)``, отсортированные по дате.
+        """
+        totals = defaultdict(lambda: [0, 0.0])
+        for dynamics in self.fan_out('get_orders_dynamics').values():
+            for order_date, order_count, total_amount in dynamics:
+                totals[order_date][0] += order_count
+                totals[order_date][1] += total_amount
+        return [(order_date, count, amount) for order_date, (count, amount) in sorted(totals.items())]
+
+    def get_store_totals(self):
+        """
+        Возвращает количество заказов и выручку по магазинам.
+
+        Returns
+        -------
+        list of tuple
+            ``(store, order_count, total_amount)``.
+        """
+        result = []
+        for store, dynamics in self.fan_out('get_orders_dynamics').items():
+            result.append((store, sum(row[1] for row in dynamics), sum(row[2] for row in dynamics)))
+        return result
+
+    def connect_attached(self):
+        """
+        Открывает соединение, к которому подключены базы всех магазинов.
+
+        База магазина доступна как схема с его именем (``shop1.orders``),
+        а временные представления ``all_clients``, ``all_products``,
+        ``all_orders`` и ``all_order_items`` объединяют таблицы всех
+        магазинов со столбцом ``store``. SQLite по умолчанию подключает
+        не больше 10 баз; для большего числа магазинов используйте ``fan_out``.
+
+        Returns
+        -------
+        sqlite3.Connection
+            Соединение с базой в памяти; закрывается вызывающим кодом.
+        """
+        conn = sqlite3.connect(':memory:')
+        try:
+            for store, db in self.shards.items():
+                conn.execute(f'ATTACH DATABASE ? AS "{store}"', (db.db_name,))
+            for table_name in TABLES:
+                columns = ', '.join(TABLE_COLUMNS[table_name])
+                union = ' UNION ALL '.join(f"SELECT '{store}' AS store, {columns} FROM \"{store}\".{table_name}"
+                                           for store in self.shards)
+                conn.execute(f"CREATE TEMP VIEW all_{table_name} AS {union}")
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
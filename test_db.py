@@ -0,0 +1,1389 @@
+import asyncio
+import contextlib
+import csv
+import gc
+import io
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import tracemalloc
+import unittest
+from unittest import mock
+
+from api import ApiServer
+from audit import RESET, UNKNOWN_ACTOR, AuditLog, decode_frame, encode_frame, iter_frames, replay, segments
+from backup import BackupScheduler, check_integrity
+from basket import MarketBasket
+from benchmarks.compare import compare
+from benchmarks.datagen import generate
+from benchmarks.run import run_benchmarks
+from analysis import client_graph
+import cli
+from columnar import Snapshot
+from customers import CustomerAnalytics
+from dedup import Deduplicator, normalize_email, normalize_name, normalize_phone
+from db import (DELETED, INSERTED, RELOADED, UPDATED, Database, OrderItemsCache, STATEMENTS, TABLE_COLUMNS,
+                TABLE_KEYS, insert_statement, iter_json_array, table_statement)
+from instrumentation import LatencyHistogram, strip_literals
+from layout import LayoutCache
+from models import Client, Product, Order
+from pipeline import ImportPipeline, detect_table, validate_record
+from reports import ReportRenderer
+from shards import ShardedDatabase
+
+# Типовые записи тестов
+IVAN = ("CLT001", "Иван", "ivan@mail.com", "+79161234567", "Москва", "ул. Тестовая")
+ANNA = ("CLT002", "Анна", "anna@mail.com", "+79167654321", "Казань", "ул. Новая")
+PHONE = ("PRD001", "Телефон", 100.0)
+
+
+def fill(db, clients=(), products=(), orders=()):
+    """Добавляет в базу клиентов, товары и заказы, заданные кортежами аргументов конструкторов."""
+    for row in clients:
+        db.add_client(Client(*row))
+    for row in products:
+        db.add_product(Product(*row))
+    for row in orders:
+        db.add_order(Order(*row))
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Основа тестов с базой: временный каталог и пустая база ``self.db``."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        # Cleanup выполняются в обратном порядке, поэтому каталог удаляется последним,
+        # после закрытия базы и всего, что тесты откроют позже (журналы, соединения)
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.db = Database(self.path('test.db'))
+        self.addCleanup(self.db.close)
+
+    def path(self, name):
+        """Возвращает путь к файлу во временном каталоге теста."""
+        return os.path.join(self.directory, name)
+
+    def fill(self, clients=(), products=(), orders=()):
+        """Добавляет записи в ``self.db`` (см. ``fill``)."""
+        fill(self.db, clients, products, orders)
+
+
+class TestCli(DatabaseTestCase):
+    """Тесты консольного интерфейса и потокового чтения JSON."""
+
+    def run_cli(self, *argv, db_name=None):
+        """Выполняет команду cli и возвращает код возврата и вывод в stdout."""
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(io.StringIO()):
+            code = cli.main(['--db', db_name or self.db.db_name, '--quiet', *argv])
+        return code, stdout.getvalue()
+
+    def test_iter_json_array(self):
+        """Тест: элементы читаются по одному при блоке чтения меньше элемента."""
+        items = [{'name': "Иван", 'note': "], [, \"{"}, [1, [2, 3]], "строка", 4.5, None, {}]
+        text = json.dumps(items, ensure_ascii=False, indent=4)
+        for buffer_size in (1, 2, 7, 65536):
+            with self.subTest(buffer_size=buffer_size):
+                self.assertEqual(list(iter_json_array(io.StringIO(text), buffer_size)), items)
+        self.assertEqual(list(iter_json_array(io.StringIO(" [ ] "))), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('{"name": "Иван"}')))
+        for text in ('[{"name": "Иван"}, {"name"', '[1 2]', '[1,,2]', '[,1]', '[1,]', '[1', '['):
+            for buffer_size in (2, 65536):
+                with self.subTest(text=text, buffer_size=buffer_size), self.assertRaises(ValueError):
+                    list(iter_json_array(io.StringIO(text), buffer_size))
+
+    def test_export_import_round_trip(self):
+        """Тест: выгрузка cli export загружается cli import в другую базу без изменений."""
+        self.fill(clients=(IVAN, ANNA), products=(PHONE,))
+        other = self.path('other.db')
+        for name in ('clients.csv', 'products.json'):
+            table = name.split('.')[0]
+            with self.subTest(name=name):
+                self.assertEqual(self.run_cli('export', table, self.path(name)), (0, ''))
+                self.assertEqual(self.run_cli('import', table, self.path(name), db_name=other), (0, ''))
+
+        db = Database(other)
+        self.addCleanup(db.close)
+        self.assertEqual([vars(c) for c in db.get_clients()], [vars(c) for c in self.db.get_clients()])
+        # Товары из JSON получают новые ID по порядку
+        self.assertEqual([(p.id, p.name, p.price) for p in db.get_products()], [PHONE])
+
+    def test_errors_return_exit_code(self):
+        """Тест: ошибка задания печатается и дает код возврата 1."""
+        self.assertEqual(self.run_cli('export', 'clients', self.path('clients.xml'))[0], 1)
+        self.assertEqual(self.run_cli('import', 'orders', self.path('missing.json'))[0], 1)
+
+    def test_report(self):
+        """Тест: отчет печатает топ клиентов и динамику заказов."""
+        self.fill(clients=(IVAN,), products=(PHONE,),
+                  orders=(("ORD001", "CLT001", 100.0, "2024-01-10 10:00:00", [("PRD001", 1)]),))
+        code, output = self.run_cli('report', '--limit', '1')
+        self.assertEqual(code, 0)
+        self.assertIn("CLT001\tИван\t1", output)
+        self.assertIn("2024-01-10 10:00:00\t1\t100.00", output)
+
+
+class TestImportPipeline(DatabaseTestCase):
+    """Тесты параллельного конвейера импорта."""
+
+    def write(self, name, text):
+        """Создает входной файл во временном каталоге и возвращает путь к нему."""
+        with open(self.path(name), 'w', encoding='utf-8') as f:
+            f.write(text)
+        return self.path(name)
+
+    def test_validation(self):
+        """Тест определения таблицы по имени файла и проверки записей."""
+        self.assertEqual(detect_table('/data/order_items_2024.csv'), 'order_items')
+        self.assertEqual(detect_table('Orders_1.csv'), 'orders')
+        with self.assertRaises(ValueError):
+            detect_table('customers.csv')
+        self.assertEqual(validate_record('products', {'name': "Телефон", 'price': "100.5"}), (None, "Телефон", 100.5))
+        for table, record in (('products', {'name': "Телефон", 'price': "-1"}),
+                              ('clients', {'name': "Иван"}),
+                              ('order_items', {'order_id': "ORD001", 'product_id': "PRD001", 'quantity': "0"})):
+            with self.subTest(table=table), self.assertRaises(ValueError):
+                validate_record(table, record)
+
+    def test_run(self):
+        """Тест: файлы всех таблиц загружаются, ошибочные строки отклоняются со статистикой."""
+        files = [
+            self.write('clients_1.json', json.dumps([dict(zip(('name', 'email', 'phone', 'city', 'address'), row[1:]))
+                                                     for row in (IVAN, ANNA)], ensure_ascii=False)),
+            self.write('products_1.json', '[{"name": "Телефон", "price": 100}, {"name": "Чехол", "price": "abc"}]'),
+            self.write('orders_1.csv', "id,client_id,total_amount,order_date\n"
+                                       "ORD001,CLT001,200,2024-01-10 10:00:00\n"
+                                       "ORD002,CLT002,100,2024-01-11 10:00:00\n"
+                                       "ORD002,CLT002,100,2024-01-11 10:00:00\n"),
+            self.write('order_items_1.csv', "order_id,product_id,quantity\nORD001,PRD001,2\nORD002,PRD001,1\n"),
+        ]
+        stats = ImportPipeline(self.db, workers=2, batch_size=2).run(files)
+
+        self.assertEqual(stats.files, 4)
+        self.assertEqual((stats.parse.rows, stats.parse.rejected), (8, 1))
+        # Повтор ORD002 нарушает первичный ключ и отклоняется при записи
+        self.assertEqual((stats.write.rows, stats.write.rejected), (7, 1))
+        self.assertEqual(len(stats.errors), 2)
+        self.assertEqual([(c.id, c.name) for c in self.db.get_clients()], [("CLT001", "Иван"), ("CLT002", "Анна")])
+        self.assertEqual([(p.id, p.name, p.price) for p in self.db.get_products()], [PHONE])
+        self.assertEqual({order.id: order.items for order in self.db.get_orders()},
+                         {"ORD001": [("PRD001", "Телефон", 100.0, 2)], "ORD002": [("PRD001", "Телефон", 100.0, 1)]})
+
+    def test_unknown_table(self):
+        """Тест: файл с неизвестной таблицей отклоняется до запуска процессов."""
+        with self.assertRaises(ValueError):
+            ImportPipeline(self.db, workers=1).run([(self.write('x.csv', "id\n"), 'suppliers')])
+
+
+class TestBenchmarks(DatabaseTestCase):
+    """Тесты генератора данных и набора замеров."""
+
+    def dump(self, db):
+        """Содержимое всех таблиц базы для сравнения."""
+        conn = db.get_connection()
+        try:
+            # Без служебного rowversion: он зависит от размера пакетов вставки
+            return {table: conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY 1, 2").fetchall()
+                    for table, columns in TABLE_COLUMNS.items()}
+        finally:
+            conn.close()
+
+    def test_generate_is_deterministic(self):
+        """Тест: одинаковое зерно дает одинаковую базу, суммы заказов сходятся с ценами товаров."""
+        first = generate(self.path('first.db'), clients=20, products=5, orders=30, seed=7, batch_size=7)
+        second = generate(self.path('second.db'), clients=20, products=5, orders=30, seed=7)
+        other = generate(self.path('other.db'), clients=20, products=5, orders=30, seed=8)
+        self.assertEqual(self.dump(first), self.dump(second))
+        self.assertNotEqual(self.dump(first), self.dump(other))
+
+        data = self.dump(first)
+        self.assertEqual([len(data[table]) for table in ('clients', 'products', 'orders')], [20, 5, 30])
+        prices = {row[0]: row[2] for row in data['products']}
+        for order_id, _, total, _ in data['orders']:
+            items = [row for row in data['order_items'] if row[0] == order_id]
+            self.assertAlmostEqual(total, sum(prices[product_id] * quantity for _, product_id, quantity in items),
+                                   places=2)
+
+    def test_run_and_compare(self):
+        """Тест: замеры дают медианы, сравнение отмечает замедления и ускорения."""
+        report = run_benchmarks((20, 5, 30), repeat=2, only=r'^db\.(get_clients|add_order)$')
+        self.assertEqual(set(report['results']), {'db.get_clients', 'db.add_order'})
+        for result in report['results'].values():
+            self.assertGreater(result['median'], 0)
+
+        before = {'results': {'a': {'median': 1.0}, 'b': {'median': 1.0}, 'c': {'median': 1.0}, 'd': {'skipped': ''}}}
+        after = {'results': {'a': {'median': 1.5}, 'b': {'median': 0.5}, 'c': {'median': 1.05}, 'd': {'median': 1.0}}}
+        self.assertEqual([(name, status) for name, *_, status in compare(before, after, 0.1)],
+                         [('a', 'медленнее'), ('b', 'быстрее'), ('c', '')])
+
+
+class TestInstrumentation(DatabaseTestCase):
+    """Тесты статистики методов и запросов Database."""
+
+    def test_histogram(self):
+        """Тест перцентилей и сводки гистограммы задержек."""
+        hist = LatencyHistogram()
+        for ms in (0.2, 0.3, 4, 80):
+            hist.record(ms / 1000)
+        summary = hist.as_dict()
+        self.assertEqual(summary['calls'], 4)
+        self.assertAlmostEqual(summary['total_ms'], 84.5)
+        self.assertEqual((summary['p50_ms'], summary['p95_ms'], summary['max_ms']), (0.5, 80.0, 80.0))
+        self.assertEqual(summary['buckets'], {'<=0.25': 1, '<=0.5': 1, '<=5': 1, '<=100': 1})
+        self.assertEqual(strip_literals("SELECT * FROM clients\n WHERE id = 'CLT001' AND n > 10"),
+                         "SELECT * FROM clients WHERE id = ? AND n > ?")
+
+    def test_disabled_by_default(self):
+        """Тест: без инструментирования статистика пуста и обертки не установлены."""
+        self.fill(clients=(IVAN,))
+        self.assertEqual(self.db.stats()['methods'], {})
+        self.assertFalse(hasattr(self.db.get_clients, '__wrapped__'))
+
+    def test_methods_and_statements(self):
+        """Тест: учитываются вызовы методов и запросов, сброс очищает статистику, выключение снимает обертки."""
+        self.db.enable_instrumentation(slow_query_ms=0)
+        self.fill(clients=(IVAN,))
+        self.db.get_clients()
+        self.db.get_clients()
+
+        stats = self.db.stats()
+        self.assertEqual(stats['methods']['get_clients']['calls'], 2)
+        self.assertEqual(stats['methods']['add_client']['calls'], 1)
+        self.assertIn(STATEMENTS['clients.all'], stats['statements'])
+        self.assertIn('COMMIT', stats['statements'])
+        # Порог 0 мс: каждый запрос попадает в журнал медленных с методом и планом
+        slow = [entry for entry in stats['slow_queries'] if entry['sql'] == STATEMENTS['clients.all']]
+        self.assertEqual(slow[0]['method'], 'get_clients')
+        self.assertTrue(slow[0]['plan'])
+
+        self.db.reset_stats()
+        self.assertEqual(self.db.stats()['methods'], {})
+        self.db.disable_instrumentation()
+        self.assertFalse(self.db.stats()['enabled'])
+        self.assertFalse(hasattr(self.db.get_clients, '__wrapped__'))
+        self.assertEqual(len(self.db.get_clients()), 1)
+
+
+    def test_unfinished_cursor_is_recorded(self):
+        """Тест: запрос с недочитанным курсором (fetchone на долгоживущем соединении) учитывается каждый раз."""
+        self.fill(clients=(IVAN,))
+        self.db.enable_instrumentation()
+        conn = self.db.connection()
+        for _ in range(50):
+            self.assertIsNotNone(conn.execute(STATEMENTS['clients.by_id'], ("CLT001",)).fetchone())
+        self.assertEqual(self.db.stats()['statements'][STATEMENTS['clients.by_id']]['calls'], 50)
+        self.assertEqual(len(conn.open_cursors), 0)
+
+
+class TestChangeEvents(DatabaseTestCase):
+    """Тесты уведомлений Database об изменениях."""
+
+    def setUp(self):
+        super().setUp()
+        self.events = []
+        self.db.subscribe(self.events.append)
+
+    def changes(self):
+        """Полученные уведомления в виде ``(table, action, row_id)``."""
+        return [(event.table, event.action, event.row_id) for event in self.events]
+
+    def test_single_row_changes(self):
+        """Тест: каждое изменение записи дает одно уведомление с новым состоянием строки."""
+        self.fill(clients=(IVAN,), products=(PHONE,),
+                  orders=(("ORD001", "CLT001", 100.0, "2024-01-10 10:00:00", [("PRD001", 1)]),))
+        self.db.update_product(Product("PRD001", "Телефон", 120.0))
+        self.db.delete_order("ORD001")
+        self.db.delete_client("CLT001")
+
+        self.assertEqual(self.changes(), [('clients', INSERTED, "CLT001"), ('products', INSERTED, "PRD001"),
+                                          ('orders', INSERTED, "ORD001"), ('products', UPDATED, "PRD001"),
+                                          ('orders', DELETED, "ORD001"), ('clients', DELETED, "CLT001")])
+        self.assertEqual(self.events[3].row.price, 120.0)
+        self.assertEqual(self.events[2].row.items, [("PRD001", 1)])
+        self.assertIsNone(self.events[-1].row)
+
+    def test_failed_write_is_not_reported(self):
+        """Тест: неудачная запись не рассылает уведомлений, отписанный обработчик их не получает."""
+        self.fill(clients=(IVAN,))
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.fill(clients=(IVAN,))
+        self.db.unsubscribe(self.events.append)
+        self.fill(clients=(ANNA,))
+        self.assertEqual(self.changes(), [('clients', INSERTED, "CLT001")])
+
+    def test_imports(self):
+        """Тест: импорт из JSON и CSV сообщает одним RELOADED на таблицу, пустой импорт — ничем."""
+        with open(self.path('products.json'), 'w', encoding='utf-8') as f:
+            f.write('[{"name": "Телефон", "price": 100}, {"name": "Чехол", "price": 10}]')
+        with open(self.path('empty.json'), 'w', encoding='utf-8') as f:
+            f.write('[]')
+        with open(self.path('clients.csv'), 'w', encoding='utf-8') as f:
+            f.write("id,name,email,phone,city,address\n" + ','.join(IVAN) + "\n")
+        self.assertEqual(self.db.import_products_from_json(self.path('products.json')), 2)
+        self.db.import_clients_from_json(self.path('empty.json'))
+        self.db.import_from_csv('clients', self.path('clients.csv'))
+
+        self.assertEqual(self.changes(), [('products', RELOADED, None), ('clients', RELOADED, None)])
+        self.assertEqual([product.name for product in self.db.get_products()], ["Телефон", "Чехол"])
+
+
+class TestApi(DatabaseTestCase):
+    """Тесты HTTP API: коды ответов и ETag."""
+
+    def setUp(self):
+        super().setUp()
+        self.fill(clients=(IVAN,), products=(PHONE,))
+
+    def serve(self, scenario):
+        """Запускает сервер на свободном порту и выполняет сценарий ``scenario(request)``."""
+        async def run():
+            server = ApiServer(self.db, port=0, readers=2)
+            port = await server.start()
+
+            async def request(method, target, body=None, headers=None):
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                head = [f"{method} {target} HTTP/1.1", "Connection: close"]
+                head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+                data = b'' if body is None else json.dumps(body).encode('utf-8')
+                if data and not any(name.lower() == 'content-length' for name in headers or {}):
+                    head.append(f"Content-Length: {len(data)}")
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+                response = await reader.read()
+                writer.close()
+                status_line, _, rest = response.partition(b'\r\n')
+                raw_headers, _, payload = rest.partition(b'\r\n\r\n')
+                response_headers = dict(line.split(': ', 1) for line in raw_headers.decode('latin-1').split('\r\n'))
+                return int(status_line.split()[1]), response_headers, json.loads(payload) if payload else None
+
+            try:
+                await scenario(request)
+            finally:
+                await server.close()
+
+        asyncio.run(run())
+
+    def test_status_codes(self):
+        """Тест: коды ответов для успешных запросов и ошибок клиента."""
+        async def scenario(request):
+            self.assertEqual((await request('GET', '/clients/CLT001'))[:1], (200,))
+            self.assertEqual((await request('GET', '/clients/CLT999'))[0], 404)
+            self.assertEqual((await request('GET', '/unknown'))[0], 404)
+            self.assertEqual((await request('PUT', '/clients'))[0], 405)
+            self.assertEqual((await request('GET', '/clients?limit=x'))[0], 400)
+            self.assertEqual((await request('POST', '/clients', {'name': "Анна"}))[0], 400)
+            status, _, payload = await request('POST', '/clients', dict(zip(TABLE_COLUMNS['clients'], ANNA)))
+            self.assertEqual((status, payload), (201, {'id': "CLT002"}))
+            self.assertEqual((await request('POST', '/clients', dict(zip(TABLE_COLUMNS['clients'], ANNA))))[0], 409)
+            self.assertEqual((await request('DELETE', '/clients/CLT002'))[0], 204)
+            self.assertEqual((await request('POST', '/clients', {}, {'Content-Length': 'abc'}))[0], 400)
+
+        self.serve(scenario)
+
+    def test_concurrent_creates(self):
+        """Тест: одновременные запросы без ID получают разные ID."""
+        async def scenario(request):
+            bodies = [{'name': f"Клиент {i}", 'email': f"c{i}@mail.com", 'phone': "+79160000000", 'city': "Москва",
+                       'address': "-"} for i in range(4)]
+            bodies += [{'name': f"Товар {i}", 'price': 10.0} for i in range(4)]
+            responses = await asyncio.gather(*(request('POST', '/clients' if 'email' in body else '/products', body)
+                                               for body in bodies))
+            self.assertEqual([status for status, _, _ in responses], [201] * 8)
+            self.assertEqual(len({payload['id'] for _, _, payload in responses}), 8)
+            order = {'client_id': "CLT001", 'items': [["PRD001", 1]]}
+            orders = await asyncio.gather(*(request('POST', '/orders', order) for _ in range(4)))
+            self.assertEqual(sorted(payload['id'] for _, _, payload in orders), [f"ORD00{i}" for i in range(1, 5)])
+
+        self.serve(scenario)
+
+    def test_database_errors(self):
+        """Тест: блокировка базы дает 503, прочие ошибки SQLite — 500."""
+        async def scenario(request):
+            locked = sqlite3.OperationalError("database is locked")
+            with mock.patch.object(self.db, 'delete_client', side_effect=locked):
+                self.assertEqual((await request('DELETE', '/clients/CLT001'))[0], 503)
+            with mock.patch.object(self.db, 'delete_client', side_effect=sqlite3.DatabaseError("malformed")):
+                self.assertEqual((await request('DELETE', '/clients/CLT001'))[0], 500)
+
+        self.serve(scenario)
+
+    def test_etag(self):
+        """Тест: ETag меняется только при изменении таблиц, от которых зависит ответ."""
+        async def scenario(request):
+            status, headers, payload = await request('GET', '/clients')
+            self.assertEqual((status, [item['id'] for item in payload['items']]), (200, ["CLT001"]))
+            etag = headers['ETag']
+            status, _, payload = await request('GET', '/clients', headers={'If-None-Match': etag})
+            self.assertEqual((status, payload), (304, None))
+
+            # Изменение другой таблицы не сбрасывает ETag списка клиентов, но меняет аналитику
+            analytics = (await request('GET', '/analytics/top-clients'))[1]['ETag']
+            self.db.add_product(Product("PRD002", "Чехол", 10.0))
+            self.assertEqual((await request('GET', '/clients', headers={'If-None-Match': etag}))[0], 304)
+            self.assertEqual((await request('GET', '/analytics/top-clients',
+                                            headers={'If-None-Match': analytics}))[0], 200)
+
+            self.db.add_client(Client(*ANNA))
+            status, headers, payload = await request('GET', '/clients', headers={'If-None-Match': etag})
+            self.assertEqual((status, [item['id'] for item in payload['items']]), (200, ["CLT001", "CLT002"]))
+            self.assertNotEqual(headers['ETag'], etag)
+
+        self.serve(scenario)
+
+
+class TestColumnar(DatabaseTestCase):
+    """Тесты колоночных снимков."""
+
+    def setUp(self):
+        super().setUp()
+        # Имена идут в обратном порядке ID, поэтому индекс idx_clients_name упорядочен иначе, чем таблица
+        clients = [(f"CLT{i:03d}", f"Клиент {200 - i:03d}", f"c{i}@mail.com", f"+7916{i:07d}", "Москва", "ул. Тестовая")
+                   for i in range(1, 201)]
+        orders = [(f"ORD{i:03d}", f"CLT{i % 7 + 1:03d}", 100.0, f"2024-01-{i % 28 + 1:02d} 10:00:00", [("PRD001", 1)])
+                  for i in range(1, 51)]
+        self.fill(clients=clients, products=(PHONE,), orders=orders)
+
+    def test_round_trip(self):
+        """Тест: снимок в форматах npy и npz совпадает с базой построчно."""
+        expected = [tuple(vars(client).values()) for client in self.db.get_clients()]
+        for fmt in ('npy', 'npz'):
+            with self.subTest(fmt=fmt):
+                directory = self.path(fmt)
+                self.db.export_snapshot(directory, fmt)
+                snapshot = Snapshot(directory)
+                self.assertEqual([tuple(vars(client).values()) for client in snapshot.get_clients()], expected)
+                self.assertEqual(snapshot.get_top_clients(), self.db.get_top_clients())
+                self.assertEqual(snapshot.get_orders_dynamics(), self.db.get_orders_dynamics())
+
+
+class TestExportChanges(DatabaseTestCase):
+    """Тесты выгрузки изменений по токену."""
+
+    def setUp(self):
+        super().setUp()
+        self.fill(clients=(IVAN, ANNA), products=(PHONE, ("PRD002", "Чехол", 10.0)),
+                  orders=(("ORD001", "CLT001", 110.0, "2024-01-10 10:00:00", [("PRD001", 1), ("PRD002", 1)]),))
+        self.replicas = {table_name: {} for table_name in TABLE_COLUMNS}
+        self.tokens = {table_name: self.sync(table_name, None) for table_name in TABLE_COLUMNS}
+
+    def sync(self, table_name, since_token, fmt='json'):
+        """Выгружает изменения таблицы и применяет их к копии; возвращает новый токен."""
+        filename = self.path(f"{table_name}.{fmt}")
+        token = self.db.export_changes(table_name, since_token, filename)
+        if fmt == 'json':
+            with open(filename, encoding='utf-8') as file:
+                rows = json.load(file)
+        else:
+            with open(filename, newline='', encoding='utf-8') as file:
+                rows = list(csv.DictReader(file))
+        replica = self.replicas[table_name]
+        for row in rows:
+            key = tuple(row[column] for column in TABLE_KEYS[table_name])
+            if row['_op'] == 'delete':
+                # Строка могла появиться и удалиться после токена: тогда в выгрузке только удаление
+                replica.pop(key, None)
+            else:
+                replica[key] = tuple(row[column] for column in TABLE_COLUMNS[table_name])
+        self.exported = len(rows)
+        return token
+
+    def live(self, table_name):
+        """Текущее содержимое таблицы в том же виде, что и копия."""
+        conn = self.db.get_connection()
+        self.addCleanup(conn.close)
+        columns = TABLE_COLUMNS[table_name]
+        keys = [columns.index(column) for column in TABLE_KEYS[table_name]]
+        rows = conn.execute(f"SELECT {', '.join(columns)} FROM {table_name}")
+        return {tuple(row[i] for i in keys): tuple(row) for row in rows}
+
+    def test_round_trip(self):
+        """Тест: вставки, изменения и удаления после токена воспроизводят таблицы."""
+        self.db.update_product(Product("PRD001", "Телефон", 120.0))
+        self.db.add_product(Product("PRD003", "Зарядка", 20.0))
+        self.db.delete_product("PRD003")
+        self.db.delete_order("ORD001")
+        self.db.delete_client("CLT002")
+        self.fill(orders=(("ORD002", "CLT001", 140.0, "2024-01-11 10:00:00", [("PRD001", 1), ("PRD003", 1)]),))
+
+        for table_name in TABLE_COLUMNS:
+            with self.subTest(table=table_name):
+                token = self.sync(table_name, self.tokens[table_name])
+                self.assertEqual(self.replicas[table_name], self.live(table_name))
+                self.assertEqual(token, self.db.get_sync_token())
+                # Повторная выгрузка с новым токеном пуста
+                self.sync(table_name, token)
+                self.assertEqual(self.exported, 0)
+
+    def test_only_changes_are_exported(self):
+        """Тест: выгрузка содержит только строки, измененные после токена, в CSV тоже."""
+        self.db.update_product(Product("PRD002", "Чехол", 15.0))
+        self.db.delete_product("PRD001")
+        self.sync('products', self.tokens['products'], 'csv')
+        self.assertEqual(self.exported, 2)
+        self.assertEqual(self.replicas['products'], {("PRD002",): ("PRD002", "Чехол", "15.0")})
+
+
+class TestCustomerAnalytics(DatabaseTestCase):
+    """Тесты RFM, когорт и LTV на небольшом наборе заказов."""
+
+    def setUp(self):
+        super().setUp()
+        self.fill(clients=(IVAN, ANNA, ("CLT003", "Олег", "oleg@mail.com", "+79160000003", "Москва", "ул. Тестовая")),
+                  products=(PHONE,),
+                  orders=(("ORD001", "CLT001", 100.0, "2024-01-10 10:00:00", [("PRD001", 1)]),
+                          ("ORD002", "CLT001", 200.0, "2024-02-15 10:00:00", [("PRD001", 2)]),
+                          ("ORD003", "CLT001", 50.0, "2024-03-05 10:00:00", [("PRD001", 1)]),
+                          ("ORD004", "CLT002", 300.0, "2024-01-20 10:00:00", [("PRD001", 3)]),
+                          ("ORD005", "CLT003", 40.0, "2024-02-01 10:00:00", [("PRD001", 1)]),
+                          ("ORD006", "CLT003", 60.0, "2024-03-10 10:00:00", [("PRD001", 1)])))
+        self.analytics = CustomerAnalytics(self.db)
+
+    def test_rfm(self):
+        """Тест: давность, частота, сумма и оценки по рангам среди клиентов."""
+        expected = [("CLT001", 5, 3, 350.0, 4, 4, 4),
+                    ("CLT003", 0, 2, 100.0, 5, 2, 1),
+                    ("CLT002", 50, 1, 300.0, 2, 1, 2)]
+        self.assertEqual(self.analytics.rfm(), expected)
+        self.assertEqual(self.analytics.rfm(as_of="2024-03-11"), expected)
+
+    def test_cohort_retention(self):
+        """Тест: когорты по месяцу первого заказа, ненаблюдаемые месяцы — nan."""
+        cohorts, sizes, matrix = self.analytics.cohort_retention()
+        self.assertEqual(cohorts, ["2024-01", "2024-02"])
+        self.assertEqual(sizes.tolist(), [2, 1])
+        self.assertEqual(matrix[0].tolist(), [1.0, 0.5, 0.5])
+        self.assertEqual(matrix[1, :2].tolist(), [1.0, 1.0])
+        self.assertTrue(math.isnan(matrix[1, 2]))
+
+    def test_lifetime_value(self):
+        """Тест: выручка, средний чек и срок жизни клиента."""
+        ltv = self.analytics.lifetime_value()
+        self.assertEqual([row[:3] for row in ltv], [("CLT001", 3, 350.0), ("CLT002", 1, 300.0), ("CLT003", 2, 100.0)])
+        self.assertAlmostEqual(ltv[0][3], 350.0 / 3)
+        self.assertEqual(ltv[0][4:], ("2024-01-10", "2024-03-05", 55.0))
+        self.assertEqual(ltv[2][4:], ("2024-02-01", "2024-03-10", 38.0))
+
+    def test_refresh(self):
+        """Тест: новые заказы дополняют свертку, удаление перестраивает ее с тем же результатом."""
+        self.assertEqual(self.analytics.refresh(), 'full')
+        self.assertEqual(self.analytics.refresh(), 'unchanged')
+        self.fill(orders=(("ORD007", "CLT002", 70.0, "2024-03-20 10:00:00", [("PRD001", 1)]),))
+        self.assertEqual(self.analytics.refresh(), 'incremental')
+        self.assertEqual(self.analytics.lifetime_value(), CustomerAnalytics(self.db).lifetime_value())
+        self.db.delete_order("ORD001")
+        self.assertEqual(self.analytics.refresh(), 'full')
+        self.assertEqual(self.analytics.rfm(), CustomerAnalytics(self.db).rfm())
+
+
+class TestMarketBasket(DatabaseTestCase):
+    """Тесты поддержки, достоверности и lift пар товаров."""
+
+    def setUp(self):
+        super().setUp()
+        self.fill(clients=(IVAN,), products=(PHONE, ("PRD002", "Чехол", 10.0), ("PRD003", "Зарядка", 20.0)),
+                  orders=(("ORD001", "CLT001", 110.0, "2024-01-10 10:00:00", [("PRD001", 1), ("PRD002", 1)]),
+                          ("ORD002", "CLT001", 110.0, "2024-01-11 10:00:00", [("PRD001", 1), ("PRD002", 2)]),
+                          ("ORD003", "CLT001", 120.0, "2024-01-12 10:00:00", [("PRD001", 1), ("PRD003", 1)]),
+                          ("ORD004", "CLT001", 20.0, "2024-01-13 10:00:00", [("PRD003", 1)])))
+        self.basket = MarketBasket(self.db)
+
+    def test_pairs(self):
+        """Тест: пары с поддержкой, достоверностями в обе стороны и lift, по убыванию lift."""
+        pairs = self.basket.pairs(min_support=0.25)
+        self.assertEqual([row[:3] for row in pairs], [("PRD001", "PRD002", 2), ("PRD001", "PRD003", 1)])
+        for row, expected in zip(pairs, [(0.5, 2 / 3, 1.0, 4 / 3), (0.25, 1 / 3, 0.5, 2 / 3)]):
+            for value, expected_value in zip(row[3:], expected):
+                self.assertAlmostEqual(value, expected_value)
+
+        self.assertEqual([row[:2] for row in self.basket.pairs(min_support=0.5)], [("PRD001", "PRD002")])
+
+    def test_top_associations(self):
+        """Тест: названия товаров и большая из достоверностей."""
+        (name_a, name_b, count, support, confidence, lift), = self.basket.top_associations(min_support=0.5)
+        self.assertEqual((name_a, name_b, count, support, confidence), ("Телефон", "Чехол", 2, 0.5, 1.0))
+        self.assertAlmostEqual(lift, 4 / 3)
+
+    def test_cache_invalidation(self):
+        """Тест: результат кешируется и пересчитывается после изменения order_items."""
+        pairs = self.basket.pairs(min_support=0.5)
+        self.assertIs(self.basket.pairs(min_support=0.5), pairs)
+        self.fill(orders=(("ORD005", "CLT001", 30.0, "2024-01-14 10:00:00", [("PRD002", 1), ("PRD003", 1)]),))
+        self.assertEqual([row[:3] for row in self.basket.pairs(min_support=0.4)],
+                         [("PRD001", "PRD002", 2)])
+        self.assertNotEqual(self.basket.pairs(min_support=0.5), pairs)
+
+
+class TestFindOrders(DatabaseTestCase):
+    """Тесты для Database.find_orders."""
+
+    def setUp(self):
+        super().setUp()
+        self.fill(clients=(IVAN, ANNA), products=(PHONE, ("PRD002", "Ноутбук", 500.0)), orders=(
+            ("ORD001", "CLT001", 100.0, "2024-01-10 10:00:00", [("PRD001", 1)]),
+            ("ORD002", "CLT001", 600.0, "2024-02-15 12:00:00", [("PRD001", 1), ("PRD002", 1)]),
+            ("ORD003", "CLT002", 1000.0, "2024-02-29 23:59:59", [("PRD002", 2)]),
+        ))
+
+    def ids(self, **filters):
+        return [order.id for order in self.db.find_orders(**filters)]
+
+    def query_plan(self, **filters):
+        sql, params = self.db.build_orders_query(**filters)
+        conn = self.db.get_connection()
+        plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        conn.close()
+        return ' | '.join(plan)
+
+    def test_filters(self):
+        """Тест отбора заказов по каждому фильтру."""
+        self.assertEqual(self.ids(), ["ORD001", "ORD002", "ORD003"])
+        self.assertEqual(self.ids(client_id="CLT001"), ["ORD001", "ORD002"])
+        self.assertEqual(self.ids(date_from="2024-02-01"), ["ORD002", "ORD003"])
+        self.assertEqual(self.ids(min_amount=500, max_amount=600), ["ORD002"])
+        self.assertEqual(self.ids(product_id="PRD002"), ["ORD002", "ORD003"])
+        self.assertEqual(self.ids(client_id="CLT001", product_id="PRD002"), ["ORD002"])
+
+    def test_date_to_includes_whole_day(self):
+        """Тест: дата без времени включает весь день."""
+        self.assertEqual(self.ids(date_to="2024-02-29"), ["ORD001", "ORD002", "ORD003"])
+        self.assertEqual(self.ids(date_to="2024-02-29 12:00:00"), ["ORD001", "ORD002"])
+
+    def test_sort_and_limit(self):
+        """Тест сортировки и ограничения количества."""
+        self.assertEqual(self.ids(sort='total_amount', descending=True, limit=2), ["ORD003", "ORD002"])
+
+    def test_invalid_arguments(self):
+        """Тест ошибок в аргументах."""
+        with self.assertRaises(ValueError):
+            self.db.find_orders(sort='name; DROP TABLE orders')
+        with self.assertRaises(ValueError):
+            self.db.find_orders(date_from="10.01.2024")
+
+    def test_query_plans_use_indexes(self):
+        """Тест: каждый фильтр выполняется по индексу, а не полным просмотром таблицы."""
+        cases = {
+            'idx_orders_client_date': {'client_id': "CLT001"},
+            'idx_orders_date': {'date_from': "2024-01-01", 'date_to': "2024-01-31"},
+            'idx_orders_amount': {'min_amount': 100, 'max_amount': 200},
+            'idx_order_items_product': {'product_id': "PRD001"},
+        }
+        for index, filters in cases.items():
+            with self.subTest(filters=filters):
+                plan = self.query_plan(**filters)
+                self.assertIn(index, plan)
+                self.assertNotRegex(plan, r"SCAN (orders|order_items)(?! USING)")
+
+        self.assertIn('idx_orders_client_date', self.query_plan(client_id="CLT001", date_from="2024-02-01"))
+        # Сортировка по индексированному полю без фильтров не требует отдельной сортировки
+        self.assertNotIn("TEMP B-TREE", self.query_plan(sort='total_amount', limit=10))
+
+
+class TestOrderItemsCache(DatabaseTestCase):
+    """Тесты для OrderItemsCache."""
+
+    def setUp(self):
+        super().setUp()
+        self.fill(clients=(IVAN,), products=(PHONE, ("PRD002", "Ноутбук", 500.0)), orders=(
+            ("ORD001", "CLT001", 100.0, "2024-01-10 10:00:00", [("PRD001", 1)]),
+            ("ORD002", "CLT001", 1100.0, "2024-02-15 12:00:00", [("PRD001", 1), ("PRD002", 2)]),
+        ))
+        self.cache = OrderItemsCache(self.db)
+
+    def test_batch_matches_single_lookup(self):
+        """Тест: пакетная выборка совпадает с get_order_items."""
+        batch = self.db.get_order_items_batch(["ORD001", "ORD002", "ORD404"])
+        self.assertEqual(batch["ORD002"], self.db.get_order_items("ORD002"))
+        self.assertEqual(batch["ORD404"], [])
+
+    def test_prefetch_then_hit(self):
+        """Тест: после prefetch товары берутся из кеша."""
+        self.assertEqual(self.cache.prefetch(["ORD001", "ORD002"]), 2)
+        self.assertEqual(self.cache.prefetch(["ORD001", "ORD002"]), 0)
+        self.assertEqual(len(self.cache.get("ORD002")), 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 0))
+
+    def test_invalidation(self):
+        """Тест: удаление и добавление заказов сбрасывают записи кеша."""
+        self.cache.prefetch(["ORD001", "ORD002", "ORD003"])
+        self.db.delete_order("ORD001")
+        self.assertNotIn("ORD001", self.cache.items)
+        self.db.add_order(Order("ORD003", "CLT001", 500.0, "2024-03-01 09:00:00", [("PRD002", 1)]))
+        self.assertEqual(self.cache.get("ORD003"), [("PRD002", "Ноутбук", 500.0, 1)])
+        self.db.delete_product("PRD002")
+        self.assertEqual(len(self.cache.items), 0)
+
+    def test_eviction(self):
+        """Тест: размер кеша ограничен."""
+        cache = OrderItemsCache(self.db, max_orders=1)
+        cache.prefetch(["ORD001", "ORD002"])
+        self.assertEqual(list(cache.items), ["ORD002"])
+
+
+class TestSuggest(DatabaseTestCase):
+    """Тесты подбора клиентов и товаров по началу ID или названия."""
+
+    def setUp(self):
+        super().setUp()
+        names = ("Иван Петров", "Иван Сидоров", "Анна Иванова", "Мария Иванова")
+        self.fill(clients=[(f"CLT00{i}", name, f"user{i}@mail.com", "+79161234567", "Москва", "ул. Новая")
+                           for i, name in enumerate(names, 1)],
+                  products=(PHONE, ("PRD002", "Телевизор", 500.0)))
+
+    def test_prefix_matches(self):
+        """Тест: подбор по началу имени в любом регистре первой буквы и по ID."""
+        self.assertEqual([c.id for c in self.db.suggest_clients("Иван")], ["CLT001", "CLT002"])
+        self.assertEqual([c.id for c in self.db.suggest_clients("иван с")], ["CLT002"])
+        self.assertEqual([c.id for c in self.db.suggest_clients("clt003")], ["CLT003"])
+        self.assertEqual([p.id for p in self.db.suggest_products("тел")], ["PRD002", "PRD001"])
+
+    def test_limit(self):
+        """Тест: возвращается не больше limit записей."""
+        self.assertEqual(len(self.db.suggest_clients("", 3)), 3)
+        self.assertEqual(len(self.db.suggest_clients("CLT", 2)), 2)
+
+    def test_query_plan_uses_name_index(self):
+        """Тест: запрос, который строит подбор, читает таблицу только по индексам."""
+        conn = self.db.get_connection()
+        self.addCleanup(conn.close)
+        for table_name in ('clients', 'products'):
+            for prefix in ("Ив", "иван с", ""):
+                with self.subTest(table=table_name, prefix=prefix):
+                    sql, params = Database.build_suggest_query(table_name, prefix, 20)
+                    plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+                    self.assertIn(f'idx_{table_name}_name', ' '.join(plan))
+                    self.assertNotIn(f'SCAN {table_name}', plan)
+
+
+class TestStatements(DatabaseTestCase):
+    """Тесты реестра запросов и долгоживущих соединений."""
+
+    def test_table_whitelist(self):
+        """Тест: имена таблиц и столбцов принимаются только из белого списка."""
+        self.assertEqual(table_statement('products', 'all'), STATEMENTS['products.all'])
+        for name in ("clients; DROP TABLE orders", "sqlite_master", "tombstones"):
+            with self.subTest(name=name), self.assertRaises(ValueError):
+                table_statement(name, 'all')
+        with self.assertRaises(ValueError):
+            self.db.export_to_csv("clients; DROP TABLE orders", self.path('out.csv'))
+        with self.assertRaises(ValueError):
+            insert_statement('clients', ('id', 'name) VALUES (1, 2); --'))
+        with self.assertRaises(ValueError):
+            self.db.get_next_id('order_items')
+
+    def test_connection_per_thread(self):
+        """Тест: поток переиспользует свое соединение, close открывает новые."""
+        conn = self.db.connection()
+        self.assertIs(self.db.connection(), conn)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.db.connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+        self.db.close()
+        self.assertIsNot(self.db.connection(), conn)
+
+    def test_dead_thread_connection_is_closed(self):
+        """Тест: соединение завершившегося потока закрывается и удаляется из списка соединений."""
+        conn = self.db.connection()
+        self.fill(clients=(IVAN,))
+        other = []
+        thread = threading.Thread(target=lambda: other.append((self.db.connection(), len(self.db.get_clients()))))
+        thread.start()
+        thread.join()
+        gc.collect()
+        (thread_conn, count), = other
+        self.assertEqual(count, 1)
+        self.assertEqual(self.db._connections, [conn])
+        with self.assertRaises(sqlite3.ProgrammingError):
+            thread_conn.execute("SELECT 1")
+
+    def test_failed_write_is_rolled_back(self):
+        """Тест: ошибка записи не оставляет открытую транзакцию на общем соединении."""
+        self.fill(clients=(IVAN,))
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.fill(clients=(IVAN,))
+        self.assertFalse(self.db.connection().in_transaction)
+        self.fill(products=(PHONE,))
+        # Изменения видны другим соединениям, то есть зафиксированы
+        conn = self.db.get_connection()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM products").fetchone()[0], 1)
+        conn.close()
+
+
+class TestStreaming(DatabaseTestCase):
+    """Тесты потокового чтения iter_clients, iter_products и iter_orders."""
+
+    def make_db(self, orders):
+        """Создает отдельную базу с ``orders`` заказами по два товара в каждом."""
+        db = Database(self.path(f'orders{orders}.db'))
+        self.addCleanup(db.close)
+        fill(db, clients=(IVAN,), products=(PHONE, ("PRD002", "Чехол", 10.0)))
+        conn = db.get_connection()
+        with conn:
+            conn.executemany("INSERT INTO orders (id, client_id, total_amount, order_date) VALUES (?, ?, ?, ?)",
+                             [(f"ORD{i:05d}", "CLT001", 110.0, "2024-01-10 10:00:00") for i in range(orders)])
+            conn.executemany("INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, ?, ?)",
+                             [(f"ORD{i:05d}", product_id, 1) for i in range(orders)
+                              for product_id in ("PRD001", "PRD002")])
+        conn.close()
+        return db
+
+    def assertSameRecords(self, streamed, materialized):
+        """Проверяет, что записи совпадают по значениям полей и порядку."""
+        self.assertEqual([vars(record) for record in streamed], [vars(record) for record in materialized])
+
+    def test_same_as_get(self):
+        """Тест: потоковое чтение возвращает те же записи, что и get_*, при любом размере порции."""
+        db = self.make_db(25)
+        self.assertSameRecords(db.iter_orders(chunk_size=7), db.get_orders())
+        self.assertSameRecords(db.iter_orders("ORD0001", chunk_size=3), db.get_orders("ORD0001"))
+        self.assertSameRecords(db.iter_clients(chunk_size=1), db.get_clients())
+        self.assertSameRecords(db.iter_products("Чех"), db.get_products("Чех"))
+        with self.assertRaises(ValueError):
+            db.iter_orders(chunk_size=0)
+
+    def test_pages(self):
+        """Тест: страницы limit/offset вместе дают полный список."""
+        db = self.make_db(25)
+        for get in (db.get_orders, db.get_clients, db.get_products):
+            pages = get(limit=10) + get(limit=10, offset=10) + get(offset=20)
+            self.assertSameRecords(pages, get())
+        self.assertSameRecords(db.get_orders("ORD0001", limit=3), db.get_orders("ORD0001")[:3])
+
+    def read_pages(self, db, table_name, search_term="", limit=10):
+        """Читает таблицу страницами ``get_page``; возвращает записи и размеры страниц."""
+        records, sizes, after = [], [], 0
+        while after is not None:
+            page, after = db.get_page(table_name, search_term, after, limit)
+            records += page
+            sizes.append(len(page))
+        return records, sizes
+
+    def test_keyset_pages(self):
+        """Тест: страницы get_page идут подряд без пропусков и не больше limit строк каждая."""
+        db = self.make_db(25)
+        for table_name, get in (('orders', db.get_orders), ('clients', db.get_clients),
+                                ('products', db.get_products)):
+            records, sizes = self.read_pages(db, table_name)
+            self.assertSameRecords(records, get())
+            self.assertLessEqual(max(sizes), 10)
+        records, sizes = self.read_pages(db, 'orders', "ORD0001", limit=3)
+        self.assertSameRecords(records, db.get_orders("ORD0001"))
+        self.assertEqual(sizes, [3, 3, 3, 1])
+        with self.assertRaises(ValueError):
+            db.get_page('order_items')
+
+    def test_keyset_page_after_delete(self):
+        """Тест: удаление строки прочитанной страницы не сдвигает следующую страницу."""
+        db = self.make_db(20)
+        first, after = db.get_page('orders', limit=10)
+        db.delete_order(first[0].id)
+        second, _ = db.get_page('orders', after=after, limit=10)
+        self.assertEqual([order.id for order in first + second], [f"ORD{i:05d}" for i in range(20)])
+
+    def peak_memory(self, consume):
+        """Возвращает пиковый объем памяти, выделенной при вызове ``consume``."""
+        tracemalloc.start()
+        try:
+            consume()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_constant_memory(self):
+        """Тест: пиковая память потокового чтения не растет с размером таблицы."""
+        small, large = self.make_db(1000), self.make_db(8000)
+        small_peak = self.peak_memory(lambda: sum(1 for _ in small.iter_orders(chunk_size=100)))
+        large_peak = self.peak_memory(lambda: sum(1 for _ in large.iter_orders(chunk_size=100)))
+        materialized_peak = self.peak_memory(large.get_orders)
+        # В 8 раз больше заказов — пиковая память почти та же
+        self.assertLess(large_peak, small_peak * 1.5)
+        self.assertLess(large_peak * 10, materialized_peak)
+
+
+class TestPriceHistory(DatabaseTestCase):
+    """Тесты истории цен и цен на дату заказа."""
+
+    def setUp(self):
+        super().setUp()
+        self.fill(clients=(IVAN,), products=(PHONE, ("PRD002", "Чехол", 10.0)))
+
+    def set_history(self, product_id, *intervals):
+        """Заменяет историю цен товара интервалами ``(price, valid_from, valid_to)``."""
+        conn = self.db.connection()
+        with conn:
+            conn.execute("DELETE FROM product_prices WHERE product_id = ?", (product_id,))
+            conn.executemany("INSERT INTO product_prices (product_id, price, valid_from, valid_to) "
+                             "VALUES (?, ?, ?, ?)", [(product_id, *interval) for interval in intervals])
+
+    def test_update_closes_interval(self):
+        """Тест: смена цены закрывает интервал прежней цены, смена названия — нет."""
+        self.db.update_product(Product("PRD001", "Телефон", 120.0))
+        self.db.update_product(Product("PRD001", "Телефон X", 120.0))
+        history = self.db.get_price_history("PRD001")
+        self.assertEqual([price for price, _, _ in history], [100.0, 120.0])
+        self.assertEqual(history[0][2], history[1][1])
+        self.assertIsNone(history[1][2])
+        with self.assertRaises(ValueError):
+            self.db.update_product(Product("PRD404", "Нет", 1.0))
+
+        self.db.delete_product("PRD001")
+        self.assertIsNotNone(self.db.get_price_history("PRD001")[-1][2])
+
+    def test_prices_at(self):
+        """Тест: цена на дату берется из интервала, в который дата попадает."""
+        self.set_history("PRD001", (100.0, "2024-01-01 00:00:00", "2024-03-01 00:00:00"),
+                         (150.0, "2024-03-01 00:00:00", None))
+        prices = self.db.get_prices_at([("PRD001", "2023-12-31 23:59:59"), ("PRD001", "2024-02-15 10:00:00"),
+                                        ("PRD001", "2024-03-01 00:00:00"), ("PRD001", "2024-03-02"),
+                                        ("PRD404", "2024-03-02")])
+        self.assertEqual(prices, [100.0, 100.0, 150.0, 150.0, None])
+
+    def test_order_items_use_price_at_order_date(self):
+        """Тест: товары заказа во всех методах чтения получают цену на дату заказа."""
+        self.set_history("PRD001", (100.0, "2024-01-01 00:00:00", "2024-03-01 00:00:00"),
+                         (150.0, "2024-03-01 00:00:00", None))
+        self.db.add_order(Order("ORD001", "CLT001", 110.0, "2024-02-01 12:00:00", [("PRD001", 1), ("PRD002", 1)]))
+        self.db.add_order(Order("ORD002", "CLT001", 150.0, "2024-04-01 12:00:00", [("PRD001", 1)]))
+
+        expected = {"ORD001": [("PRD001", "Телефон", 100.0, 1), ("PRD002", "Чехол", 10.0, 1)],
+                    "ORD002": [("PRD001", "Телефон", 150.0, 1)]}
+        self.assertEqual(self.db.get_order_items_batch(["ORD001", "ORD002"]), expected)
+        self.assertEqual(self.db.get_order_items("ORD001"), expected["ORD001"])
+        self.assertEqual({order.id: order.items for order in self.db.get_orders()}, expected)
+        self.assertEqual({order.id: order.items for order in self.db.iter_orders(chunk_size=1)}, expected)
+
+    def test_lookup_uses_index(self):
+        """Тест: история цен читается по индексу."""
+        conn = self.db.get_connection()
+        sql = "EXPLAIN QUERY PLAN " + STATEMENTS['product_prices.for_products']
+        plan = ' '.join(row[3] for row in conn.execute(sql, ('["PRD001"]',)))
+        conn.close()
+        self.assertIn('idx_product_prices_product', plan)
+
+
+class TestAuditLog(DatabaseTestCase):
+    """Тесты журнала изменений и восстановления базы по нему."""
+
+    def setUp(self):
+        super().setUp()
+        self.log_dir = self.path('audit')
+        self.fill(clients=(IVAN,), products=(PHONE, ("PRD002", "Чехол", 10.5)))
+
+    def open_log(self, **kwargs):
+        """Открывает журнал в ``log_dir`` и подписывает его на изменения базы."""
+        log = AuditLog(self.db, self.log_dir, actor='tester', **kwargs).open().attach()
+        self.addCleanup(log.close)
+        return log
+
+    def replayed(self):
+        """Проигрывает журнал в новую базу и открывает ее."""
+        path = self.path(f'replayed{len(os.listdir(self.directory))}.db')
+        replay(self.log_dir, path)
+        db = Database(path)
+        self.addCleanup(db.close)
+        return db
+
+    def assertSameData(self, db):
+        """Проверяет, что клиенты, товары и заказы совпадают с рабочей базой."""
+        for method in ('get_clients', 'get_products', 'get_orders'):
+            self.assertEqual([vars(row) for row in getattr(db, method)()],
+                             [vars(row) for row in getattr(self.db, method)()], method)
+
+    def test_frame_round_trip(self):
+        """Тест: кадр с изменениями всех видов кодируется и разбирается без потерь."""
+        changes = [(5, 'clients', 'upsert', ("CLT001", "Иван", "", "+7", "Москва", None)),
+                   (7, 'products', 'upsert', ("PRD001", "Телефон", -0.5)),
+                   (300, 'order_items', 'upsert', ("ORD001", "PRD001", -3)),
+                   (301, 'order_items', 'delete', ("ORD001", "PRD001")),
+                   (301, None, RESET, ()),
+                   (302, 'clients', 'delete', ("CLT001",))]
+        frame = encode_frame(1.5, 'tester', changes)
+        self.assertEqual(decode_frame(frame[8:]), (1.5, 'tester', changes))
+
+    def test_replay_restores_database(self):
+        """Тест: проигрывание журнала восстанавливает вставки, удаления и повторные вставки."""
+        log = self.open_log(batch_size=2)
+        for i in range(5):
+            self.db.add_order(Order(f"ORD{i:03d}", "CLT001", 110.5, "2024-01-10 10:00:00",
+                                    [("PRD001", 1), ("PRD002", i + 1)]))
+        self.db.delete_order("ORD001")
+        self.db.delete_product("PRD002")
+        self.db.add_product(Product("PRD002", "Чехол кожаный", 20.0))
+        log.close()
+
+        frames = list(iter_frames(self.log_dir))
+        self.assertGreater(len(frames), 2)
+        # Строки, добавленные до открытия журнала, записаны без автора
+        self.assertEqual({change[1] for change in frames[0][2]}, {'clients', 'products'})
+        self.assertEqual([actor for _, actor, _ in frames], [UNKNOWN_ACTOR] + ['tester'] * (len(frames) - 1))
+        self.assertSameData(self.replayed())
+
+    def test_bulk_import_is_logged(self):
+        """Тест: импорт из CSV, о котором база сообщает одним RELOADED, попадает в журнал."""
+        log = self.open_log()
+        log.flush()
+        filename = self.path('clients.csv')
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write("id,name,email,phone,city,address\nCLT002,Анна,anna@mail.com,+79167654321,Казань,ул. Новая\n")
+        self.db.import_from_csv('clients', filename)
+        log.flush()
+        self.assertSameData(self.replayed())
+
+    def test_reopen_catches_up_and_drops_torn_frame(self):
+        """Тест: при открытии недописанный кадр обрезается, а изменения без журнала догоняются."""
+        log = self.open_log()
+        log.close()
+        # Изменение без журнала и недописанный кадр в конце сегмента, как после сбоя
+        self.db.add_order(Order("ORD001", "CLT001", 100.0, "2024-01-10 10:00:00", [("PRD001", 1)]))
+        path = segments(self.log_dir)[-1]
+        size = os.path.getsize(path)
+        with open(path, 'ab') as f:
+            f.write(b'\x40\x00\x00\x00\x01\x02')
+
+        log = self.open_log()
+        self.assertEqual(os.path.getsize(path), size)
+        self.assertEqual(log.flush(), 2)
+        self.assertEqual(list(iter_frames(self.log_dir))[-1][1], UNKNOWN_ACTOR)
+        self.assertSameData(self.replayed())
+
+    def test_actor_only_for_notified_changes(self):
+        """Тест: изменения, о которых журнал не получил уведомлений, пишутся без автора."""
+        log = self.open_log()
+        log.flush()
+        self.add_clients(100, 2)
+        self.assertEqual(log.flush(), 2)
+        # Другой процесс: изменения без уведомлений этого журнала
+        other = Database(self.db.db_name)
+        self.addCleanup(other.close)
+        other.add_client(Client("CLT200", "Клиент", "c200@mail.com", "+79160000000", "Казань", ""))
+        other.delete_client("CLT100")
+        self.assertEqual(log.flush(), 2)
+
+        actors = [(actor, len(changes)) for _, actor, changes in iter_frames(self.log_dir)]
+        self.assertEqual(actors[-2:], [('tester', 2), (UNKNOWN_ACTOR, 2)])
+        self.assertSameData(self.replayed())
+
+    def test_segment_rotation(self):
+        """Тест: журнал переходит к новому сегменту после segment_bytes."""
+        log = self.open_log(batch_size=1, segment_bytes=200)
+        for i in range(10):
+            self.db.add_client(Client(f"CLT1{i:02d}", "Клиент", f"c{i}@mail.com", "+79160000000", "Казань", ""))
+        log.close()
+        self.assertGreater(len(segments(self.log_dir)), 2)
+        self.assertSameData(self.replayed())
+
+    def test_background_flush(self):
+        """Тест: фоновый поток открывает журнал и записывает изменения."""
+        log = AuditLog(self.db, self.log_dir, flush_interval=0.01).attach()
+        self.addCleanup(log.close)
+        log.start()
+        self.fill(clients=(ANNA,))
+        for _ in range(500):
+            if log.version == self.db._fetch("SELECT version FROM sync_clock")[0][0]:
+                break
+            threading.Event().wait(0.01)
+        log.stop()
+        self.assertIsNone(log.last_error)
+        self.assertSameData(self.replayed())
+
+    def add_clients(self, start, count):
+        """Добавляет ``count`` клиентов с номерами начиная со ``start``."""
+        for i in range(start, start + count):
+            self.db.add_client(Client(f"CLT{i:03d}", "Клиент", f"c{i}@mail.com", "+79160000000", "Казань", ""))
+
+    def test_replay_after_restore(self):
+        """Тест: после восстановления базы из копии журнал пишет снимок и продолжает запись."""
+        for start, more, batch_size in ((100, 4, 1), (200, 6, 1000)):
+            with self.subTest(more=more):
+                self.log_dir = self.path(f'audit{start}')
+                log = self.open_log(batch_size=batch_size)
+                self.add_clients(start, 5)
+                log.flush()
+                backup_path = self.path(f'backup{start}.db')
+                self.db.backup(backup_path)
+                self.add_clients(start + 5, 5)
+                log.flush()
+                self.db.restore(backup_path)
+                # Новых изменений меньше или больше, чем потеряно при восстановлении
+                self.add_clients(start + 10, more)
+                log.close()
+
+                self.assertIn(RESET, [change[2] for _, _, changes in iter_frames(self.log_dir) for change in changes])
+                self.assertSameData(self.replayed())
+
+    def test_replay_refuses_existing_file(self):
+        """Тест: проигрывание не затирает существующую базу."""
+        self.open_log().flush()
+        with self.assertRaises(ValueError):
+            replay(self.log_dir, self.db.db_name)
+
+
+class TestDeduplicator(DatabaseTestCase):
+    """Тесты поиска и объединения дублей клиентов."""
+
+    def setUp(self):
+        super().setUp()
+        clients = [
+            ("CLT001", "Иван Петров", "ivan.petrov@gmail.com", "+79161234567", "Москва", "ул. Тестовая"),
+            # Тот же клиент: другой формат телефона, порядок слов и регистр email
+            ("CLT002", "петров иван", "Ivan.Petrov+shop@Gmail.com", "8 (916) 123-45-67", "Москва", "ул. Тестовая"),
+            # Опечатка в имени, другой email, тот же телефон
+            ("CLT003", "Иван Петорв", "petrov@mail.ru", "9161234567", "Москва", "ул. Тестовая"),
+            # Однофамилица с тем же городом, но другими контактами
+            ("CLT004", "Анна Петрова", "anna@mail.ru", "+79990000000", "Москва", "ул. Новая"),
+            ("CLT005", "Олег Смирнов", "oleg@mail.ru", "+79161112233", "Казань", "ул. Лесная"),
+        ]
+        self.fill(clients=clients, products=(PHONE,),
+                  orders=[(f"ORD{i:03d}", client_id, 100.0, f"2024-01-{i:02d} 10:00:00", [("PRD001", 1)])
+                          for i, client_id in enumerate(("CLT001", "CLT002", "CLT002", "CLT003", "CLT005"), 1)])
+
+    def test_normalization(self):
+        """Тест: телефоны, email и имена приводятся к виду для сравнения."""
+        self.assertEqual(normalize_phone("8 (916) 123-45-67"), "79161234567")
+        self.assertEqual(normalize_phone("9161234567"), "79161234567")
+        self.assertEqual(normalize_email(" Ivan.Petrov+shop@Gmail.com "), "ivanpetrov@gmail.com")
+        self.assertEqual(normalize_email("Ivan.Petrov@Mail.ru"), "ivan.petrov@mail.ru")
+        self.assertEqual(normalize_name("Петров,  Иван"), normalize_name("иван петров"))
+
+    def test_propose_merges(self):
+        """Тест: дубли одного клиента объединяются в одно предложение вокруг клиента с большим числом заказов."""
+        deduplicator = Deduplicator(self.db)
+        proposals = deduplicator.propose_merges()
+        self.assertEqual(len(proposals), 1)
+        # Остается клиент с большим числом заказов
+        self.assertEqual(proposals[0].survivor, "CLT002")
+        self.assertEqual(sorted(proposals[0].duplicates), ["CLT001", "CLT003"])
+        self.assertGreater(deduplicator.stats['candidates'], 0)
+
+    def test_apply(self):
+        """Тест: объединение удаляет дубли и переносит их заказы."""
+        deduplicator = Deduplicator(self.db)
+        result = deduplicator.apply(deduplicator.propose_merges())
+        self.assertEqual(result, {'merged': 2, 'orders': 2})
+        self.assertEqual([client.id for client in self.db.get_clients()], ["CLT002", "CLT004", "CLT005"])
+        self.assertEqual(self.db.get_top_clients(1)[0][0], "CLT002")
+        self.assertEqual(self.db.get_top_clients(1)[0][2], 4)
+
+    def test_apply_is_atomic(self):
+        """Тест: при ошибке объединения база не меняется."""
+        deduplicator = Deduplicator(self.db)
+        proposals = deduplicator.propose_merges()
+        self.db.delete_client(proposals[0].survivor)
+        with self.assertRaises(ValueError):
+            deduplicator.apply(proposals)
+        self.assertEqual(len(self.db.get_clients()), 4)
+        self.assertEqual(len(self.db.find_orders(client_id="CLT001")), 1)
+
+
+class TestBackup(DatabaseTestCase):
+    """Тесты резервного копирования и восстановления."""
+
+    def setUp(self):
+        super().setUp()
+        self.fill(clients=[(f"CLT{i:03d}", f"Клиент {i}", f"user{i}@mail.com", "+79161234567", "Москва",
+                            "ул. Новая " * 20) for i in range(1, 201)],
+                  products=(PHONE,), orders=(("ORD001", "CLT001", 100.0, "2024-01-10 10:00:00", [("PRD001", 1)]),))
+
+    def test_backup_and_restore(self):
+        """Тест: после восстановления из копии (сжатой и обычной) данные совпадают с исходными."""
+        for name in ('copy.db', 'copy.db.gz'):
+            with self.subTest(name=name):
+                steps = []
+                result = self.db.backup(self.path(name), progress=steps.append)
+                self.assertEqual(result['compressed'], name.endswith('.gz'))
+                self.assertEqual(steps[-1], result['pages'])
+                self.assertEqual(result['bytes'], os.path.getsize(self.db.db_name))
+
+                self.db.delete_order("ORD001")
+                events = []
+                self.db.subscribe(events.append)
+                self.db.restore(self.path(name))
+                self.db.unsubscribe(events.append)
+
+                self.assertEqual([o.id for o in self.db.get_orders()], ["ORD001"])
+                self.assertEqual(len(self.db.get_clients()), 200)
+                self.assertEqual({(e.table, e.action) for e in events},
+                                 {(table, RELOADED) for table in ('clients', 'products', 'orders', 'order_items')})
+                self.assertEqual(check_integrity(self.db.db_name), [])
+
+    def test_restore_rejects_corrupt_copy(self):
+        """Тест: поврежденная копия не затирает рабочую базу."""
+        self.db.backup(self.path('copy.db'))
+        with open(self.path('copy.db'), 'r+b') as file:
+            file.seek(4096)
+            file.write(b'\xff' * 4096)
+        with self.assertRaises(sqlite3.DatabaseError):
+            self.db.restore(self.path('copy.db'))
+        self.assertEqual(len(self.db.get_clients()), 200)
+        with self.assertRaises(FileNotFoundError):
+            self.db.restore(self.path('missing.db'))
+
+    def test_scheduler_retention(self):
+        """Тест: в каталоге остаются только последние keep копий."""
+        scheduler = BackupScheduler(self.db, self.path('backups'), keep=2)
+        paths = [scheduler.backup_now()['path'] for _ in range(3)]
+        self.assertEqual(scheduler.list_backups(), paths[1:])
+        self.assertTrue(all(path.endswith('.db.gz') for path in paths))
+        # Временные файлы копирования не остаются в каталоге
+        self.assertEqual(len(os.listdir(self.path('backups'))), 2)
+
+
+class TestShardedDatabase(DatabaseTestCase):
+    """Тесты ShardedDatabase."""
+
+    def setUp(self):
+        super().setUp()
+        self.stores = ShardedDatabase({store: self.path(f'{store}.db') for store in ('north', 'south')})
+        self.addCleanup(self.stores.close)
+        orders = {
+            'north': [("CLT001", 100.0, "2024-01-10"), ("CLT001", 200.0, "2024-01-11"), ("CLT002", 50.0, "2024-01-11")],
+            'south': [("CLT001", 300.0, "2024-01-11"), ("CLT002", 10.0, "2024-01-12"),
+                      ("CLT002", 20.0, "2024-01-12"), ("CLT002", 30.0, "2024-01-13")],
+        }
+        for store, rows in orders.items():
+            self.stores.add_client(store, Client("CLT001", f"Иван ({store})", "ivan@mail.com", "+79161234567",
+                                                 "Москва", "ул. Тестовая"))
+            self.stores.add_client(store, Client("CLT002", f"Анна ({store})", "anna@mail.com", "+79167654321",
+                                                 "Казань", "ул. Новая"))
+            self.stores.add_product(store, Product("PRD001", "Телефон", 10.0))
+            for i, (client_id, amount, date) in enumerate(rows, 1):
+                self.stores.add_order(store, Order(f"ORD{i:03d}", client_id, amount, date, [("PRD001", 1)]))
+
+    def test_writes_are_routed(self):
+        """Тест: запись попадает только в базу своего магазина."""
+        self.assertEqual(len(self.stores['north'].get_orders()), 3)
+        self.assertEqual(len(self.stores['south'].get_orders()), 4)
+        self.assertEqual({store for store, _ in self.stores.get_clients()}, {'north', 'south'})
+        with self.assertRaises(KeyError):
+            self.stores.add_client('west', Client("CLT001", "Иван", "ivan@mail.com", "+79161234567", "Москва", "-"))
+
+    def test_global_reports(self):
+        """Тест: общие отчеты совпадают с расчетом по объединенным данным."""
+        self.assertEqual(self.stores.get_top_clients(2), [('south', 'CLT002', 'Анна (south)', 3),
+                                                          ('north', 'CLT001', 'Иван (north)', 2)])
+        self.assertEqual(self.stores.get_orders_dynamics(), [("2024-01-10", 1, 100.0), ("2024-01-11", 3, 550.0),
+                                                             ("2024-01-12", 2, 30.0), ("2024-01-13", 1, 30.0)])
+        orders = self.stores.find_orders(sort='total_amount', descending=True, limit=3)
+        self.assertEqual([(store, order.total_amount) for store, order in orders],
+                         [('south', 300.0), ('north', 200.0), ('north', 100.0)])
+
+    def test_attached_views(self):
+        """Тест: представления all_* объединяют таблицы магазинов через ATTACH."""
+        conn = self.stores.connect_attached()
+        try:
+            rows = conn.execute("SELECT store, COUNT(*), SUM(total_amount) FROM all_orders GROUP BY store "
+                                "ORDER BY store").fetchall()
+        finally:
+            conn.close()
+        self.assertEqual(rows, [('north', 3, 350.0), ('south', 4, 360.0)])
+
+    def test_close(self):
+        """Тест: close закрывает базы, открытые по пути, и не трогает переданные Database."""
+        with ShardedDatabase({'north': self.path('north.db'), 'main': self.db}) as stores:
+            self.assertEqual(len(stores.get_clients()), 2)
+            owned, given = stores['north'].connection(), self.db.connection()
+        self.assertEqual(stores['north']._connections, [])
+        with self.assertRaises(sqlite3.ProgrammingError):
+            owned.execute("SELECT 1")
+        self.assertEqual(given.execute("SELECT COUNT(*) FROM clients").fetchone(), (0,))
+
+
+class TestLayoutCache(DatabaseTestCase):
+    """Тесты кеша раскладки графа связей клиентов."""
+
+    def setUp(self):
+        super().setUp()
+        self.clients = [(f"CLT{i:03d}", f"Клиент {i}", ("Москва", "Казань", "Тула")[i % 3]) for i in range(1, 13)]
+
+    def test_cached_and_deterministic(self):
+        """Тест: раскладка того же графа берется из кеша и не зависит от порядка узлов."""
+        cache = LayoutCache(self.db)
+        first = cache.layout('clients', client_graph(self.clients), group='city')
+        self.assertEqual(cache.last_mode, 'full')
+
+        # Граф тот же, но узлы добавлены в другом порядке — раскладка из кеша
+        second = cache.layout('clients', client_graph(self.clients[::-1]), group='city')
+        self.assertEqual(cache.last_mode, 'cached')
+        self.assertEqual(second, first)
+
+        # Раскладка хранится в базе, а зерно фиксировано
+        other = Database(self.path('other.db'))
+        self.addCleanup(other.close)
+        self.assertEqual(LayoutCache(other).layout('clients', client_graph(self.clients), group='city'), first)
+
+    def test_incremental_keeps_picture(self):
+        """Тест: новый узел добавляется к сохраненной раскладке почти без сдвига остальных."""
+        cache = LayoutCache(self.db)
+        before = cache.layout('clients', client_graph(self.clients), group='city')
+        after = cache.layout('clients', client_graph(self.clients + [("CLT099", "Новый", "Москва")]), group='city')
+        self.assertEqual(cache.last_mode, 'incremental')
+        self.assertIn("CLT099", after)
+        shift = max(abs(after[node][axis] - before[node][axis]) for node in before for axis in (0, 1))
+        self.assertLess(shift, 0.5)
+
+    def test_grouped_layout_above_threshold(self):
+        """Тест: большой граф раскладывается по группам."""
+        cache = LayoutCache(self.db, spring_max_nodes=5)
+        positions = cache.layout('clients', client_graph(self.clients), group='city')
+        self.assertEqual(cache.last_mode, 'full')
+        self.assertEqual(set(positions), {client[0] for client in self.clients})
+        self.assertEqual(cache.load('clients')[1], 'grouped')
+
+
+class TestReportRenderer(DatabaseTestCase):
+    """Тесты пакетной отрисовки отчета в файлы."""
+
+    def setUp(self):
+        super().setUp()
+        # Оба клиента из одного города: граф связей не пуст
+        self.fill(clients=(IVAN, ANNA[:4] + ("Москва", "ул. Новая")), products=(PHONE,), orders=(
+            ("ORD001", "CLT001", 100.0, "2024-01-10 10:00:00", [("PRD001", 1)]),
+            ("ORD002", "CLT002", 200.0, "2024-02-11 10:00:00", [("PRD001", 2)]),
+        ))
+        self.out = self.path('report')
+
+    def test_render_and_cache(self):
+        """Тест: графики рисуются в PNG и перерисовываются только при изменении их данных."""
+        renderer = ReportRenderer(self.db, self.out, workers=1)
+        result = renderer.render()
+        self.assertEqual(result['rendered'], 5)
+        for name, path in result['files'].items():
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(4), b'\x89PNG', name)
+
+        # Данные не изменились — файлы не перерисовываются
+        self.assertEqual(renderer.render()['cached'], 5)
+
+        # Новый заказ меняет графики заказов, но не граф связей клиентов
+        self.db.add_order(Order("ORD003", "CLT001", 50.0, "2024-03-12 10:00:00", [("PRD001", 1)]))
+        result = renderer.render()
+        self.assertGreater(result['rendered'], 0)
+        self.assertGreater(result['cached'], 0)
+
+    def test_render_in_process_pool(self):
+        """Тест: отрисовка в пуле процессов в формате SVG."""
+        result = ReportRenderer(self.db, self.out, fmt='svg', workers=2).render(['top_clients', 'orders_dynamics'])
+        self.assertEqual(result['rendered'], 2)
+        self.assertTrue(all(path.endswith('.svg') and os.path.exists(path) for path in result['files'].values()))
+
+    def test_multipage_pdf(self):
+        """Тест: формат PDF собирает все графики в один многостраничный файл."""
+        renderer = ReportRenderer(self.db, self.out, fmt='pdf')
+        result = renderer.render()
+        self.assertEqual(set(result['files'].values()), {os.path.join(self.out, 'report.pdf')})
+        with open(os.path.join(self.out, 'report.pdf'), 'rb') as f:
+            self.assertEqual(f.read(4), b'%PDF')
+        self.assertEqual(renderer.render()['rendered'], 0)
+
+    def test_unknown_format(self):
+        """Тест: неизвестный формат отклоняется."""
+        with self.assertRaises(ValueError):
+            ReportRenderer(self.db, self.out, fmt='bmp')
+
+
+if __name__ == '__main__':
+    unittest.main()
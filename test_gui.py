@@ -0,0 +1,381 @@
+import json
+import os
+import tempfile
+import time
+import tkinter as tk
+import unittest
+
+import profiling
+from db import DELETED, INSERTED, UPDATED, ChangeEvent, Database
+from models import Client, Product, Order
+
+# Запас по времени запуска: окно показывается после загрузки одной страницы,
+# поэтому время не должно зависеть от размера базы
+STARTUP_BUDGET = 2.0
+
+
+def has_display():
+    """Проверяет, можно ли создать окно Tk."""
+    try:
+        tk.Tk().destroy()
+    except tk.TclError:
+        return False
+    return True
+
+
+@unittest.skipUnless(has_display(), "нет дисплея")
+class TestApplicationStartup(unittest.TestCase):
+    """Тесты ленивого построения вкладок и постраничной загрузки окна приложения."""
+
+    def setUp(self):
+        from gui import PAGE_SIZE
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.db')
+        self.count = PAGE_SIZE * 2 + 10
+        db = Database(self.path)
+        for i in range(self.count):
+            db.add_client(Client(f"CLT{i:05d}", f"Клиент {i}", f"c{i}@mail.com", "+79161234567", "Москва", ""))
+            db.add_product(Product(f"PRD{i:05d}", f"Товар {i}", 10.0 + i))
+            db.add_order(Order(f"ORD{i:05d}", f"CLT{i:05d}", 10.0 + i, "2024-01-10 10:00:00",
+                               [(f"PRD{i:05d}", 1)]))
+        # Каталоги резервных копий и журнала приложения заданы относительно текущего каталога;
+        # окно закрывается раньше, чем выполняются эти cleanup (они выполняются в обратном порядке)
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory.name)
+
+    def open_app(self):
+        """Открывает окно приложения на тестовой базе; окно закрывается после теста."""
+        from gui import Application
+        app = Application(self.path)
+        self.addCleanup(app.on_close)
+        return app
+
+    def settle(self, app):
+        """Обрабатывает события, пока не построены все вкладки и не догружены таблицы."""
+        while app.fill_jobs or len(app.built_tabs) < len(app.tabs):
+            app.update()
+
+    def test_only_visible_tab_loaded_before_first_paint(self):
+        """Тест: до первой отрисовки построена только видимая вкладка с первой страницей строк."""
+        from gui import PAGE_SIZE
+        app = self.open_app()
+
+        self.assertEqual(app.built_tabs, {str(app.client_frame)})
+        self.assertEqual(len(app.client_rows), PAGE_SIZE)
+        self.assertIn('clients', app.fill_jobs)
+
+    def test_prewarm_builds_all_tabs(self):
+        """Тест: после запуска в фоне строятся все вкладки и догружаются все строки."""
+        app = self.open_app()
+        self.settle(app)
+
+        self.assertIsNotNone(app.startup_seconds)
+        self.assertEqual(app.built_tabs, set(app.tabs))
+        self.assertEqual(len(app.client_rows), self.count)
+        self.assertEqual(len(app.product_rows), self.count)
+        self.assertEqual(len(app.order_rows), self.count)
+
+    def test_selecting_tab_builds_it(self):
+        """Тест: выбор вкладки строит ее сразу."""
+        app = self.open_app()
+        app.notebook.select(app.order_frame)
+        app.update()
+
+        self.assertTrue(app.is_built(app.order_frame))
+        self.assertTrue(app.order_rows)
+
+    def test_change_during_fill(self):
+        """Тест: изменения во время догрузки таблицы не теряются и не дублируются."""
+        app = self.open_app()
+        app.db.add_client(Client("CLT99999", "Новый", "new@mail.com", "+79160000000", "Казань", ""))
+        app.db.delete_client("CLT00000")
+        self.settle(app)
+
+        self.assertIn("CLT99999", app.client_rows)
+        self.assertNotIn("CLT00000", app.client_rows)
+        self.assertEqual(len(app.client_rows), self.count)
+
+    def test_startup_time(self):
+        """Тест: окно показывается быстрее STARTUP_BUDGET независимо от размера базы."""
+        app = self.open_app()
+        while app.startup_seconds is None:
+            app.update()
+
+        self.assertLess(app.startup_seconds, STARTUP_BUDGET)
+
+
+class FakeTree:
+    """Таблица без Tk: строки хранятся в словаре."""
+
+    def __init__(self):
+        self.items = {}
+
+    def insert(self, parent, index, values):
+        iid = f"I{len(self.items) + 1:03d}"
+        self.items[iid] = values
+        return iid
+
+    def item(self, iid, values):
+        self.items[iid] = values
+
+    def delete(self, iid):
+        del self.items[iid]
+
+
+class TestRowChanges(unittest.TestCase):
+    """Тесты точечного применения изменений к таблицам и выпадающим спискам окна."""
+
+    def test_apply_row_change(self):
+        """Тест: вставка, обновление, скрытие по поиску и удаление строки таблицы."""
+        from gui import Application
+        tree, rows = FakeTree(), {}
+        Application.apply_row_change(tree, rows, ChangeEvent('clients', INSERTED, "CLT001"), ("CLT001", "Иван"), True)
+        Application.apply_row_change(tree, rows, ChangeEvent('clients', INSERTED, "CLT002"), ("CLT002", "Анна"), False)
+        self.assertEqual(list(rows), ["CLT001"])
+
+        Application.apply_row_change(tree, rows, ChangeEvent('clients', UPDATED, "CLT001"), ("CLT001", "Иван П."), True)
+        self.assertEqual(list(tree.items.values()), [("CLT001", "Иван П.")])
+        # Строка больше не подходит под поиск
+        Application.apply_row_change(tree, rows, ChangeEvent('clients', UPDATED, "CLT001"), ("CLT001", "Петр"), False)
+        self.assertEqual((rows, tree.items), ({}, {}))
+
+        Application.apply_row_change(tree, rows, ChangeEvent('clients', UPDATED, "CLT002"), ("CLT002", "Анна"), True)
+        Application.apply_row_change(tree, rows, ChangeEvent('clients', DELETED, "CLT002"), None, True)
+        self.assertEqual((rows, tree.items), ({}, {}))
+
+    def test_apply_combo_change(self):
+        """Тест: загруженные варианты списка обновляются и удаляются, новые не добавляются."""
+        from gui import Application
+        combo = {'values': ("CLT001 - Иван", "CLT002 - Анна")}
+        Application.apply_combo_change(combo, ChangeEvent('clients', UPDATED, "CLT002"), "CLT002 - Анна П.")
+        Application.apply_combo_change(combo, ChangeEvent('clients', DELETED, "CLT001"), None)
+        Application.apply_combo_change(combo, ChangeEvent('clients', INSERTED, "CLT003"), "CLT003 - Олег")
+        self.assertEqual(list(combo['values']), ["CLT002 - Анна П."])
+
+    def test_matches_search(self):
+        """Тест: поиск по подстроке без учета регистра в любом столбце."""
+        from gui import Application
+        self.assertTrue(Application.matches_search("мос", ("CLT001", "Иван", "Москва")))
+        self.assertTrue(Application.matches_search("", ("CLT001",)))
+        self.assertFalse(Application.matches_search("казань", ("CLT001", "Иван", "Москва")))
+
+
+class CountingDatabase:
+    """Обертка базы, которая запоминает размер каждой прочитанной страницы."""
+
+    def __init__(self, db):
+        self.db = db
+        self.fetched = []
+
+    def get_page(self, *args):
+        records, last = self.db.get_page(*args)
+        self.fetched.append(len(records))
+        return records, last
+
+
+class IdleWindow:
+    """Окно без Tk: отложенные вызовы after_idle выполняются по одному через run_idle."""
+
+    def __init__(self):
+        self.fill_jobs = {}
+        self.idle = []
+
+    def after_idle(self, func, *args):
+        self.idle.append((func, args))
+        return len(self.idle)
+
+    def fill_page(self, *args):
+        from gui import Application
+        Application.fill_page(self, *args)
+
+    def run_idle(self):
+        func, args = self.idle.pop(0)
+        func(*args)
+
+
+class TestPagedFill(unittest.TestCase):
+    """Тесты постраничной догрузки таблиц."""
+
+    def setUp(self):
+        from gui import PAGE_SIZE
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.db = Database(os.path.join(self.directory.name, 'test.db'))
+        self.addCleanup(self.db.close)
+        self.count = PAGE_SIZE * 3 + 10
+        for i in range(self.count):
+            self.db.add_client(Client(f"CLT{i:05d}", f"Клиент {i}", f"c{i}@mail.com", "+79161234567", "Москва", ""))
+
+    def test_idle_step_fetches_one_page(self):
+        """Тест: ни один шаг догрузки не читает из базы больше PAGE_SIZE строк."""
+        from gui import PAGE_SIZE, Application
+        db, window, tree, rows = CountingDatabase(self.db), IdleWindow(), FakeTree(), {}
+
+        window.fill_page('clients', tree, rows, Application.paged(db, 'clients', ""),
+                         lambda client: (client.id, client.name))
+        self.assertEqual(db.fetched, [PAGE_SIZE])
+        while window.idle:
+            fetched = len(db.fetched)
+            window.run_idle()
+            self.assertEqual(len(db.fetched) - fetched, 1)
+            self.assertLessEqual(db.fetched[-1], PAGE_SIZE)
+
+        self.assertEqual(len(rows), self.count)
+        self.assertEqual(list(rows), [f"CLT{i:05d}" for i in range(self.count)])
+        self.assertEqual(window.fill_jobs, {})
+
+
+class FakeInterpreter:
+    """Интерпретатор Tcl без дисплея: команды только занимают время."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.commands = []
+
+    def call(self, *args):
+        self.commands.append(args[0])
+        time.sleep(self.seconds.get(args[0], 0))
+
+
+class ProfiledWindow:
+    """Окно без Tk с обработчиками, как у Application."""
+
+    def __init__(self, path, seconds=None):
+        self.tk = FakeInterpreter(seconds or {})
+        self.db = Database(path)
+        self.idle = []
+
+    def after(self, ms, func, *args):
+        return 'after#1'
+
+    def after_idle(self, func, *args):
+        self.idle.append((func, args))
+
+    def after_cancel(self, job):
+        pass
+
+    def run_idle(self):
+        """Выполняет отложенные ``after_idle`` вызовы, как цикл событий Tk."""
+        while self.idle:
+            func, args = self.idle.pop(0)
+            func(*args)
+
+    def load_clients(self):
+        clients = self.db.get_clients()
+        self.tk.call('insert')
+        return clients
+
+    def load_data(self):
+        self.load_clients()
+        self.load_clients()
+
+    def show_message(self):
+        self.tk.call('tk_messageBox')
+
+    def add_client(self):
+        time.sleep(0.03)
+
+    def clear_fields(self):
+        pass
+
+
+class TestProfiler(unittest.TestCase):
+    """Тесты профилирования обработчиков окна."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, 'test.db')
+        self.out = os.path.join(self.directory, 'profiles')
+
+    def install(self, mode='time', stall_ms=profiling.STALL_MS, seconds=None):
+        """Создает окно без Tk и устанавливает на него профилировщик."""
+        window = ProfiledWindow(self.path, seconds)
+        profiler = profiling.Profiler(mode, self.out, stall_ms).install(
+            window, ('load_', 'show_', 'add_'))
+        self.addCleanup(profiler.close)
+        return window, profiler
+
+    def test_from_environment(self):
+        """Тест: режим и порог задержки читаются из MANAGER_PROFILE."""
+        self.assertIsNone(profiling.from_environment({}))
+        self.assertIsNone(profiling.from_environment({profiling.ENV_VAR: '0'}))
+        profiler = profiling.from_environment({profiling.ENV_VAR: 'Stacks:50'})
+        self.assertEqual(profiler.mode, 'stacks')
+        self.assertEqual(profiler.stall_ms, 50)
+        self.assertEqual(profiling.from_environment({profiling.ENV_VAR: '1'}).stall_ms, profiling.STALL_MS)
+        with self.assertRaises(ValueError):
+            profiling.from_environment({profiling.ENV_VAR: 'perf'})
+
+    def test_phases(self):
+        """Тест: время обработчика делится на фазы db, python, tk и render."""
+        window, profiler = self.install(seconds={'insert': 0.02})
+        window.load_clients()
+        window.run_idle()
+
+        stats = profiler.stats()['handlers']
+        self.assertEqual(set(stats), {'load_clients'})
+        self.assertEqual(stats['load_clients']['calls'], 1)
+        phases = stats['load_clients']['phases_ms']
+        self.assertGreaterEqual(phases['tk'], 20)
+        self.assertGreater(phases['db'], 0)
+        self.assertAlmostEqual(sum(phases.values()), stats['load_clients']['total_ms'], delta=0.1)
+        # Методы не из списка не оборачиваются
+        self.assertFalse(hasattr(window.clear_fields, '__wrapped__'))
+
+    def test_nested_handlers_counted_once(self):
+        """Тест: обработчик, вызванный из другого обработчика, не учитывается отдельно."""
+        window, profiler = self.install()
+        window.load_data()
+        window.run_idle()
+
+        stats = profiler.stats()['handlers']
+        self.assertEqual(set(stats), {'load_data'})
+        self.assertEqual(stats['load_data']['calls'], 1)
+
+    def test_dialog_wait_is_not_a_stall(self):
+        """Тест: ожидание ответа в модальном диалоге не считается задержкой."""
+        window, profiler = self.install(stall_ms=10, seconds={'tk_messageBox': 0.05})
+        window.show_message()
+        window.run_idle()
+
+        self.assertLess(profiler.stats()['handlers']['show_message']['total_ms'], 10)
+        self.assertFalse(profiler.stalls)
+
+    def test_stall_dumps_cprofile(self):
+        """Тест: в режиме cprofile задержка сохраняет профиль обработчика."""
+        window, profiler = self.install('cprofile', stall_ms=10)
+        window.add_client()
+        window.run_idle()
+
+        stall, = profiler.stats()['stalls']
+        self.assertEqual(stall['handler'], 'add_client')
+        self.assertGreaterEqual(stall['ms'], 30)
+        self.assertTrue(stall['profile'].endswith('.prof'))
+        self.assertTrue(os.path.exists(stall['profile']))
+
+        summary = profiler.close()
+        with open(summary, encoding='utf-8') as f:
+            self.assertIn('add_client', json.load(f)['handlers'])
+        self.assertTrue(os.path.exists(os.path.join(self.out, 'add_client.prof')))
+
+    def test_stacks_folded(self):
+        """Тест: в режиме stacks стеки задержки пишутся в формате folded."""
+        window, profiler = self.install('stacks', stall_ms=10)
+        window.add_client()
+        window.run_idle()
+        profiler.close()
+
+        with open(os.path.join(self.out, profiling.STACKS_NAME), encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith('add_client;test_gui.py:ProfiledWindow.add_client'))
+            self.assertGreater(int(count), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
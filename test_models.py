@@ -1,9 +1,11 @@
 import unittest
 import sys
 import os
+import time
 
 
-from models import Client, Product, Order, RootClass
+from models import (Client, Product, Order, RootClass, EMPTY_FIELD, INVALID_EMAIL, INVALID_PHONE, INVALID_PRICE,
+                    NEGATIVE_AMOUNT, check_client, check_order, check_product)
 
 
 class TestRootClass(unittest.TestCase):
@@ -84,5 +86,61 @@ class TestOrder(unittest.TestCase):
             order.validate_all()
 
 
+class TestCheckFunctions(unittest.TestCase):
+    """Тесты проверок полей без исключений."""
+
+    def test_check_client(self):
+        """Тест кодов ошибок клиента."""
+        self.assertEqual(check_client("Иван", "test@mail.com", "+79161234567", "Москва", "ул. Тестовая"), ())
+        self.assertEqual(check_client("Иван", "invalid-email", "123", "Москва", "ул. Тестовая"),
+                         (INVALID_EMAIL, INVALID_PHONE))
+        self.assertEqual(check_client(" ", None, "79161234567", "Москва", "ул. Тестовая"), (EMPTY_FIELD, INVALID_EMAIL))
+
+    def test_check_product_and_order(self):
+        """Тест кодов ошибок товара и заказа."""
+        self.assertEqual(check_product("Телефон", 100.0), ())
+        self.assertEqual(check_product("", 0.0), (EMPTY_FIELD, INVALID_PRICE))
+        self.assertEqual(check_order("CLT001", "2024-01-15", 0.0), ())
+        self.assertEqual(check_order("CLT001", None, -1.0), (EMPTY_FIELD, NEGATIVE_AMOUNT))
+
+    def test_validate_all_message(self):
+        """Тест текста ошибки validate_all: первая ошибка по порядку проверки."""
+        client = Client("CLT001", "", "invalid-email", "79161234567", "Москва", "ул. Тестовая")
+        with self.assertRaisesRegex(ValueError, "Все поля должны быть заполнены"):
+            client.validate_all()
+
+
+class TestValidationThroughput(unittest.TestCase):
+    """Микробенчмарк: количество проверок в секунду для каждой модели."""
+
+    # Нижняя граница с большим запасом: на обычной машине проверок в десятки раз больше
+    MIN_PER_SECOND = 50000
+    ROUNDS = 20000
+
+    def measure(self, validate):
+        started = time.perf_counter()
+        for _ in range(self.ROUNDS):
+            validate()
+        return self.ROUNDS / (time.perf_counter() - started)
+
+    def test_throughput(self):
+        """Тест скорости validate_all и check_* для клиента, товара и заказа."""
+        client = Client("CLT001", "Иван", "test@mail.com", "+79161234567", "Москва", "ул. Тестовая")
+        product = Product("PRD001", "Телефон", 25000.0)
+        order = Order("ORD001", "CLT001", 1000.0, "2024-01-15")
+        cases = {
+            'Client.validate_all': client.validate_all,
+            'Product.validate_all': product.validate_all,
+            'Order.validate_all': order.validate_all,
+            'check_client': lambda: check_client("Иван", "test@mail.com", "+79161234567", "Москва", "ул. Тестовая"),
+            'check_product': lambda: check_product("Телефон", 25000.0),
+            'check_order': lambda: check_order("CLT001", "2024-01-15", 1000.0),
+        }
+        for name, validate in cases.items():
+            with self.subTest(name):
+                rate = self.measure(validate)
+                self.assertGreater(rate, self.MIN_PER_SECOND, f"{name}: {rate:.0f} проверок/с")
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file